@@ -0,0 +1,394 @@
+# =============================================================================
+# 뼈나이 파이프라인 벤치마크 스크립트
+# =============================================================================
+#
+# 용도: 전처리 / 앙상블 추론 / LMS 계산 변경 시 같은 조건에서 성능을 비교하기 위해
+#       이미지 해상도 × 배치 크기 × 스레드 수별 단계별/전체 지연시간, 처리량, 최대 RSS를
+#       측정하여 리포트(JSON) 저장 및 기준(baseline) 리포트와 비교
+#
+# 사용법:
+#   1. 아래 IMAGE_PATHS(또는 IMAGE_DIR), RESIZE_LONG_SIDES, SYNTHETIC_SIZES 등 설정
+#   2. python Benchmark_Pipeline.py                  # 측정 + 기준 리포트와 비교
+#      python Benchmark_Pipeline.py --save-baseline  # 측정 결과를 기준 리포트로 저장
+#   3. 결과가 콘솔에 출력되고 Data/benchmark_report.json으로 저장됨
+#   4. 기준 대비 p50 지연시간이 REGRESSION_TOLERANCE 이상 느려진 경우 ⚠️로 표시
+#      (FAIL_ON_REGRESSION=True면 종료 코드 1)
+#
+# * 서버와 같은 설정으로 측정하려면 같은 OSTEOAGE_* 환경변수로 실행 (리포트에 함께 기록)
+# * 배치 크기 1은 predict_bone_age(/predict 경로), 2 이상은 predict_bone_age_batch로 측정
+# * 단계별 시간은 stage_latency/fold_latency 히스토그램 증가분 기준 (OSTEOAGE_METRICS=1 필요)
+# * 최대 RSS는 프로세스 누적 최댓값이므로 케이스별 값은 "해당 케이스까지의 최대"
+# * 기준 리포트는 같은 장비/환경에서 만든 것과만 비교할 것
+# =============================================================================
+
+import os
+import sys
+import json
+import time
+import platform
+import datetime
+import cv2
+import numpy as np
+import torch
+
+from CPU_BoneAge_PAH_Compact import (
+    PROJECT_ROOT, DATA_DIR, METRICS_ENABLED,
+    load_resources, warmup_resources, get_load_status, load_image_color,
+    predict_bone_age, predict_bone_age_batch, recalculate_pah, recalculate_pah_batch,
+    stage_latency, fold_latency,
+)
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 샘플 이미지 (IMAGE_DIR가 있으면 폴더 내 이미지 전체 추가)
+IMAGE_PATHS = [os.path.join(PROJECT_ROOT, "Total raw image", "Test Image.jpg")]
+IMAGE_DIR = None
+
+# 샘플 이미지를 추가로 축소할 긴 변 해상도 (px, 원본보다 크면 생략)
+RESIZE_LONG_SIDES = [2048, 1024]
+
+# 합성 X-ray (가로, 세로) px, 빈 리스트면 생략
+SYNTHETIC_SIZES = [(2500, 3000), (1200, 1500)]
+
+# 배치 크기 / 스레드 수 (0 = 현재 기본값)
+BATCH_SIZES = [1, 2, 4, 8]
+THREAD_COUNTS = [0, 1, 4]
+
+# 측정 반복 횟수 (워밍업 1회 제외)
+REPEATS = 3
+
+# LMS/PAH 계산 벤치마크 크기 (0이면 생략)
+PAH_BATCH_ROWS = 10000
+PAH_SCALAR_CALLS = 200
+
+# JPEG 인코딩 품질 (합성/축소 이미지)
+JPEG_QUALITY = 95
+
+# 기준 대비 허용 지연시간 증가율 (0.10 = 10%)
+REGRESSION_TOLERANCE = 0.10
+FAIL_ON_REGRESSION = False
+
+# 리포트 / 기준 리포트 경로
+REPORT_PATH = os.path.join(DATA_DIR, "benchmark_report.json")
+BASELINE_PATH = os.path.join(DATA_DIR, "benchmark_baseline.json")
+
+# =============================================================================
+# 입력 이미지 준비
+# =============================================================================
+
+def encode_jpeg(img, quality=JPEG_QUALITY) -> bytes:
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("JPEG 인코딩 실패")
+    return buf.tobytes()
+
+
+def synthetic_radiograph(width, height, seed=0):
+    """
+    손 X-ray 형태의 합성 그레이스케일 이미지 (어두운 배경 + 손바닥/손가락 연부조직 + 뼈 음영 + 노이즈)
+
+    실제 판독용이 아닌 해상도별 처리 시간 측정용 (같은 seed면 항상 같은 이미지)
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width), 18, np.uint8)
+    u = min(width, height) / 100.0
+    cx, palm_y = width // 2, int(height * 0.62)
+
+    # 연부조직 (손바닥 + 손가락 5개)
+    cv2.ellipse(img, (cx, palm_y), (int(28 * u), int(24 * u)), 0, 0, 360, 95, -1)
+    fingers = [(-30, 0.30, -35), (-14, 0.18, -10), (0, 0.14, 0), (14, 0.18, 8), (27, 0.26, 18)]
+    bones = np.zeros_like(img)
+    for dx, top, angle in fingers:
+        x0, y0 = cx + int(dx * u * 0.9), palm_y - int(12 * u)
+        x1, y1 = cx + int(dx * u * 1.1 + angle * u * 0.3), int(height * top)
+        cv2.line(img, (x0, y0), (x1, y1), 95, int(8 * u))
+        cv2.line(bones, (x0, y0), (x1, y1), 255, int(3 * u))
+    cv2.rectangle(img, (cx - int(16 * u), palm_y), (cx + int(16 * u), height), 95, -1)  # 손목/전완
+    cv2.rectangle(bones, (cx - int(10 * u), palm_y + int(20 * u)), (cx + int(10 * u), height), 255, -1)
+
+    # 뼈 음영 (연부조직보다 밝게) + 흐림 + 노이즈
+    img = np.where(bones > 0, np.uint8(185), img)
+    img = cv2.GaussianBlur(img, (0, 0), max(1.0, u * 0.8))
+    noise = rng.normal(0, 6, img.shape)
+    return np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def build_sources(image_paths) -> list:
+    """
+    벤치마크 입력 목록 (샘플 원본 / 샘플 축소본 / 합성)
+
+    Returns:
+        list[dict]: {"name", "kind", "width", "height", "bytes"} (bytes: 인코딩된 이미지)
+    """
+    sources = []
+    for path in image_paths:
+        name = os.path.splitext(os.path.basename(path))[0].replace(" ", "_")
+        with open(path, "rb") as f:
+            data = f.read()
+        img = load_image_color(data)
+        h, w = img.shape[:2]
+        sources.append({"name": f"{name}@{w}x{h}", "kind": "sample", "width": w, "height": h, "bytes": data})
+        for long_side in RESIZE_LONG_SIDES:
+            if long_side >= max(h, w):
+                continue
+            scale = long_side / max(h, w)
+            small = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+            sh, sw = small.shape[:2]
+            sources.append({"name": f"{name}@{sw}x{sh}", "kind": "sample_resized", "width": sw, "height": sh,
+                            "bytes": encode_jpeg(small)})
+    for i, (w, h) in enumerate(SYNTHETIC_SIZES):
+        sources.append({"name": f"synthetic@{w}x{h}", "kind": "synthetic", "width": w, "height": h,
+                        "bytes": encode_jpeg(synthetic_radiograph(w, h, seed=i))})
+    return sources
+
+# =============================================================================
+# 측정
+# =============================================================================
+
+def peak_rss_mb():
+    """프로세스 최대 RSS (MB, 측정 불가 시 None)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # macOS: bytes, Linux: KB
+    except ImportError:
+        pass
+    try:
+        import psutil  # Windows
+        return psutil.Process().memory_info().peak_wset / 1e6
+    except (ImportError, AttributeError):
+        return None
+
+
+def latency_snapshot():
+    """단계별/fold별 히스토그램 누적값 {이름: (count, sum_seconds)}"""
+    snap = {}
+    for (stage,), v in stage_latency.summary().items():
+        snap[stage] = (v["count"], v["sum_seconds"])
+    for (fold, engine), v in fold_latency.summary().items():
+        snap[f"fold{fold}_{engine}"] = (v["count"], v["sum_seconds"])
+    return snap
+
+
+def stage_breakdown(before, after, n_calls):
+    """두 스냅샷 차이를 호출 1회당 {이름: {count, ms}}로 변환"""
+    out = {}
+    for name, (count, total) in sorted(after.items()):
+        c0, t0 = before.get(name, (0, 0.0))
+        if count > c0:
+            out[name] = {"count": (count - c0) / n_calls, "ms": (total - t0) * 1000.0 / n_calls}
+    return out
+
+
+def make_items(source, batch_size):
+    return [{"image_path": source["bytes"], "sex": i % 2, "height": 150.0, "age_months": 140,
+             "father_height": 172.0, "mother_height": 160.0} for i in range(batch_size)]
+
+
+def run_once(items, batch_size):
+    if batch_size == 1:
+        return [predict_bone_age(**items[0], verbose=False)]
+    return predict_bone_age_batch(items, batch_size=batch_size)
+
+
+def bench_case(source, batch_size, repeats=REPEATS) -> dict:
+    """입력 1개 × 배치 크기 1개 측정 (현재 스레드 설정)"""
+    items = make_items(source, batch_size)
+    run_once(items, batch_size)  # 워밍업 (해당 배치 크기 첫 실행 제외)
+    before = latency_snapshot()
+    lat = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        run_once(items, batch_size)
+        lat.append((time.perf_counter() - t) * 1000.0)
+    lat = np.array(lat)
+    return {
+        "latency_ms_p50": float(np.percentile(lat, 50)),
+        "latency_ms_p90": float(np.percentile(lat, 90)),
+        "latency_ms_mean": float(lat.mean()),
+        "latency_ms_per_image": float(lat.mean() / batch_size),
+        "throughput_img_s": float(batch_size * 1000.0 / lat.mean()),
+        "stages": stage_breakdown(before, latency_snapshot(), repeats),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_pah(n_rows=PAH_BATCH_ROWS, n_scalar=PAH_SCALAR_CALLS, seed=0) -> dict:
+    """LMS/PAH 계산 (이미지 추론 없음): 벡터화 일괄 재계산과 단건 재계산 시간"""
+    rng = np.random.default_rng(seed)
+    out = {}
+    if n_rows:
+        cols = {
+            "bone_age_years": rng.integers(6, 16, n_rows), "bone_age_months": rng.integers(0, 12, n_rows),
+            "sex": rng.integers(0, 2, n_rows), "height": rng.uniform(110, 175, n_rows),
+            "age_months": rng.integers(72, 192, n_rows),
+            "father_height": rng.uniform(160, 185, n_rows), "mother_height": rng.uniform(150, 170, n_rows),
+        }
+        recalculate_pah_batch(**{k: v[:10] for k, v in cols.items()})
+        t = time.perf_counter()
+        recalculate_pah_batch(**cols)
+        ms = (time.perf_counter() - t) * 1000.0
+        out["batch"] = {"rows": n_rows, "ms": ms, "us_per_row": ms * 1000.0 / n_rows}
+    if n_scalar:
+        recalculate_pah(12, 3, 1, 150.0, 140, 172.0, 160.0)
+        t = time.perf_counter()
+        for i in range(n_scalar):
+            recalculate_pah(8 + i % 8, i % 12, i % 2, 130.0 + i % 40, 100 + i % 80, 172.0, 160.0)
+        ms = (time.perf_counter() - t) * 1000.0
+        out["scalar"] = {"calls": n_scalar, "ms": ms, "us_per_call": ms * 1000.0 / n_scalar}
+    return out
+
+
+def environment_info() -> dict:
+    """비교 조건 기록 (장비/라이브러리/OSTEOAGE_* 설정)"""
+    status = get_load_status()
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "default_threads": torch.get_num_threads(),
+        "backend": status.get("backend"),
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("OSTEOAGE_")},
+    }
+
+
+def run_benchmark(image_paths: list) -> dict:
+    """
+    전체 벤치마크 실행
+
+    Returns:
+        dict: 환경 정보, 모델 로드 시간, 케이스별 결과, PAH 계산 결과
+    """
+    print("=" * 70)
+    print("⏱️  뼈나이 파이프라인 벤치마크")
+    print("=" * 70)
+    if not METRICS_ENABLED:
+        print("[WARN] OSTEOAGE_METRICS=0 이므로 단계별 시간은 기록되지 않음")
+
+    print(f"\n📂 [STEP 1] 모델 로드 및 워밍업")
+    t = time.perf_counter()
+    load_resources()
+    warmup_resources(BATCH_SIZES)
+    load_sec = time.perf_counter() - t
+    rss_loaded = peak_rss_mb()
+    print(f"   ✓ {load_sec:.1f}s, 최대 RSS {rss_loaded or 0:.0f}MB")
+
+    sources = build_sources(image_paths)
+    default_threads = torch.get_num_threads()
+    default_cv_threads = cv2.getNumThreads()
+    print(f"\n📊 [STEP 2] 입력 {len(sources)}개 × 배치 {BATCH_SIZES} × 스레드 {THREAD_COUNTS} (반복 {REPEATS})")
+    cases = []
+    try:
+        for threads in THREAD_COUNTS:
+            n = threads or default_threads
+            torch.set_num_threads(n)
+            cv2.setNumThreads(n if threads else default_cv_threads)
+            for source in sources:
+                for bs in BATCH_SIZES:
+                    res = bench_case(source, bs)
+                    cases.append({"key": f"{source['name']}|bs{bs}|t{threads}", "source": source["name"],
+                                  "kind": source["kind"], "width": source["width"], "height": source["height"],
+                                  "batch_size": bs, "threads": n, **res})
+                    print(f"   [t={n:>2}] {source['name']:<28} bs={bs}: p50 {res['latency_ms_p50']:7.0f}ms, "
+                          f"{res['throughput_img_s']:5.2f} img/s, RSS {res['peak_rss_mb'] or 0:.0f}MB")
+    finally:
+        torch.set_num_threads(default_threads)
+        cv2.setNumThreads(default_cv_threads)
+
+    print(f"\n🧮 [STEP 3] LMS/PAH 계산")
+    pah = bench_pah()
+    for name, r in pah.items():
+        print(f"   {name}: {r['ms']:.1f}ms ({', '.join(f'{k} {v:.1f}' for k, v in r.items() if k.startswith('us_'))}us)")
+
+    return {
+        "created_at": datetime.datetime.now().isoformat(),
+        "environment": environment_info(),
+        "settings": {"batch_sizes": BATCH_SIZES, "thread_counts": THREAD_COUNTS, "repeats": REPEATS,
+                     "jpeg_quality": JPEG_QUALITY},
+        "load_seconds": load_sec,
+        "load_status": get_load_status(),
+        "peak_rss_mb_after_load": rss_loaded,
+        "peak_rss_mb": peak_rss_mb(),
+        "cases": cases,
+        "pah": pah,
+    }
+
+
+def compare_with_baseline(report: dict, baseline: dict, tol=REGRESSION_TOLERANCE) -> dict:
+    """
+    기준 리포트와 같은 케이스(key)끼리 p50 지연시간 / 단계별 시간 비교
+
+    Returns:
+        dict: {"baseline_created_at", "cases": [...], "regressions": [key, ...]}
+    """
+    base = {c["key"]: c for c in baseline.get("cases", [])}
+    rows, regressions = [], []
+    for c in report["cases"]:
+        b = base.get(c["key"])
+        if b is None:
+            continue
+        ratio = c["latency_ms_p50"] / b["latency_ms_p50"]
+        stages = {name: {"baseline_ms": b["stages"][name]["ms"], "ms": s["ms"]}
+                  for name, s in c["stages"].items() if name in b.get("stages", {})}
+        rows.append({"key": c["key"], "baseline_ms_p50": b["latency_ms_p50"], "ms_p50": c["latency_ms_p50"],
+                     "ratio": ratio, "stages": stages})
+        if ratio > 1.0 + tol:
+            regressions.append(c["key"])
+    for name, r in report["pah"].items():
+        b = baseline.get("pah", {}).get(name)
+        if b:
+            rows.append({"key": f"pah_{name}", "baseline_ms_p50": b["ms"], "ms_p50": r["ms"], "ratio": r["ms"] / b["ms"]})
+            if r["ms"] / b["ms"] > 1.0 + tol:
+                regressions.append(f"pah_{name}")
+    return {"baseline_created_at": baseline.get("created_at"), "tolerance": tol,
+            "cases": rows, "regressions": regressions}
+
+
+def print_comparison(cmp: dict):
+    print("\n" + "=" * 70)
+    print(f"📈 기준 리포트 비교 ({cmp['baseline_created_at']}, 허용 +{cmp['tolerance']:.0%})")
+    print("=" * 70)
+    for r in cmp["cases"]:
+        mark = "⚠️" if r["key"] in cmp["regressions"] else "  "
+        print(f"{mark} {r['key']:<40} {r['baseline_ms_p50']:8.1f} → {r['ms_p50']:8.1f}ms (x{r['ratio']:.2f})")
+        slow = [f"{n} {s['baseline_ms']:.0f}→{s['ms']:.0f}" for n, s in r.get("stages", {}).items()
+                if s["baseline_ms"] > 0 and s["ms"] > s["baseline_ms"] * (1.0 + cmp["tolerance"]) and s["ms"] >= 1.0]
+        if slow:
+            print(f"      느려진 단계(ms): {', '.join(slow)}")
+    if not cmp["cases"]:
+        print("   비교 가능한 케이스 없음 (설정/입력이 기준 리포트와 다름)")
+    print(f"{'❌' if cmp['regressions'] else '✅'} 회귀 {len(cmp['regressions'])}건")
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    paths = list(IMAGE_PATHS)
+    if IMAGE_DIR and os.path.isdir(IMAGE_DIR):
+        paths += [os.path.join(IMAGE_DIR, f) for f in sorted(os.listdir(IMAGE_DIR))
+                  if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))]
+
+    result = run_benchmark(paths)
+    failed = False
+    if "--save-baseline" in sys.argv:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n📌 기준 리포트 저장: {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            result["comparison"] = compare_with_baseline(result, json.load(f))
+        print_comparison(result["comparison"])
+        failed = FAIL_ON_REGRESSION and bool(result["comparison"]["regressions"])
+
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 리포트 저장: {REPORT_PATH}")
+    sys.exit(1 if failed else 0)
@@ -12,16 +12,41 @@ BoneAge + PAH + 유전/성숙도 보정 통합 모듈 (Refactored Version)
    result = predict_bone_age(image_path, sex, height, age_months, father_height, mother_height)
 """
 import os
+import re
 import json
 import math
+import time
+import uuid
+import queue
+import copy
+import bisect
+import hashlib
+import functools
+import contextlib
+import sys
+import atexit
+import tempfile
+import threading
+import subprocess
+from multiprocessing.connection import Listener, Client
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import cv2
 import torch
 import torch.nn as nn
+from PIL import Image
+from torch.func import stack_module_state, functional_call, vmap
+from torch.overrides import TorchFunctionMode
 from torchvision import transforms
-import timm
 from statistics import NormalDist
+from scipy.special import ndtr  # scikit-learn 의존성으로 설치됨
+
+try:
+    import timm  # torch 백엔드 전용 (onnx 백엔드는 timm 없이 동작)
+except ImportError:
+    timm = None
 
 # =============================================================================
 # 경로 설정 (상대경로 기반)
@@ -44,6 +69,10 @@ WEIGHT_PATH = os.path.join(MODEL_DIR, f"{MODEL_NAME}_ensemble_weights_from_OOF.j
 # Calibration 모델 경로
 CALIBRATION_DIR = os.path.join(PROJECT_ROOT, "Calibration_Model")
 ISOTONIC_CALIBRATOR_PATH = os.path.join(CALIBRATION_DIR, "isotonic_calibrator.joblib")
+# 병원별 Calibrator (<병원 ID>.joblib, 없으면 기본 Calibrator 사용)
+HOSPITAL_CALIBRATOR_DIR = os.environ.get("OSTEOAGE_CALIBRATOR_DIR", os.path.join(CALIBRATION_DIR, "hospitals"))
+CALIBRATOR_CACHE_SIZE = int(os.environ.get("OSTEOAGE_CALIBRATOR_CACHE", "64"))  # 메모리에 유지할 병원 수 (LRU)
+CALIBRATOR_CHECK_SEC = float(os.environ.get("OSTEOAGE_CALIBRATOR_CHECK_SEC", "5"))  # 파일 변경 확인 주기 (0이면 매 요청)
 
 # =============================================================================
 # 고정 설정 (변경 불필요)
@@ -53,8 +82,65 @@ ADULT_MONTHS = 216.0
 PAH_W_D = 0.4
 PAH_ALPHA = 0.1
 IMG_SIZE = 448
+MAX_BATCH_SIZE = 8  # 배치 예측 시 fold당 한 번에 forward 할 최대 이미지 수
+MICROBATCH_WAIT_MS = 10  # 마이크로 배칭 시 첫 요청 이후 추가 요청을 기다리는 시간 (ms)
+# fold 체크포인트 옆에 *.safetensors가 있으면 mmap(zero-copy)으로 로드 (Convert_Checkpoints_Safetensors.py로 생성)
+USE_MMAP_CHECKPOINTS = os.environ.get("OSTEOAGE_MMAP_CHECKPOINTS", "1") == "1"
+# 추론 백엔드: "torch" (PyTorch eager, 아래 엔진/양자화 설정 적용) / "onnx" (ONNX Runtime CPU 세션) /
+#   "sharded" (fold 그룹별 워커 프로세스 또는 원격 노드에 분산, OSTEOAGE_SHARDS 참고)
+INFERENCE_BACKEND = os.environ.get("OSTEOAGE_BACKEND", "torch")
+# sharded 백엔드 샤드 구성
+#   "local:N" → fold를 N개 그룹으로 나눠 로컬 워커 프로세스로 실행
+#   "1,2@10.0.0.5:9301;3,4,5@10.0.0.6:9301" → fold 번호(1부터)@주소 (주소가 경로면 unix 소켓)
+SHARD_SPEC = os.environ.get("OSTEOAGE_SHARDS", "local:5")
+SHARD_AUTHKEY = os.environ.get("OSTEOAGE_SHARD_AUTHKEY", "")  # 원격 샤드 인증키 (원격 구성 시 필수)
+# 샤드별 torch 스레드 수 (0이면 기본값, 로컬 샤드는 CPU 코어 수 / 샤드 수로 나눠 과다 구독 방지)
+SHARD_THREADS = int(os.environ.get("OSTEOAGE_SHARD_THREADS", "0"))
+SHARD_TIMEOUT_SEC = 600  # 로컬 샤드 기동(모델 로드) 대기 시간
+# 샤드 응답 대기 시간 (초과 시 연결을 버리고 TimeoutError → 요청 실패, 멈춘 샤드가 요청을 무한히 붙잡지 않도록)
+SHARD_CALL_TIMEOUT_SEC = float(os.environ.get("OSTEOAGE_SHARD_CALL_TIMEOUT_SEC", "120"))
+# ONNX Runtime 세션별 intra-op 스레드 수 (0이면 ORT 기본값)
+ORT_INTRA_OP_THREADS = int(os.environ.get("OSTEOAGE_ORT_THREADS", "0"))
+# fold 모델 양자화: "none" (fp32) / "int8" (nn.Linear 동적 INT8 양자화, CPU 전용)
+QUANTIZE_MODE = os.environ.get("OSTEOAGE_QUANTIZE", "none")
+# torch 컴파일 모드 (loop 엔진 전용): "none" / "channels_last" (메모리 레이아웃만 변경) /
+#   "inductor" (channels_last + torch.compile, 워밍업 시 fold별 1회 컴파일, 실패 시 eager로 대체)
+COMPILE_MODE = os.environ.get("OSTEOAGE_COMPILE", "none")
+# 앙상블 실행 엔진: "loop" (fold별 순차 호출) / "stacked" (fold 파라미터를 쌓아 vmap 1회 호출)
+ENSEMBLE_ENGINE = os.environ.get("OSTEOAGE_ENSEMBLE_ENGINE", "loop")
+# 적응형 조기 종료 앙상블: fold를 순서대로 실행하다 가중 누적 추정치가 수렴하면 나머지 fold 생략
+#   (loop/onnx 엔진 전용). fold 순서는 "weight" (OOF 가중치 내림차순) 또는 "3,1,2,5,4" (1부터)
+ADAPTIVE_ENSEMBLE = os.environ.get("OSTEOAGE_ADAPTIVE_ENSEMBLE", "0") == "1"
+ADAPTIVE_FOLD_ORDER = os.environ.get("OSTEOAGE_ADAPTIVE_FOLD_ORDER", "weight")
+ADAPTIVE_TOLERANCE_MONTHS = float(os.environ.get("OSTEOAGE_ADAPTIVE_TOL_MONTHS", "0.5"))  # 추정치 변화 허용치 (개월)
+ADAPTIVE_MIN_FOLDS = int(os.environ.get("OSTEOAGE_ADAPTIVE_MIN_FOLDS", "2"))  # 조기 종료 전 최소 fold 수
+# 전처리 엔진: "gray" (디코딩 직후 단일 채널로 변환해 유지, 재사용 입력 버퍼에 직접 정규화.
+#   컬러 인코딩 이미지는 BGR 디코딩 후 변환하므로 기존 경로와 같은 입력) /
+#   "bgr" (기존 BGR → PIL → torchvision transforms 경로)
+PREPROCESS_ENGINE = os.environ.get("OSTEOAGE_PREPROCESS_ENGINE", "gray")
+# 표준화 전 축소: 짧은 변이 이 값보다 크면 밝기 매핑 전에 축소 (0이면 원본 해상도, 모델 입력 크기 이상 권장)
+#   밝기 매핑이 비선형(감마)이라 축소 순서에 따라 값이 조금 달라짐 → Check_Preprocess_Parity.py로 확인 후 사용
+STD_RESIZE_SHORT = int(os.environ.get("OSTEOAGE_STD_RESIZE_SHORT", "0"))
+# JPEG 축소 디코딩: 헤더의 짧은 변이 이 값의 2/4/8배 이상이면 DCT 단계에서 1/2, 1/4, 1/8로 디코딩
+#   (축소 후 짧은 변은 이 값 이상 유지, ROI 사용 시 여유 있게 지정. 0이면 항상 원본 해상도 디코딩)
+DECODE_MIN_SHORT = int(os.environ.get("OSTEOAGE_DECODE_MIN_SHORT", "0"))
+# fold별 pooled backbone 특징 캐시 (같은 X-ray를 성별/신체정보만 바꿔 재분석 시 FiLM/head만 실행)
+#   항목 수 (0이면 사용 안 함, 항목당 약 20KB), spill 디렉터리 지정 시 LRU에서 밀려난 항목을 디스크에 저장
+FEATURE_CACHE_SIZE = int(os.environ.get("OSTEOAGE_FEATURE_CACHE", "0"))
+FEATURE_CACHE_DIR = os.environ.get("OSTEOAGE_FEATURE_CACHE_DIR", "")
+#   spill 파일 최대 개수 (초과 시 오래된 파일부터 삭제, 리소스 재로드 시 전부 삭제)
+FEATURE_CACHE_SPILL_MAX = int(os.environ.get("OSTEOAGE_FEATURE_CACHE_SPILL_MAX", "2000"))
+# 단계별/fold별 지연 시간 히스토그램 기록 (AI 서버 /metrics로 출력, 호출당 수 µs)
+METRICS_ENABLED = os.environ.get("OSTEOAGE_METRICS", "1") == "1"
+# 요청 단위 프로파일링 trace 저장 디렉터리 (profile_predict_bone_age), 최근 PROFILE_KEEP개만 유지
+PROFILE_DIR = os.environ.get("OSTEOAGE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "osteoage_profiles"))
+PROFILE_KEEP = int(os.environ.get("OSTEOAGE_PROFILE_KEEP", "50"))
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# 모델 입력 정규화 (ImageNet mean/std, RGB 순서)
+INPUT_MEAN = (0.485, 0.456, 0.406)
+INPUT_STD = (0.229, 0.224, 0.225)
+
 # 전처리 파이프라인 기본 설정
 DEFAULT_PREPROCESS_CONFIG = {
     "do_standardize": True,
@@ -63,6 +149,8 @@ DEFAULT_PREPROCESS_CONFIG = {
     "use_roi1": False,
     "use_std2": False,
     "use_roi2": False,
+    "std_resize_short": STD_RESIZE_SHORT,  # 밝기 매핑 전 짧은 변 축소 (0이면 사용 안 함)
+    "decode_min_short": DECODE_MIN_SHORT,  # JPEG 축소 디코딩 최소 짧은 변 (0이면 사용 안 함)
     "use_isotonic_calibration": True
 }
 
@@ -77,21 +165,324 @@ MORPH_ITER, FILL_HOLES = 1, 0
 MIN_AREA_PCT, MAX_AREA_PCT, CENTRAL_WINDOW_PCT = 10, 100, 0
 SELECTION_MODE, W_AREA, W_LENGTH, W_SOLIDITY, W_CENTER, CENTRAL_BIAS = 0, 20, 70, 10, 30, 10
 APPLY_MASK_INSIDE_CROP, CROP_MARGIN = True, 0
+# ROI 탐색 해상도: 긴 변이 이 값보다 크면 큰 커널 형태학/컨투어 선택만 축소본에서 수행 후 마스크를 원본 해상도로 복원
+#   (이진화는 원본 해상도, 커널 크기는 같은 비율로 축소, 0이면 전부 원본 해상도).
+#   모델 입력 마스크가 달라지므로 Check_ROI_Parity.py로 마스크 IoU 확인 후 사용
+ROI_MAX_SIDE = int(os.environ.get("OSTEOAGE_ROI_MAX_SIDE", "0"))
+
+# =============================================================================
+# 파이프라인 계측 (Prometheus 텍스트 형식)
+# =============================================================================
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=None):
+    """Prometheus 라벨 문자열 ({a="1",b="2"}, 라벨이 없으면 빈 문자열)"""
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class LatencyHistogram:
+    """
+    라벨별 지연 시간 히스토그램 (누적 버킷 + 합계 + 개수)
+
+    observe는 버킷 탐색(bisect) + 잠금 하의 정수 증가만 수행하여 상시 사용 가능한 수준의 오버헤드
+    """
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        """labels: label_names 순서의 값 튜플"""
+        idx = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += seconds
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(labels, time.perf_counter() - t)
+
+    def summary(self):
+        """라벨별 {count, sum_seconds} (벤치마크/진단용)"""
+        with self._lock:
+            return {labels: {"count": sum(c), "sum_seconds": total} for labels, (c, total) in self._series.items()}
+
+    def render(self):
+        """Prometheus 텍스트 형식 줄 리스트"""
+        with self._lock:
+            series = [(labels, list(c), total) for labels, (c, total) in sorted(self._series.items())]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+        for labels, counts, total in series:
+            cum = 0
+            for le, c in zip(bounds, counts):
+                cum += c
+                le_label = 'le="%s"' % le
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, le_label)} {cum}")
+            lbl = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{lbl} {total:.6f}")
+            lines.append(f"{self.name}_count{lbl} {cum}")
+        return lines
+
+
+class CounterMetric:
+    """라벨별 누적 카운터"""
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{format_labels(self.label_names, labels)} {v}" for labels, v in items]
+        return lines
+
+
+def render_samples(name, help_text, samples, label_names=(), kind="gauge"):
+    """단순 값 메트릭 출력 줄 리스트 (samples: [(라벨 값 튜플, 값), ...], kind: gauge/counter)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{format_labels(label_names, labels)} {value}" for labels, value in samples]
+    return lines
+
+
+stage_latency = LatencyHistogram(
+    "osteoage_stage_seconds", "Prediction pipeline stage latency (stages may nest, e.g. roi inside preprocess)", ("stage",))
+fold_latency = LatencyHistogram("osteoage_fold_seconds", "Per-fold forward latency", ("fold", "engine"))
+
+
+_trace_local = threading.local()
+
+
+class StageTracer:
+    """
+    현재 스레드의 stage_timer/fold_timer 구간을 순서대로 기록 (요청 단위 프로파일링용)
+
+    활성화된 동안 각 구간은 torch.profiler.record_function으로도 감싸져 torch trace에 같은 이름으로 표시됨
+    """
+    def __init__(self):
+        self.events = []
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        _trace_local.tracer = self
+        return self
+
+    def __exit__(self, *exc):
+        _trace_local.tracer = None
+        return False
+
+    def add(self, name, start, seconds):
+        self.events.append((name, (start - self.t0) * 1000.0, seconds * 1000.0))
+
+    def breakdown(self):
+        """구간 이름별 {count, total_ms} (등장 순서 유지)"""
+        out = {}
+        for name, _, ms in self.events:
+            item = out.setdefault(name, {"count": 0, "total_ms": 0.0})
+            item["count"] += 1
+            item["total_ms"] = round(item["total_ms"] + ms, 3)
+        return out
+
+
+@contextlib.contextmanager
+def _timed(hist, labels, name, tracer):
+    rf = torch.profiler.record_function(name) if tracer is not None else contextlib.nullcontext()
+    t = time.perf_counter()
+    try:
+        with rf:
+            yield
+    finally:
+        dt = time.perf_counter() - t
+        if METRICS_ENABLED:
+            hist.observe(labels, dt)
+        if tracer is not None:
+            tracer.add(name, t, dt)
+
+
+def stage_timer(stage):
+    """with stage_timer("decode"): ... 형태로 단계 소요 시간 기록 (METRICS_ENABLED=False이고 프로파일링 중이 아니면 기록 안 함)"""
+    tracer = getattr(_trace_local, "tracer", None)
+    if not METRICS_ENABLED and tracer is None:
+        return contextlib.nullcontext()
+    return _timed(stage_latency, (stage,), stage, tracer)
+
+
+def fold_timer(fold_index, engine):
+    """fold (0부터) forward 소요 시간 기록"""
+    tracer = getattr(_trace_local, "tracer", None)
+    if not METRICS_ENABLED and tracer is None:
+        return contextlib.nullcontext()
+    return _timed(fold_latency, (str(fold_index + 1), engine), f"fold{fold_index + 1}", tracer)
+
 
 # =============================================================================
 # 유틸리티 함수
 # =============================================================================
-def imread_unicode(path, flags=cv2.IMREAD_GRAYSCALE):
-    """유니코드 경로 지원 이미지 로드"""
-    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_REDUCED_DECODE_FLAGS = {
+    cv2.IMREAD_GRAYSCALE: {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+    cv2.IMREAD_COLOR: {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8},
+}
+
+
+def jpeg_header(buf):
+    """
+    JPEG 헤더(SOF 마커)만 읽어 (width, height, 채널 수) 반환 (JPEG이 아니거나 헤더 손상 시 None)
+
+    buf: 인코딩된 바이트 (bytes/memoryview/uint8 ndarray)
+    """
+    buf = memoryview(buf).cast("B")
+    n = len(buf)
+    if n < 4 or buf[0] != 0xFF or buf[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < n:
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:  # 채움 바이트
+            i += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            return (buf[i + 7] << 8) | buf[i + 8], (buf[i + 5] << 8) | buf[i + 6], buf[i + 9]
+        if marker in (0xD9, 0xDA):  # EOI/SOS 이전에 SOF가 없으면 실패
+            return None
+        i += 2 + ((buf[i + 2] << 8) | buf[i + 3])
+    return None
+
+
+def jpeg_size(buf):
+    """JPEG 헤더만 읽어 (width, height) 반환 (JPEG이 아니거나 헤더 손상 시 None)"""
+    header = jpeg_header(buf)
+    return None if header is None else header[:2]
+
+
+def is_single_channel_encoded(buf):
+    """
+    단일 채널(그레이스케일)로 인코딩된 JPEG/PNG인지 헤더만 보고 판단
+
+    이 경우에만 IMREAD_GRAYSCALE 결과가 BGR 디코딩 → cvtColor(BGR2GRAY)와 같음
+    (컬러 JPEG의 그레이 디코딩은 libjpeg Y 채널이라 cvtColor 결과와 수 계조 차이)
+    """
+    header = jpeg_header(buf)
+    if header is not None:
+        return header[2] == 1
+    buf = memoryview(buf).cast("B")
+    # PNG: 시그니처 + IHDR color type 0 (그레이, 알파 없음)
+    return len(buf) > 25 and bytes(buf[:8]) == b"\x89PNG\r\n\x1a\n" and bytes(buf[12:16]) == b"IHDR" and buf[25] == 0
+
+
+def reduced_decode_flags(buf, flags, min_short):
+    """
+    JPEG 짧은 변이 min_short의 2/4/8배 이상이면 대응하는 IMREAD_REDUCED_* 플래그 반환 (아니면 flags 그대로)
+
+    libjpeg 축소 디코딩은 DCT 단계에서 해상도를 줄이므로 원본 크기 버퍼를 만들지 않음
+    """
+    if min_short <= 0 or flags not in _REDUCED_DECODE_FLAGS:
+        return flags
+    size = jpeg_size(buf)
+    if size is None:
+        return flags
+    short = min(size)
+    for factor in (8, 4, 2):
+        if -(-short // factor) >= min_short:
+            return _REDUCED_DECODE_FLAGS[flags][factor]
+    return flags
+
+
+def imread_unicode(path, flags=cv2.IMREAD_GRAYSCALE, min_short=0):
+    """유니코드 경로 지원 이미지 로드 (min_short > 0이면 큰 JPEG은 축소 디코딩)"""
+    buf = np.fromfile(path, dtype=np.uint8)
+    img = cv2.imdecode(buf, reduced_decode_flags(buf, flags, min_short))
     if img is None:
         raise FileNotFoundError(f"Failed to load image: {path}")
     return img
 
 
-def imread_unicode_color(path):
+def imread_unicode_color(path, min_short=0):
     """유니코드 경로 지원 컬러 이미지 로드"""
-    return imread_unicode(path, cv2.IMREAD_COLOR)
+    return imread_unicode(path, cv2.IMREAD_COLOR, min_short)
+
+
+def imdecode_buffer(data, flags=cv2.IMREAD_COLOR, min_short=0):
+    """
+    메모리 상의 인코딩된 이미지(bytes, bytearray, memoryview, 파일 객체) 디코딩
+
+    BytesIO는 getbuffer()로 복사 없이 읽고, 그 외 파일 객체는 read()로 읽음
+    """
+    if hasattr(data, "getbuffer"):
+        data = data.getbuffer()
+    elif hasattr(data, "read"):
+        data = data.read()
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buf, reduced_decode_flags(buf, flags, min_short))
+    if img is None:
+        raise ValueError("Failed to decode image buffer")
+    return img
+
+
+def read_image_bytes(source):
+    """이미지 경로/버퍼/파일 객체를 디코딩 전 인코딩 바이트로 읽기 (콘텐츠 해시 및 메모리 디코딩용)"""
+    if isinstance(source, (str, os.PathLike)):
+        return np.fromfile(source, dtype=np.uint8)
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer()
+    if hasattr(source, "read"):
+        return source.read()
+    return source
+
+
+def load_image_color(source, min_short=0):
+    """이미지 경로(str/PathLike) 또는 메모리 버퍼를 BGR 이미지로 로드 (min_short: 축소 디코딩 기준, 0이면 원본)"""
+    with stage_timer("decode"):
+        if isinstance(source, (str, os.PathLike)):
+            return imread_unicode_color(source, min_short)
+        return imdecode_buffer(source, cv2.IMREAD_COLOR, min_short)
+
+
+def load_image_gray(source, min_short=0):
+    """
+    이미지 경로(str/PathLike) 또는 메모리 버퍼를 그레이스케일로 디코딩 (min_short: 축소 디코딩 기준, 0이면 원본)
+
+    단일 채널로 인코딩된 JPEG/PNG는 그레이스케일로 바로 디코딩하고, 그 외(컬러 JPEG 등)는 BGR 디코딩 후
+    cvtColor(BGR2GRAY)로 변환하여 기존 BGR 경로와 같은 값 유지
+    """
+    with stage_timer("decode"):
+        buf = read_image_bytes(source)
+        single = is_single_channel_encoded(buf)
+        try:
+            img = imdecode_buffer(buf, cv2.IMREAD_GRAYSCALE if single else cv2.IMREAD_COLOR, min_short)
+        except ValueError:
+            if isinstance(source, (str, os.PathLike)):
+                raise FileNotFoundError(f"Failed to load image: {source}")
+            raise
+        return img if single else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
 
 def to_uint8(img):
@@ -160,35 +551,97 @@ def crop_by_roi(gray, crit):
     return gray
 
 
-def apply_intensity_mapping(gray, crit):
-    """밝기 매핑 적용"""
-    g = gray.astype(np.float32)
-    inten = crit.get("intensity", {})
-    src_lo = float(inten.get("src_lo", np.percentile(g, 1)))
-    src_hi = float(inten.get("src_hi", np.percentile(g, 99)))
-    dst_lo = float(inten.get("dst_lo", 0.0))
-    dst_hi = float(inten.get("dst_hi", 255.0))
+def gray_histogram(gray):
+    """uint8 그레이스케일 256-bin 히스토그램"""
+    return cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+
+
+def hist_percentile(cum, q):
+    """누적 히스토그램(cum)에서 np.percentile(method="linear")과 같은 백분위 값 계산 (정렬 없음)"""
+    n = int(cum[-1])
+    vi = (n - 1) * (np.float64(q) / 100.0)
+    lo = int(np.floor(vi))
+    t = vi - lo
+    # 정렬 배열의 k번째 값 = 누적 개수가 k를 처음 넘는 계조
+    a = float(np.searchsorted(cum, lo, side="right"))
+    b = float(np.searchsorted(cum, min(lo + 1, n - 1), side="right"))
+    d = b - a
+    return b - d * (1 - t) if t >= 0.5 else a + d * t
+
+
+def map_intensity(g, src_lo, src_hi, dst_lo, dst_hi, gamma):
+    """선형 밝기 매핑 + 감마 (float32 배열 단위 계산)"""
     if src_hi <= src_lo:
         src_hi = src_lo + 1.0
     g = np.clip((g - src_lo) / (src_hi - src_lo), 0.0, 1.0) * (dst_hi - dst_lo) + dst_lo
-    gamma = crit.get("gamma", None)
     if gamma:
         g = np.power(np.clip(g/255.0, 0, 1), float(gamma)) * 255.0
     return to_uint8(g)
 
 
-def standardize_gray_array(gray, criteria):
-    """그레이스케일 이미지 표준화"""
-    g = apply_alignment(gray, criteria)
-    g = crop_by_roi(g, criteria)
-    g = apply_intensity_mapping(g, criteria)
+def build_intensity_lut(hist, crit):
+    """
+    밝기 매핑(백분위 선형 매핑 + 감마)을 256 계조 LUT 하나로 합성
+
+    hist: 입력 이미지의 256-bin 히스토그램 (src_lo/src_hi 미지정 시 1/99 백분위 계산용)
+    """
+    inten = crit.get("intensity", {})
+    cum = np.cumsum(hist, dtype=np.int64)
+    src_lo = float(inten["src_lo"]) if "src_lo" in inten else hist_percentile(cum, 1)
+    src_hi = float(inten["src_hi"]) if "src_hi" in inten else hist_percentile(cum, 99)
+    levels = np.arange(256, dtype=np.float32)
+    return map_intensity(levels, src_lo, src_hi, float(inten.get("dst_lo", 0.0)), float(inten.get("dst_hi", 255.0)),
+                         crit.get("gamma", None))
+
+
+def apply_intensity_mapping(gray, crit, hist=None):
+    """
+    밝기 매핑 적용
+
+    uint8 입력은 히스토그램 백분위 + cv2.LUT 1회로 처리 (픽셀 단위 float 변환/정렬/거듭제곱 없음, 결과 동일).
+    hist를 주면 그 히스토그램으로 백분위 계산 (축소 전 원본 기준 유지용)
+    """
+    if gray.dtype != np.uint8:
+        g = gray.astype(np.float32)
+        inten = crit.get("intensity", {})
+        return map_intensity(g, float(inten.get("src_lo", np.percentile(g, 1))), float(inten.get("src_hi", np.percentile(g, 99))),
+                             float(inten.get("dst_lo", 0.0)), float(inten.get("dst_hi", 255.0)), crit.get("gamma", None))
+    if hist is None:
+        hist = gray_histogram(gray)
+    return cv2.LUT(gray, build_intensity_lut(hist, crit))
+
+
+def downscale_short_side(gray, short):
+    """짧은 변이 short보다 크면 short로 축소 (INTER_AREA, 0이면 그대로)"""
+    h, w = gray.shape[:2]
+    cur_short = min(h, w)
+    if short <= 0 or cur_short <= short:
+        return gray
+    scale = short / float(cur_short)
+    return cv2.resize(gray, (max(1, int(round(w*scale))), max(1, int(round(h*scale)))), interpolation=cv2.INTER_AREA)
+
+
+def standardize_gray_array(gray, criteria, resize_short=STD_RESIZE_SHORT):
+    """
+    그레이스케일 이미지 표준화
+
+    resize_short > 0이면 백분위는 원본 히스토그램으로 구하고, 밝기 매핑 전에 짧은 변을 resize_short로 축소
+    """
+    with stage_timer("standardize"):
+        g = apply_alignment(gray, criteria)
+        g = crop_by_roi(g, criteria)
+        hist = None
+        if resize_short > 0 and g.dtype == np.uint8 and min(g.shape[:2]) > resize_short:
+            hist = gray_histogram(g)
+            g = downscale_short_side(g, resize_short)
+        g = apply_intensity_mapping(g, criteria, hist)
     return g
 
 
-def standardize_bgr(bgr_img, criteria):
+def standardize_bgr(bgr_img, criteria, resize_short=STD_RESIZE_SHORT):
     """BGR 이미지 표준화"""
     gray = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY)
-    g_std = standardize_gray_array(gray, criteria)
+    g_std = standardize_gray_array(gray, criteria, resize_short)
     return to_bgr(g_std)
 
 
@@ -225,32 +678,52 @@ def in_central_window(ctr, w, h, pct):
     return (cx0 <= ctr[0] <= w-cx0) and (cy0 <= ctr[1] <= h-cy0)
 
 
+def contour_features(contours):
+    """컨투어별 면적/중심 일괄 계산 (moments 1회로 면적과 중심을 함께 구함)"""
+    areas = np.empty(len(contours), dtype=np.float64)
+    ctrs = np.empty((len(contours), 2), dtype=np.float32)
+    for i, c in enumerate(contours):
+        M = cv2.moments(c)
+        areas[i] = M["m00"]
+        if M["m00"] != 0:
+            ctrs[i] = (M["m10"]/M["m00"], M["m01"]/M["m00"])
+        else:
+            ctrs[i] = c.reshape(-1, 2).astype(np.float32).mean(axis=0)
+    return np.abs(areas), ctrs
+
+
 def pick_contour(contours, img_w, img_h, min_area, max_area, mode, w_area, w_len, w_sol, w_center, central_bias, central_win_pct):
-    """최적 컨투어 선택"""
-    cand = []
-    for c in contours:
-        a = cv2.contourArea(c)
-        if min_area <= a <= max_area and in_central_window(contour_center(c), img_w, img_h, central_win_pct):
-            cand.append(c)
-    if not cand:
+    """최적 컨투어 선택 (면적/중심 필터와 점수 계산을 배열 연산으로 수행)"""
+    if len(contours) == 0:
+        return None
+    areas_all, ctrs_all = contour_features(contours)
+    keep = (areas_all >= min_area) & (areas_all <= max_area)
+    if central_win_pct > 0:
+        cx0 = img_w*(100-central_win_pct)/200
+        cy0 = img_h*(100-central_win_pct)/200
+        keep &= (ctrs_all[:, 0] >= cx0) & (ctrs_all[:, 0] <= img_w-cx0) & (ctrs_all[:, 1] >= cy0) & (ctrs_all[:, 1] <= img_h-cy0)
+    idx = np.flatnonzero(keep)
+    if idx.size == 0:
         return None
+    cand = [contours[i] for i in idx]
     if mode == 1:
-        return cand[int(np.argmax([cv2.contourArea(c) for c in cand]))]
+        return cand[int(np.argmax(areas_all[idx]))]
     if mode == 2:
         return cand[int(np.argmax([cv2.arcLength(c, True) for c in cand]))]
     
-    areas = np.array([cv2.contourArea(c) for c in cand], dtype=np.float32)
-    perims = np.array([cv2.arcLength(c, True) for c in cand], dtype=np.float32)
-    solids = np.array([solidity(c) for c in cand], dtype=np.float32)
-    ctrs = np.array([contour_center(c) for c in cand], dtype=np.float32)
+    ctrs = ctrs_all[idx]
     diag = np.hypot(img_w, img_h)
     dists = np.hypot(ctrs[:,0]-img_w/2, ctrs[:,1]-img_h/2) / (diag + 1e-6)
-    
     if mode == 3:
         return cand[int(np.argmin(dists))]
+    
+    areas = areas_all[idx].astype(np.float32)
+    hull_areas = np.array([cv2.contourArea(cv2.convexHull(c)) for c in cand], dtype=np.float64)
+    solids = (areas_all[idx] / np.maximum(hull_areas, 1e-6)).astype(np.float32)
     if mode == 4:
         return cand[int(np.argmax(solids))]
     
+    perims = np.array([cv2.arcLength(c, True) for c in cand], dtype=np.float32)
     a_norm = areas / (areas.max() + 1e-6)
     l_norm = perims / (perims.max() + 1e-6)
     score = (w_area*a_norm + w_len*l_norm + w_sol*solids) - (w_center*(central_bias/50.0)*dists)
@@ -317,55 +790,162 @@ def apply_morph(bin_img, open_k, close_k, erode_k, dilate_k, iters, fill_holes):
     return out
 
 
-def extract_roi_from_image(bgr_img):
-    """이미지에서 ROI 추출"""
-    if bgr_img is None:
-        return None, "read_fail"
-    gray_full = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY)
+def scale_kernel(k, scale):
+    """축소 해상도용 커널 크기 (0 이하는 미사용 그대로, 그 외 홀수 유지)"""
+    if k <= 0 or scale == 1.0:
+        return k
+    return oddize(int(round(k * scale)), 1)
+
+
+def find_roi(gray_full, max_side=ROI_MAX_SIDE):
+    """
+    그레이스케일 이미지에서 손 ROI 탐색
+
+    max_side > 0이고 가장자리 crop의 긴 변이 더 크면, 전처리/이진화/opening은 원본 해상도에서 하고
+    큰 커널의 closing/erode/dilate와 컨투어 선택만 축소본(INTER_AREA, 커널도 같은 비율로 축소)에서 수행.
+    선택된 컨투어 마스크는 원본 해상도로 보간 복원하여 bbox/마스크 생성
+
+    Returns:
+        (box, mask, status): box는 원본 좌표 (y, x, h, w), mask는 box 크기의 윤곽 마스크 (미사용 시 None).
+            실패 시 box=None
+    """
     H, W = gray_full.shape[:2]
     ph, pw = int(H*(CROP_PCT/100.0)), int(W*(CROP_PCT/100.0))
     
     if ph*2 >= H or pw*2 >= W:
         y0, y1, x0, x1 = 0, H, 0, W
         crop_gray = gray_full
-        bgr_crop = bgr_img
     else:
         y0, y1 = ph, H-ph
         x0, x1 = pw, W-pw
         crop_gray = gray_full[y0:y1, x0:x1]
-        bgr_crop = bgr_img[y0:y1, x0:x1]
+    h, w = crop_gray.shape[:2]
     
     crop_gray = cv2.normalize(crop_gray, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-    crop_gray = apply_preproc(crop_gray, PREPROC_MODE, BILAT_D, BILAT_SIGMA_COLOR, BILAT_SIGMA_SPACE, MEDIAN_K, GAUSS_K, CLAHE_CLIP, CLAHE_TILE)
+    crop_gray = apply_preproc(crop_gray, PREPROC_MODE, BILAT_D, BILAT_SIGMA_COLOR, BILAT_SIGMA_SPACE,
+                              MEDIAN_K, GAUSS_K, CLAHE_CLIP, CLAHE_TILE)
     bin_img = apply_threshold(crop_gray, THRESH_MODE, BLOCK_SIZE_RAW, C_ACTUAL, INVERT, GLOBAL_T)
-    bin_img = apply_morph(bin_img, OPEN_KS, CLOSE_KS, ERODE_KS, DILATE_KS, MORPH_ITER, FILL_HOLES)
+    
+    scale = 1.0
+    if max_side and max(h, w) > max_side:
+        scale = max_side / float(max(h, w))
+        # 경계 위치를 좌우하는 opening까지는 원본 해상도, 비용 대부분인 큰 커널 연산만 축소본에서
+        bin_img = apply_morph(bin_img, OPEN_KS, 0, 0, 0, MORPH_ITER, 0)
+        bin_img = cv2.resize(bin_img, (max(1, int(round(w*scale))), max(1, int(round(h*scale)))), interpolation=cv2.INTER_AREA)
+        bin_img = np.where(bin_img > 127, 255, 0).astype(np.uint8)
+        bin_img = apply_morph(bin_img, 0, scale_kernel(CLOSE_KS, scale), scale_kernel(ERODE_KS, scale),
+                              scale_kernel(DILATE_KS, scale), MORPH_ITER, FILL_HOLES)
+    else:
+        bin_img = apply_morph(bin_img, OPEN_KS, CLOSE_KS, ERODE_KS, DILATE_KS, MORPH_ITER, FILL_HOLES)
     
     contours, _ = cv2.findContours(bin_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not contours:
-        return None, "no_contour"
+        return None, None, "no_contour"
     
-    h, w = bin_img.shape[:2]
-    min_area = (MIN_AREA_PCT/100.0) * (h*w)
-    max_area = (MAX_AREA_PCT/100.0) * (h*w)
-    best = pick_contour(contours, w, h, min_area, max_area, SELECTION_MODE, W_AREA/100.0, W_LENGTH/100.0, W_SOLIDITY/100.0, W_CENTER/100.0, CENTRAL_BIAS, CENTRAL_WINDOW_PCT)
+    sh, sw = bin_img.shape[:2]
+    min_area = (MIN_AREA_PCT/100.0) * (sh*sw)
+    max_area = (MAX_AREA_PCT/100.0) * (sh*sw)
+    best = pick_contour(contours, sw, sh, min_area, max_area, SELECTION_MODE, W_AREA/100.0, W_LENGTH/100.0, W_SOLIDITY/100.0, W_CENTER/100.0, CENTRAL_BIAS, CENTRAL_WINDOW_PCT)
     
     if best is None:
-        return None, "no_valid_contour"
+        return None, None, "no_valid_contour"
     
-    bx, by, bw, bh = cv2.boundingRect(best)
+    if scale != 1.0:
+        # 축소본에서 채운 컨투어를 선형 보간으로 원본 해상도 복원 (컨투어 좌표 반올림 시 생기는 계단 경계 방지)
+        small = np.zeros((sh, sw), np.uint8)
+        cv2.drawContours(small, [best], -1, 255, thickness=cv2.FILLED)
+        mask = np.where(cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR) > 127, 255, 0).astype(np.uint8)
+        if not mask.any():
+            return None, None, "no_valid_contour"
+        bx, by, bw, bh = cv2.boundingRect(mask)
+    else:
+        mask = None
+        bx, by, bw, bh = cv2.boundingRect(best)
     if CROP_MARGIN > 0:
         bx = max(0, bx - CROP_MARGIN)
         by = max(0, by - CROP_MARGIN)
         bw = min(w - bx, bw + 2*CROP_MARGIN)
         bh = min(h - by, bh + 2*CROP_MARGIN)
     
-    crop_roi = bgr_crop[by:by+bh, bx:bx+bw].copy()
+    crop_mask = None
     if APPLY_MASK_INSIDE_CROP:
-        mask = np.zeros((h, w), np.uint8)
-        cv2.drawContours(mask, [best], -1, 255, thickness=cv2.FILLED)
+        if mask is None:
+            mask = np.zeros((h, w), np.uint8)
+            cv2.drawContours(mask, [best], -1, 255, thickness=cv2.FILLED)
         crop_mask = mask[by:by+bh, bx:bx+bw]
-        crop_roi = cv2.bitwise_and(crop_roi, crop_roi, mask=crop_mask)
-    return crop_roi, "ok"
+    return (y0 + by, x0 + bx, bh, bw), crop_mask, "ok"
+
+
+def crop_roi(img, box, mask=None):
+    """find_roi 결과로 ROI 잘라내기 (채널 수 무관, 마스크 밖은 0)"""
+    y, x, h, w = box
+    roi = img[y:y+h, x:x+w].copy()
+    if mask is not None:
+        roi = cv2.bitwise_and(roi, roi, mask=mask)
+    return roi
+
+
+def roi_full_mask(shape, box, mask):
+    """find_roi 결과를 원본 크기의 0/1 마스크로 (box만 있으면 사각형)"""
+    full = np.zeros(shape[:2], np.uint8)
+    if box is not None:
+        y, x, h, w = box
+        full[y:y+h, x:x+w] = 1 if mask is None else (mask > 0)
+    return full
+
+
+def roi_parity(gray, max_side):
+    """
+    원본 해상도 ROI 대비 축소 해상도(max_side) ROI 비교
+
+    Returns:
+        dict: bbox_iou, mask_iou, 두 경로 소요 시간 (ms), 상태
+    """
+    t = time.perf_counter()
+    ref_box, ref_mask, ref_status = find_roi(gray, 0)
+    ms_full = (time.perf_counter() - t) * 1000.0
+    t = time.perf_counter()
+    box, mask, status = find_roi(gray, max_side)
+    ms_scaled = (time.perf_counter() - t) * 1000.0
+    
+    bbox_iou = mask_iou = float(ref_box is None and box is None)
+    if ref_box is not None and box is not None:
+        (y, x, h, w), (y2, x2, h2, w2) = ref_box, box
+        inter = max(0, min(y+h, y2+h2) - max(y, y2)) * max(0, min(x+w, x2+w2) - max(x, x2))
+        bbox_iou = inter / float(h*w + h2*w2 - inter)
+        m1, m2 = roi_full_mask(gray.shape, ref_box, ref_mask), roi_full_mask(gray.shape, box, mask)
+        union = np.count_nonzero(m1 | m2)
+        mask_iou = np.count_nonzero(m1 & m2) / float(union) if union else 1.0
+    return {
+        "bbox_iou": float(bbox_iou),
+        "mask_iou": float(mask_iou),
+        "ms_full": ms_full,
+        "ms_scaled": ms_scaled,
+        "status_full": ref_status,
+        "status_scaled": status,
+    }
+
+
+def extract_roi_from_image(bgr_img):
+    """이미지에서 ROI 추출"""
+    if bgr_img is None:
+        return None, "read_fail"
+    with stage_timer("roi"):
+        box, mask, status = find_roi(cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY))
+    if box is None:
+        return None, status
+    return crop_roi(bgr_img, box, mask), status
+
+
+def extract_roi_from_gray(gray):
+    """그레이스케일 이미지에서 ROI 추출 (extract_roi_from_image의 단일 채널 버전)"""
+    if gray is None:
+        return None, "read_fail"
+    with stage_timer("roi"):
+        box, mask, status = find_roi(gray)
+    if box is None:
+        return None, status
+    return crop_roi(gray, box, mask), status
 
 
 # =============================================================================
@@ -375,6 +955,8 @@ class ConvNeXtFiLM_Late_MT(nn.Module):
     """ConvNeXt + FiLM 기반 뼈나이 예측 모델"""
     def __init__(self, num_bins=7):
         super().__init__()
+        if timm is None:
+            raise ImportError("timm is required for the torch backend (pip install timm)")
         self.backbone = timm.create_model("convnext_base", pretrained=False, num_classes=0, in_chans=3)
         for m in self.backbone.modules():
             if isinstance(m, nn.BatchNorm2d):
@@ -387,9 +969,12 @@ class ConvNeXtFiLM_Late_MT(nn.Module):
         self.head_cls = nn.Sequential(nn.LayerNorm(nf), nn.Linear(nf, 256), nn.GELU(), nn.Dropout(0.3), nn.Linear(256, num_bins))
         self.num_bins = num_bins
 
-    def forward(self, img, sex):
-        x = self.backbone.forward_features(img)
-        x = x.mean(dim=[2, 3])
+    def forward_pooled(self, img):
+        """성별과 무관한 pooled backbone 특징 (B, nf) - 특징 캐시 대상"""
+        return self.backbone.forward_features(img).mean(dim=[2, 3])
+
+    def forward_heads(self, x, sex):
+        """pooled 특징에 성별 FiLM과 head 적용"""
         s = self.sex_emb(sex)
         gamma = self.gamma_fc(s)
         beta = self.beta_fc(s)
@@ -398,6 +983,9 @@ class ConvNeXtFiLM_Late_MT(nn.Module):
         logits = self.head_cls(x)
         return pred_reg, logits
 
+    def forward(self, img, sex):
+        return self.forward_heads(self.forward_pooled(img), sex)
+
 
 def infer_cls_bins_from_state_dict(state_dict):
     """모델 가중치에서 분류 헤드 크기 추론"""
@@ -405,11 +993,93 @@ def infer_cls_bins_from_state_dict(state_dict):
     return min(cands) if cands else None
 
 
+def safetensors_path_for(path):
+    """*.pth 체크포인트에 대응하는 *.safetensors 경로"""
+    return os.path.splitext(path)[0] + ".safetensors"
+
+
+def checkpoint_path_for(path):
+    """load_single_model이 실제로 읽는 체크포인트 경로 (.safetensors가 있고 mmap 로드 사용 시 우선)"""
+    st_path = safetensors_path_for(path)
+    return st_path if USE_MMAP_CHECKPOINTS and os.path.exists(st_path) else path
+
+
+def read_state_dict(path, device):
+    """체크포인트 읽기 (.safetensors는 mmap, 그 외는 torch.load)"""
+    if path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(path, device=str(device))
+    return torch.load(path, map_location=device)
+
+
+_meta_templates = {}
+# 파라미터/버퍼 생성에 쓰이는 텐서 생성 함수 (linspace/arange 등 생성자 안의 값 계산은 CPU 유지)
+_META_FACTORIES = frozenset({torch.empty, torch.zeros, torch.ones, torch.full, torch.rand, torch.randn})
+
+
+class _MetaParamMode(TorchFunctionMode):
+    """
+    device 미지정 텐서 생성(_META_FACTORIES)만 meta 디바이스로 보내는 모드 (스레드별 적용)
+
+    torch.device("meta") 컨텍스트는 timm ConvNeXt 생성자의 torch.linspace(...).tolist()까지
+    meta로 보내 실패하므로, 파라미터 할당만 meta로 생성 (이후 초기화는 meta 텐서라 no-op)
+    """
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if func in _META_FACTORIES and kwargs.get("device") is None:
+            kwargs["device"] = "meta"
+        return func(*args, **kwargs)
+
+
+def meta_model_template(num_bins):
+    """
+    가중치 메모리가 없는 (meta) 모델 구조 복사본 (num_bins별 최초 1회 생성 후 deepcopy)
+
+    파라미터를 처음부터 meta로 생성하므로 CPU 할당/난수 초기화가 일어나지 않음
+    """
+    if num_bins not in _meta_templates:
+        with _MetaParamMode():
+            model = ConvNeXtFiLM_Late_MT(num_bins=num_bins)
+        _meta_templates[num_bins] = model.to("meta")  # 생성자에서 CPU로 만든 작은 버퍼까지 meta로 통일
+    return copy.deepcopy(_meta_templates[num_bins])
+
+
+def load_single_model_mmap(path, device):
+    """
+    safetensors 체크포인트를 복사 없이 로드
+
+    meta 모델 구조(가중치 할당/초기화 없음)에 mmap된 텐서를
+    파라미터로 그대로 할당(assign=True)하므로, 파라미터가 파일 페이지를 직접 참조하고
+    같은 호스트의 모든 프로세스가 page cache를 공유함.
+    state_dict가 모델과 정확히 일치하지 않으면 None 반환 (일반 로드로 대체)
+    """
+    sd = read_state_dict(path, "cpu")
+    k = infer_cls_bins_from_state_dict(sd)
+    if k is None:
+        return None
+    model = meta_model_template(k)
+    try:
+        model.load_state_dict(sd, strict=True, assign=True)
+    except RuntimeError:
+        return None
+    if device.type != "cpu":
+        model = model.to(device)
+    model.eval()
+    return model
+
+
 def load_single_model(path, device):
-    """단일 모델 로드"""
+    """단일 모델 로드 (같은 이름의 .safetensors가 있으면 mmap 로드 우선)"""
+    st_path = checkpoint_path_for(path)
+    if st_path != path:
+        model = load_single_model_mmap(st_path, device)
+        if model is not None:
+            return model
+        print(f"[WARN] mmap 로드 불가 (state_dict 불일치), 일반 로드 사용: {os.path.basename(st_path)}")
+        path = st_path
     if not os.path.exists(path):
         raise FileNotFoundError(f"Model not found: {path}")
-    sd = torch.load(path, map_location=device)
+    sd = read_state_dict(path, device)
     k = infer_cls_bins_from_state_dict(sd)
     if k is None:
         model = ConvNeXtFiLM_Late_MT(num_bins=7).to(device)
@@ -441,154 +1111,1265 @@ def load_fold_models(device, model_paths):
     return models
 
 
-@torch.no_grad()
-def ensemble_predict_single(bgr_img, sex, models, weights, device, img_size=IMG_SIZE):
-    """앙상블 예측 수행"""
-    rgb = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2RGB)
-    tfm = transforms.Compose([
+@functools.lru_cache(maxsize=None)
+def build_input_transform(img_size=IMG_SIZE):
+    """모델 입력 변환 (RGB ndarray → 정규화 텐서, 크기별로 1회 생성)"""
+    return transforms.Compose([
         transforms.ToPILImage(),
         transforms.Resize((img_size, img_size)),
         transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        transforms.Normalize(list(INPUT_MEAN), list(INPUT_STD))
     ])
-    x = tfm(rgb).unsqueeze(0).to(device)
-    s = torch.tensor([int(sex)], dtype=torch.long, device=device)
+
+
+def bgr_to_tensor(bgr_img, img_size=IMG_SIZE, tfm=None):
+    """BGR 이미지를 (3, H, W) 입력 텐서로 변환"""
+    if tfm is None:
+        tfm = build_input_transform(img_size)
+    with stage_timer("input"):
+        rgb = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2RGB)
+        return tfm(rgb)
+
+
+# 채널별 정규화를 uint8 → float 1회 곱셈/덧셈으로: (g/255 - mean) / std = g * scale + offset
+_INPUT_SCALE = [np.float32(1.0 / (255.0 * sd)) for sd in INPUT_STD]
+_INPUT_OFFSET = [np.float32(-m / sd) for m, sd in zip(INPUT_MEAN, INPUT_STD)]
+_input_buffers = threading.local()
+
+
+def get_input_buffer(batch_size, img_size=IMG_SIZE):
+    """스레드별로 재사용하는 (batch_size, 3, img_size, img_size) 입력 버퍼 (필요 시에만 확장)"""
+    buf = getattr(_input_buffers, "buf", None)
+    if buf is None or buf.shape[0] < batch_size or buf.shape[2] != img_size:
+        buf = torch.empty(batch_size, 3, img_size, img_size, dtype=torch.float32)
+        _input_buffers.buf = buf
+    return buf[:batch_size]
+
+
+def gray_to_input(gray, out, img_size=IMG_SIZE):
+    """
+    그레이스케일 이미지를 모델 입력으로 변환하여 out (3, H, W) 텐서에 직접 기록
+
+    리사이즈는 학습 시 transforms.Resize와 같은 PIL bilinear(antialias)를 단일 채널에 적용하고,
+    3채널 확장은 채널별 정규화 결과를 out에 쓰는 마지막 단계에서만 수행 (BGR/RGB 변환 없음)
+    """
+    with stage_timer("input"):
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+        small = np.asarray(Image.fromarray(gray).resize((img_size, img_size), Image.BILINEAR))
+        planes = out.numpy()
+        for c in range(3):
+            np.multiply(small, _INPUT_SCALE[c], out=planes[c])
+            planes[c] += _INPUT_OFFSET[c]
+    return out
+
+
+def gray_to_tensor(gray, img_size=IMG_SIZE):
+    """그레이스케일 이미지를 새 (3, H, W) 입력 텐서로 변환 (bgr_to_tensor의 단일 채널 버전)"""
+    return gray_to_input(gray, torch.empty(3, img_size, img_size, dtype=torch.float32), img_size)
+
+
+@torch.no_grad()
+def predict_folds(x, s, models):
+    """배치 텐서에 대해 fold별 회귀 예측 (F, B)"""
     outs = []
     for m in models:
         pr, _ = m(x, s)
         outs.append(pr.float().cpu().numpy())
-    outs = np.stack(outs, axis=0)
-    pred = float(np.average(outs, axis=0, weights=weights)[0])
-    return pred
+    return np.stack(outs, axis=0)
 
 
-def clamp_boneage(pred, age_current, max_dev=BONEAGE_MAX_DEVIATION):
-    """뼈나이 범위 제한"""
-    lo = age_current - max_dev
-    hi = age_current + max_dev
-    if pred < lo:
-        return lo, True, pred
-    if pred > hi:
-        return hi, True, pred
-    return pred, False, pred
+def quantize_model_int8(model):
+    """
+    nn.Linear 계층을 동적 INT8 양자화한 모델 복사본 반환
+
+    ConvNeXt 블록의 pointwise MLP(fc1/fc2)와 head_reg/head_cls, FiLM의 Linear가 대상이며
+    가중치는 INT8로 저장되고 활성값은 실행 시점에 양자화됨 (depthwise conv, LayerNorm은 fp32 유지)
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8).eval()
+
+
+def quantize_fold_models(models, mode=QUANTIZE_MODE):
+    """설정된 양자화 모드를 fold 모델 전체에 적용 (none이면 그대로 반환)"""
+    if mode in (None, "", "none"):
+        return models
+    if mode != "int8":
+        raise ValueError(f"Unknown quantize mode: {mode}")
+    if DEVICE.type != "cpu":
+        print("[WARN] INT8 동적 양자화는 CPU 전용 → fp32 유지")
+        return models
+    print(f"[INFO] fold 모델 INT8 동적 양자화 (nn.Linear)")
+    return [quantize_model_int8(m) for m in models]
 
 
 # =============================================================================
-# LMS 기반 PAH 계산
+# 추론 백엔드 / 앙상블 엔진
+#   공통 인터페이스: engine(x, s) → (가중 평균 예측 (B,), fold별 예측 (F, B)) 텐서
+#   x: (B, 3, IMG_SIZE, IMG_SIZE) float 텐서, s: (B,) long 텐서
+#   name: 백엔드 이름 (상태/리포트 표시용)
 # =============================================================================
-def normalize_sex_value(v):
-    """성별 값 정규화"""
-    if pd.isna(v):
-        return None
-    s = str(v).strip().lower()
-    if s in ["1", "m", "male", "남", "boy"]:
-        return "male"
-    if s in ["2", "f", "female", "여", "girl"]:
-        return "female"
-    return None
+def normalized_fold_weights(weights, n_folds, device=None):
+    """OOF 앙상블 가중치를 합이 1인 텐서로 정규화"""
+    w = torch.as_tensor(np.asarray(weights, dtype=np.float64)).float()
+    if w.numel() != n_folds:
+        raise ValueError(f"Weights length {w.numel()} != folds {n_folds}")
+    return (w / w.sum()).to(device)
 
 
-def z_from_x(x, L, M, S):
-    """키에서 Z-score 계산"""
-    if abs(L) < 1e-12:
-        return np.log(x/M) / S
-    return ((x/M)**L - 1.0) / (L*S)
+class FoldLoopEnsemble(nn.Module):
+    """fold 모델을 순서대로 호출하는 기본 앙상블"""
+    name = "torch-loop"
 
+    def __init__(self, models, weights):
+        super().__init__()
+        self.models = nn.ModuleList(models)
+        device = next(models[0].parameters()).device
+        self.register_buffer("fold_weights", normalized_fold_weights(weights, len(models), device))
 
-def x_from_z(z, L, M, S):
-    """Z-score에서 키 계산"""
-    if abs(L) < 1e-12:
-        return M * np.exp(S*z)
-    return M * (1.0 + L*S*z)**(1.0/L)
+    def run_fold(self, i, img, sex):
+        """fold i (0부터) 단독 예측 (B,)"""
+        with fold_timer(i, self.name):
+            return self.models[i](img, sex)[0].float()
 
+    def forward_features(self, img):
+        """fold별 pooled backbone 특징 (F, B, nf)"""
+        return torch.stack([m.forward_pooled(img).float() for m in self.models], dim=0)
 
-def load_lms_data(csv_path):
-    """LMS 데이터 로드"""
-    df = pd.read_csv(csv_path)
-    df["sex_std"] = df["Sex"].apply(normalize_sex_value)
-    return df
+    def forward_heads(self, feats, sex):
+        """fold별 특징 (F, B, nf)에 FiLM/head 적용 → forward와 같은 (가중 평균, fold별 예측)"""
+        preds = torch.stack([m.forward_heads(f, sex)[0].float() for m, f in zip(self.models, feats)], dim=0)
+        return self.fold_weights @ preds, preds
 
+    def forward(self, img, sex):
+        preds = torch.stack([self.run_fold(i, img, sex) for i in range(len(self.models))], dim=0)
+        return self.fold_weights @ preds, preds
 
-def get_lms_interpolators(lms_df, sex):
-    """LMS 보간 함수 생성"""
-    sex_std = "male" if sex == 1 else "female"
-    df = lms_df[lms_df["sex_std"] == sex_std][["Month", "L", "M", "S"]].dropna().sort_values("Month").reset_index(drop=True)
-    if df.empty:
-        raise ValueError(f"No data for {sex_std}")
-    months = df["Month"].values.astype(float)
-    Lv = df["L"].values.astype(float)
-    Mv = df["M"].values.astype(float)
-    Sv = df["S"].values.astype(float)
-    
-    def interp(t, ys):
-        t_clipped = np.clip(t, months.min(), months.max())
-        return float(np.interp(t_clipped, months, ys))
-    
-    return lambda t: interp(t, Lv), lambda t: interp(t, Mv), lambda t: interp(t, Sv)
 
+class StackedFoldEnsemble(nn.Module):
+    """
+    fold 파라미터를 쌓아 vmap으로 한 번에 실행하는 벡터화 앙상블
 
-def calculate_pah_lms(height, boneage_months, sex, lms_df, adult_months=216.0):
-    """LMS 기반 PAH 계산"""
-    L_fn, M_fn, S_fn = get_lms_interpolators(lms_df, sex)
-    L_ba, M_ba, S_ba = L_fn(boneage_months), M_fn(boneage_months), S_fn(boneage_months)
-    Z_ba = z_from_x(height, L_ba, M_ba, S_ba)
-    percentile_ba = NormalDist().cdf(Z_ba) * 100.0
-    L_ad, M_ad, S_ad = L_fn(adult_months), M_fn(adult_months), S_fn(adult_months)
-    pah_lms = x_from_z(Z_ba, L_ad, M_ad, S_ad)
-    return {
-        "Z_score_boneage": Z_ba,
-        "percentile_boneage": percentile_ba,
-        "PAH_LMS": pah_lms,
-        "L_ba": L_ba, "M_ba": M_ba, "S_ba": S_ba,
-        "L_ad": L_ad, "M_ad": M_ad, "S_ad": S_ad
-    }
+    torch.func.stack_module_state로 fold별 파라미터를 (F, ...) 텐서로 쌓고
+    functional_call을 vmap 하여 모든 fold를 단일 호출로 실행 (conv는 grouped conv로 배치화).
+    OOF 가중치 합산도 같은 그래프 안에서 수행.
+    원본 fold 모델의 파라미터는 쌓인 텐서의 view로 교체되어 메모리를 중복 사용하지 않음.
+    (단, 쌓는 과정에서 새 메모리에 복사되므로 mmap 체크포인트의 page cache 공유 이점은 사라짐)
+    """
+    name = "torch-stacked"
 
+    def __init__(self, models, weights):
+        super().__init__()
+        if len({m.num_bins for m in models}) > 1:
+            raise ValueError("All folds must share the same head_cls size to be stacked")
+        params, buffers = stack_module_state(models)
+        for i, m in enumerate(models):
+            for name, t in m.named_parameters():
+                t.data = params[name][i]
+            for name, t in m.named_buffers():
+                t.data = buffers[name][i]
+        self.params = {k: v.detach() for k, v in params.items()}
+        self.buffers_ = buffers
+        # functional_call용 구조 템플릿 (meta 텐서, 실제 가중치 없음) - 서브모듈로 등록하지 않음
+        self._base = [copy.deepcopy(models[0]).to("meta").eval()]
+        self.num_folds = len(models)
+        device = next(iter(self.params.values())).device
+        self.register_buffer("fold_weights", normalized_fold_weights(weights, len(models), device))
+
+    def _call_fold(self, params, buffers, img, sex):
+        return functional_call(self._base[0], (params, buffers), (img, sex))[0]
 
-def calculate_height_percentile(height, age_months, sex, lms_df):
-    """현재 키 백분위 계산"""
-    L_fn, M_fn, S_fn = get_lms_interpolators(lms_df, sex)
-    L_ca, M_ca, S_ca = L_fn(age_months), M_fn(age_months), S_fn(age_months)
-    Z_ca = z_from_x(height, L_ca, M_ca, S_ca)
-    percentile_ca = NormalDist().cdf(Z_ca) * 100.0
-    return {
-        "Z_score_current": Z_ca,
-        "percentile_current": percentile_ca
-    }
+    def forward(self, img, sex):
+        preds = vmap(self._call_fold, in_dims=(0, 0, None, None))(self.params, self.buffers_, img, sex).float()
+        return self.fold_weights @ preds, preds
 
 
-def calculate_pah_final_percentile(pah_final, sex, lms_df, adult_months=216.0):
-    """최종 PAH 백분위 계산"""
-    L_fn, M_fn, S_fn = get_lms_interpolators(lms_df, sex)
-    L_ad, M_ad, S_ad = L_fn(adult_months), M_fn(adult_months), S_fn(adult_months)
-    Z_pah = z_from_x(pah_final, L_ad, M_ad, S_ad)
-    percentile_pah = NormalDist().cdf(Z_pah) * 100.0
-    return {
-        "Z_score_pah_final": Z_pah,
-        "percentile_pah_final": percentile_pah
-    }
+class CompiledFold(nn.Module):
+    """
+    fold 모델 1개의 channels_last / torch.compile 래퍼
 
+    inductor 모드에서는 동적 배치 크기(dynamic=True)로 컴파일하여 서빙하는 모든 배치 크기에
+    같은 컴파일 그래프를 재사용하며, 컴파일/실행 실패 시 경고 후 eager로 영구 전환
+    """
+    def __init__(self, model, mode=COMPILE_MODE):
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last)
+        self.num_bins = model.num_bins
+        self.mode = mode
+        self._compiled = torch.compile(self.model, dynamic=True) if mode == "inductor" else None
 
-def calculate_mph_percentile(mph, sex, lms_df, adult_months=216.0):
-    """MPH(유전 기반 예측 키) 백분위 계산"""
-    L_fn, M_fn, S_fn = get_lms_interpolators(lms_df, sex)
-    L_ad, M_ad, S_ad = L_fn(adult_months), M_fn(adult_months), S_fn(adult_months)
-    Z_mph = z_from_x(mph, L_ad, M_ad, S_ad)
-    percentile_mph = NormalDist().cdf(Z_mph) * 100.0
-    return {
-        "Z_score_mph": Z_mph,
-        "percentile_mph": percentile_mph
-    }
+    def forward(self, img, sex):
+        img = img.contiguous(memory_format=torch.channels_last)
+        if self._compiled is not None:
+            try:
+                return self._compiled(img, sex)
+            except Exception as e:
+                print(f"[WARN] torch.compile 실행 실패, eager로 전환: {e}")
+                self._compiled = None
+        return self.model(img, sex)
+
+    def forward_pooled(self, img):
+        """특징 캐시용 pooled 특징 (eager, channels_last)"""
+        return self.model.forward_pooled(img.contiguous(memory_format=torch.channels_last))
+
+    def forward_heads(self, x, sex):
+        return self.model.forward_heads(x, sex)
+
+
+def compile_ensemble(engine, mode=COMPILE_MODE):
+    """loop 엔진의 fold 모델을 CompiledFold로 교체 (다른 엔진은 그대로 반환)"""
+    if mode in (None, "", "none"):
+        return engine
+    if mode not in ("channels_last", "inductor"):
+        print(f"[WARN] Unknown compile mode '{mode}', eager 유지")
+        return engine
+    if not isinstance(engine, FoldLoopEnsemble):
+        print(f"[WARN] 컴파일 모드는 loop 엔진 전용 ({engine.name}) → eager 유지")
+        return engine
+    engine.models = nn.ModuleList([m if isinstance(m, CompiledFold) else CompiledFold(m, mode) for m in engine.models])
+    engine.name = f"torch-loop-{mode}"
+    if mode == "inductor":
+        # 배치 1은 별도 그래프로 특수화되므로 1과 2 이상 배치 그래프를 모두 워밍업 시 컴파일
+        engine.warmup_batch_sizes = (1, 2)
+    print(f"[INFO] Compile mode: {mode} (컴파일은 첫 forward/워밍업 시 수행)")
+    return engine
+
+
+def onnx_path_for(path):
+    """*.pth 체크포인트에 대응하는 *.onnx 경로 (Export_ONNX_Models.py로 생성)"""
+    return os.path.splitext(path)[0] + ".onnx"
+
+
+class OnnxRuntimeEnsemble:
+    """
+    fold별 ONNX 그래프를 ONNX Runtime CPU 세션으로 실행하는 앙상블
 
+    그래프 최적화(ORT_ENABLE_ALL)와 세션별 스레드 수 제어를 사용하며 timm이 필요 없음.
+    입력/출력은 torch 백엔드와 같은 텐서 인터페이스를 유지
+    """
+    name = "onnxruntime"
+
+    def __init__(self, onnx_paths, weights, intra_op_threads=ORT_INTRA_OP_THREADS):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = int(intra_op_threads)
+        self.sessions = []
+        for p in onnx_paths:
+            if not os.path.exists(p):
+                raise FileNotFoundError(f"ONNX model not found: {p}")
+            self.sessions.append(ort.InferenceSession(p, sess_options=opts, providers=["CPUExecutionProvider"]))
+        self.fold_weights = normalized_fold_weights(weights, len(self.sessions))
+        self.num_folds = len(self.sessions)
+
+    def run_fold(self, i, img, sex):
+        """fold i (0부터) 단독 예측 (B,)"""
+        feeds = {"img": img.detach().cpu().float().numpy(), "sex": sex.detach().cpu().long().numpy()}
+        return torch.from_numpy(self._run_session(i, feeds)).float()
+
+    def _run_session(self, i, feeds):
+        with fold_timer(i, self.name):
+            return self.sessions[i].run(["pred_reg"], feeds)[0]
+
+    def __call__(self, img, sex):
+        feeds = {"img": img.detach().cpu().float().numpy(), "sex": sex.detach().cpu().long().numpy()}
+        preds = torch.from_numpy(np.stack([self._run_session(i, feeds) for i in range(self.num_folds)], axis=0)).float()
+        return self.fold_weights @ preds, preds
 
-def calculate_pah_lms_percentile(pah_lms, sex, lms_df, adult_months=216.0):
-    """PAH_LMS(성장곡선 기반 예측 키) 백분위 계산"""
-    L_fn, M_fn, S_fn = get_lms_interpolators(lms_df, sex)
-    L_ad, M_ad, S_ad = L_fn(adult_months), M_fn(adult_months), S_fn(adult_months)
-    Z_pah_lms = z_from_x(pah_lms, L_ad, M_ad, S_ad)
-    percentile_pah_lms = NormalDist().cdf(Z_pah_lms) * 100.0
-    return {
-        "Z_score_pah_lms": Z_pah_lms,
-        "percentile_pah_lms": percentile_pah_lms
+
+# =============================================================================
+# 적응형 조기 종료 앙상블
+#   fold를 지정 순서로 실행하며 샘플별 가중 누적 추정치가 허용치 이내로 안정되면 종료.
+#   OOF 가중치는 실제 실행한 fold에 대해 재정규화되고, 실행하지 않은 fold의 예측은 NaN
+# =============================================================================
+def parse_fold_order(order, weights):
+    """fold 실행 순서 (0부터 인덱스 리스트). "weight"이면 OOF 가중치 내림차순"""
+    n = len(weights)
+    if order in (None, "", "weight"):
+        return [int(i) for i in np.argsort(-np.asarray(weights, dtype=np.float64), kind="stable")]
+    idx = [int(f) - 1 for f in str(order).split(",") if f.strip()]
+    if sorted(idx) != list(range(n)):
+        raise ValueError(f"Fold order must be a permutation of 1..{n}: {order}")
+    return idx
+
+
+def folds_used_from_preds(fold_preds):
+    """fold별 예측 (F, B)에서 샘플별 실제 실행 fold 수 (B,)"""
+    return (~torch.isnan(fold_preds)).sum(dim=0)
+
+
+class AdaptiveFoldEnsemble:
+    """
+    fold 예측이 수렴하면 나머지 fold를 건너뛰는 조기 종료 앙상블 (run_fold 지원 엔진 래퍼)
+
+    min_folds개 이후 fold를 추가해도 가중 누적 추정치 변화가 tol 이하인 샘플은 종료하고,
+    나머지 샘플만 다음 fold에 전달. 쉬운 케이스는 2~3 fold에서 끝나고 어려운 케이스는 전체 fold 실행
+    """
+    def __init__(self, base, order, tol=ADAPTIVE_TOLERANCE_MONTHS, min_folds=ADAPTIVE_MIN_FOLDS):
+        self.base = base
+        self.fold_weights = base.fold_weights
+        self.num_folds = len(order)
+        self.order = list(order)
+        self.tol = float(tol)
+        self.min_folds = max(1, int(min_folds))
+        self.name = f"{base.name}-adaptive"
+        self.warmup_batch_sizes = getattr(base, "warmup_batch_sizes", ())
+
+    def __call__(self, img, sex):
+        n = img.shape[0]
+        preds = torch.full((self.num_folds, n), float("nan"))
+        num = torch.zeros(n)
+        den = torch.zeros(n)
+        prev = torch.zeros(n)
+        active = torch.arange(n)
+        for k, fi in enumerate(self.order):
+            p = self.base.run_fold(fi, img[active], sex[active]).float().cpu()
+            w = float(self.fold_weights[fi])
+            preds[fi, active] = p
+            num[active] += w * p
+            den[active] += w
+            est = num[active] / den[active]
+            if k + 1 >= self.min_folds:
+                keep = (est - prev[active]).abs() > self.tol
+                active, est = active[keep], est[keep]
+                if active.numel() == 0:
+                    break
+            prev[active] = est
+        return num / den, preds
+
+
+def make_adaptive_ensemble(engine, enabled=ADAPTIVE_ENSEMBLE, order=ADAPTIVE_FOLD_ORDER):
+    """조기 종료 설정 시 엔진을 AdaptiveFoldEnsemble로 감쌈 (run_fold 미지원 엔진은 그대로 반환)"""
+    if not enabled:
+        return engine
+    if not hasattr(engine, "run_fold"):
+        print(f"[WARN] 적응형 앙상블은 loop/onnx 엔진 전용 ({engine.name}) → 전체 fold 실행")
+        return engine
+    fold_order = parse_fold_order(order, engine.fold_weights.tolist())
+    print(f"[INFO] Adaptive ensemble: 순서 {[i + 1 for i in fold_order]}, tol {ADAPTIVE_TOLERANCE_MONTHS}M, 최소 {ADAPTIVE_MIN_FOLDS} folds")
+    return AdaptiveFoldEnsemble(engine, fold_order)
+
+
+# =============================================================================
+# Fold 샤딩 (fold 그룹별 워커 프로세스 / 원격 노드)
+#   샤드 서버: fold 일부만 로드하고 (x, s) → fold별 예측 (k, B) 응답
+#   코디네이터: 전처리된 입력을 모든 샤드에 동시에 보내고 결과를 모아 OOF 가중 평균
+# =============================================================================
+def parse_shard_address(addr):
+    """'host:port' → (host, port), 경로/named pipe → 그대로 (unix 소켓)"""
+    addr = addr.strip()
+    if "/" in addr or addr.startswith("\\\\"):
+        return addr
+    host, port = addr.rsplit(":", 1)
+    return (host, int(port))
+
+
+def parse_shard_spec(spec):
+    """'1,2@host:port;3,4,5@host:port' → [([0, 1], (host, port)), ([2, 3, 4], ...)] (fold는 0부터)"""
+    shards = []
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        folds, addr = part.split("@", 1)
+        shards.append(([int(f) - 1 for f in folds.split(",") if f.strip()], parse_shard_address(addr)))
+    return shards
+
+
+def _handle_shard_conn(conn, fold_indices, models):
+    """샤드 서버의 연결 1개 처리 (연결당 스레드)"""
+    with conn:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if msg[0] == "ping":
+                    conn.send(("ok", fold_indices))
+                elif msg[0] == "predict":
+                    x = torch.from_numpy(msg[1]).to(DEVICE)
+                    s = torch.from_numpy(msg[2]).to(DEVICE)
+                    conn.send(("ok", predict_folds(x, s, models).astype(np.float32)))
+                else:
+                    conn.send(("error", f"Unknown op: {msg[0]}"))
+            except Exception as e:
+                conn.send(("error", str(e)))
+
+
+def serve_fold_shard(fold_paths, address, authkey, num_threads=SHARD_THREADS):
+    """
+    fold 그룹을 로드하고 코디네이터 요청을 처리하는 샤드 서버 (반환하지 않음)
+
+    Parameters:
+        fold_paths (dict): {fold 번호(0부터): 체크포인트 경로}
+        address: Listener 주소 ((host, port) 또는 unix 소켓 경로)
+        authkey (bytes): 연결 인증키 (HMAC, 코디네이터와 동일해야 함)
+        num_threads: torch intra-op 스레드 수 (0이면 기본값)
+    """
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    fold_indices = sorted(fold_paths)
+    models = quantize_fold_models([load_single_model(fold_paths[i], DEVICE) for i in fold_indices])
+    listener = Listener(address, authkey=authkey)
+    print(f"[INFO] Fold shard {[i + 1 for i in fold_indices]} 대기: {listener.address}")
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            print(f"[WARN] Shard 연결 실패: {e}")
+            continue
+        threading.Thread(target=_handle_shard_conn, args=(conn, fold_indices, models), daemon=True).start()
+
+
+def serve_fold_shard_from_env():
+    """
+    환경변수 설정으로 샤드 서버 실행 (shard_server.py 및 로컬 샤드 프로세스 진입점)
+
+    OSTEOAGE_SHARD_FOLDS (1부터, 콤마 구분), OSTEOAGE_SHARD_ADDRESS, OSTEOAGE_SHARD_AUTHKEY,
+    OSTEOAGE_SHARD_MODEL_PATHS (선택, os.pathsep 구분, 기본 MODEL_PATHS)
+    """
+    folds = [int(f) for f in os.environ.get("OSTEOAGE_SHARD_FOLDS", "").split(",") if f.strip()]
+    authkey = os.environ.get("OSTEOAGE_SHARD_AUTHKEY", "")
+    if not folds or not authkey:
+        raise ValueError("OSTEOAGE_SHARD_FOLDS and OSTEOAGE_SHARD_AUTHKEY are required")
+    paths_env = os.environ.get("OSTEOAGE_SHARD_MODEL_PATHS")
+    model_paths = paths_env.split(os.pathsep) if paths_env else MODEL_PATHS
+    address = parse_shard_address(os.environ.get("OSTEOAGE_SHARD_ADDRESS", "0.0.0.0:9301"))
+    serve_fold_shard({f - 1: model_paths[f - 1] for f in folds}, address, authkey.encode(), SHARD_THREADS)
+
+
+def wait_for_shard(address, authkey, proc=None, timeout=SHARD_TIMEOUT_SEC):
+    """샤드가 ping에 응답할 때까지 대기 (proc가 먼저 종료되면 오류)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with Client(address, authkey=authkey) as conn:
+                conn.send(("ping",))
+                return conn.recv()[1]
+        except (OSError, EOFError):
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"Shard process exited during load (exitcode={proc.returncode})")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Shard {address} did not become ready in {timeout}s")
+            time.sleep(0.5)
+
+
+def start_local_fold_shards(n_shards, model_paths=MODEL_PATHS, timeout=SHARD_TIMEOUT_SEC, num_threads=SHARD_THREADS):
+    """
+    fold를 n_shards개 그룹으로 나눠 로컬 워커 프로세스로 실행
+
+    multiprocessing spawn은 부모의 __main__(app.py 등)을 다시 import 하므로
+    독립 파이썬 프로세스(serve_fold_shard_from_env)로 실행.
+    num_threads가 0이면 샤드별 스레드 수를 CPU 코어 수 / 샤드 수로 지정 (샤드마다 전체 코어를 쓰지 않도록)
+
+    Returns:
+        (shards, authkey): parse_shard_spec과 같은 형식의 샤드 목록, 임의 생성 인증키
+    """
+    authkey = os.urandom(16).hex()
+    groups = [g.tolist() for g in np.array_split(np.arange(len(model_paths)), max(1, min(int(n_shards), len(model_paths))))]
+    threads = num_threads if num_threads > 0 else max(1, (os.cpu_count() or 1) // len(groups))
+    sock_dir = tempfile.mkdtemp(prefix="osteoage_shards_")
+    code = (f"import sys; sys.path.insert(0, {SCRIPT_DIR!r}); "
+            "from CPU_BoneAge_PAH_Compact import serve_fold_shard_from_env; serve_fold_shard_from_env()")
+    shards, procs = [], []
+    for gi, folds in enumerate(groups):
+        address = os.path.join(sock_dir, f"shard{gi}.sock") if os.name != "nt" else f"127.0.0.1:{9301 + gi}"
+        env = dict(os.environ,
+                   OSTEOAGE_SHARD_FOLDS=",".join(str(f + 1) for f in folds),
+                   OSTEOAGE_SHARD_ADDRESS=address,
+                   OSTEOAGE_SHARD_AUTHKEY=authkey,
+                   OSTEOAGE_SHARD_THREADS=str(threads),
+                   OSTEOAGE_SHARD_MODEL_PATHS=os.pathsep.join(model_paths))
+        procs.append(subprocess.Popen([sys.executable, "-c", code], env=env))
+        shards.append((folds, parse_shard_address(address)))
+    atexit.register(lambda: [p.terminate() for p in procs if p.poll() is None])
+    print(f"[INFO] Local fold shards: {len(groups)}개, 샤드별 스레드 {threads}")
+    for (_, address), proc in zip(shards, procs):
+        wait_for_shard(address, authkey.encode(), proc, timeout)
+    return shards, authkey.encode()
+
+
+class ShardedFoldEnsemble:
+    """
+    fold 그룹별 샤드(프로세스/원격 노드)에 입력을 동시에 보내고 결과를 모으는 앙상블
+
+    샤드별 연결은 풀로 재사용되며, 끊긴 연결은 한 번 재연결 후 재시도.
+    call_timeout 안에 응답이 없으면 연결을 닫고 TimeoutError (재시도하지 않음)
+    """
+    name = "sharded"
+
+    def __init__(self, shards, weights, authkey, call_timeout=SHARD_CALL_TIMEOUT_SEC):
+        folds = sorted(f for fs, _ in shards for f in fs)
+        if folds != list(range(len(weights))):
+            raise ValueError(f"Shards must cover folds 1..{len(weights)} exactly once: {[f + 1 for f in folds]}")
+        self.shards = shards
+        self.authkey = authkey
+        self.call_timeout = float(call_timeout)
+        self.num_folds = len(weights)
+        self.fold_weights = normalized_fold_weights(weights, len(weights))
+        self._pools = [queue.LifoQueue() for _ in shards]
+        self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard")
+
+    def _call_shard(self, i, x_np, s_np):
+        for attempt in range(2):
+            try:
+                conn = self._pools[i].get_nowait()
+            except queue.Empty:
+                conn = Client(self.shards[i][1], authkey=self.authkey)
+            try:
+                conn.send(("predict", x_np, s_np))
+                ready = conn.poll(self.call_timeout)
+                if ready:
+                    status, payload = conn.recv()
+            except (EOFError, OSError):
+                conn.close()
+                if attempt == 1:
+                    raise
+                continue
+            if not ready:
+                # 응답이 늦게 도착해도 다음 요청과 섞이지 않도록 연결은 풀에 돌려놓지 않음
+                conn.close()
+                raise TimeoutError(f"Shard {self.shards[i][1]} did not respond in {self.call_timeout}s")
+            self._pools[i].put(conn)
+            if status != "ok":
+                raise RuntimeError(f"Shard {self.shards[i][1]} error: {payload}")
+            return payload
+
+    def _timed_call_shard(self, i, x_np, s_np):
+        # 샤드 왕복 시간 (직렬화 + 전송 포함)을 fold 그룹 라벨로 기록 (예: fold="1,2")
+        if not METRICS_ENABLED:
+            return self._call_shard(i, x_np, s_np)
+        with fold_latency.time(",".join(str(f + 1) for f in self.shards[i][0]), self.name):
+            return self._call_shard(i, x_np, s_np)
+
+    def __call__(self, img, sex):
+        x_np = img.detach().cpu().float().numpy()
+        s_np = sex.detach().cpu().long().numpy()
+        futs = [self._executor.submit(self._timed_call_shard, i, x_np, s_np) for i in range(len(self.shards))]
+        preds = np.zeros((self.num_folds, x_np.shape[0]), dtype=np.float32)
+        for (folds, _), fut in zip(self.shards, futs):
+            preds[folds] = fut.result()
+        preds = torch.from_numpy(preds)
+        return self.fold_weights @ preds, preds
+
+
+def build_sharded_ensemble(weights, spec=SHARD_SPEC):
+    """SHARD_SPEC에 따라 로컬 샤드를 띄우거나 원격 샤드에 연결하여 코디네이터 생성"""
+    if spec.startswith("local:"):
+        shards, authkey = start_local_fold_shards(int(spec.split(":", 1)[1]), MODEL_PATHS)
+    else:
+        if not SHARD_AUTHKEY:
+            raise ValueError("OSTEOAGE_SHARD_AUTHKEY is required for remote shards")
+        shards, authkey = parse_shard_spec(spec), SHARD_AUTHKEY.encode()
+    return ShardedFoldEnsemble(shards, weights, authkey)
+
+
+def build_backend(weights, backend=INFERENCE_BACKEND, timings=None):
+    """
+    설정된 추론 백엔드 생성
+
+    Returns:
+        (models, engine): torch fold 모델 리스트 (onnx/sharded 백엔드면 빈 리스트), 앙상블 엔진
+    """
+    timings = {} if timings is None else timings
+    if backend == "onnx":
+        t = time.perf_counter()
+        try:
+            engine = OnnxRuntimeEnsemble([onnx_path_for(p) for p in MODEL_PATHS], weights)
+            timings["models"] = round(time.perf_counter() - t, 3)
+            print(f"[INFO] Inference backend: onnxruntime ({engine.num_folds} folds)")
+            return [], engine
+        except Exception as e:
+            print(f"[WARN] ONNX Runtime 백엔드 생성 실패, torch 백엔드 사용: {e}")
+    elif backend == "sharded":
+        t = time.perf_counter()
+        try:
+            engine = build_sharded_ensemble(weights)
+            timings["models"] = round(time.perf_counter() - t, 3)
+            print(f"[INFO] Inference backend: sharded ({len(engine.shards)} shards)")
+            return [], engine
+        except Exception as e:
+            print(f"[WARN] Sharded 백엔드 생성 실패, torch 백엔드 사용: {e}")
+    elif backend != "torch":
+        print(f"[WARN] Unknown inference backend '{backend}', torch 백엔드 사용")
+    
+    # 모델 로드
+    t = time.perf_counter()
+    models = load_fold_models(DEVICE, MODEL_PATHS)
+    timings["models"] = round(time.perf_counter() - t, 3)
+    
+    # 양자화 (QUANTIZE_MODE, fp32 원본은 해제됨)
+    if QUANTIZE_MODE not in (None, "", "none"):
+        t = time.perf_counter()
+        models = quantize_fold_models(models)
+        timings["quantize"] = round(time.perf_counter() - t, 3)
+    
+    # 앙상블 엔진 구성 (ENSEMBLE_ENGINE, COMPILE_MODE)
+    t = time.perf_counter()
+    engine = compile_ensemble(build_ensemble(models, weights))
+    timings["ensemble"] = round(time.perf_counter() - t, 3)
+    return models, engine
+
+
+def build_ensemble(models, weights, engine=ENSEMBLE_ENGINE):
+    """설정된 엔진으로 앙상블 생성 (실패 시 loop 엔진으로 대체)"""
+    if engine == "stacked":
+        try:
+            ens = StackedFoldEnsemble(models, weights)
+            print(f"[INFO] Ensemble engine: stacked ({ens.num_folds} folds, vmap)")
+            return ens.eval()
+        except Exception as e:
+            print(f"[WARN] Stacked ensemble 생성 실패, loop 엔진 사용: {e}")
+    elif engine != "loop":
+        print(f"[WARN] Unknown ensemble engine '{engine}', loop 엔진 사용")
+    return FoldLoopEnsemble(models, weights).eval()
+
+
+@torch.no_grad()
+def ensemble_predict_batch(bgr_imgs, sexes, models, weights, device, img_size=IMG_SIZE, batch_size=MAX_BATCH_SIZE, ensemble=None,
+                           return_folds_used=False):
+    """
+    여러 이미지에 대한 앙상블 예측 (fold당 배치 1회 forward)
+
+    Parameters:
+        bgr_imgs: BGR 이미지 리스트
+        sexes: 이미지별 성별 리스트 (1=남자, 0=여자)
+        batch_size: 한 번에 forward 할 최대 이미지 수 (메모리 제한)
+        ensemble: 앙상블 엔진 (build_ensemble). 지정 시 models/weights 대신 사용
+        return_folds_used: True이면 이미지별 실제 실행 fold 수도 함께 반환
+
+    Returns:
+        np.ndarray: 이미지별 가중 평균 뼈나이 (개월), shape (N,)
+            (return_folds_used=True이면 (뼈나이, 실행 fold 수) 튜플)
+    """
+    if len(bgr_imgs) != len(sexes):
+        raise ValueError(f"Length mismatch: {len(bgr_imgs)} images, {len(sexes)} sexes")
+    tfm = build_input_transform(img_size)
+    preds, folds_used = [np.zeros(0, dtype=np.float64)], [np.zeros(0, dtype=np.int64)]
+    step = max(1, int(batch_size or len(bgr_imgs)))
+    for i in range(0, len(bgr_imgs), step):
+        xs = [bgr_to_tensor(img, img_size, tfm) for img in bgr_imgs[i:i+step]]
+        pred, used = ensemble_predict_tensors(xs, sexes[i:i+step], models, weights, device, ensemble, return_folds_used=True)
+        preds.append(pred)
+        folds_used.append(used)
+    if return_folds_used:
+        return np.concatenate(preds), np.concatenate(folds_used)
+    return np.concatenate(preds)
+
+
+@torch.no_grad()
+def ensemble_predict_grays(grays, sexes, models, weights, device, img_size=IMG_SIZE, batch_size=MAX_BATCH_SIZE, ensemble=None,
+                           return_folds_used=False):
+    """
+    전처리된 그레이스케일 이미지들에 대한 앙상블 예측 (ensemble_predict_batch의 단일 채널 버전)
+
+    입력은 스레드별 재사용 버퍼(get_input_buffer)에 직접 변환되어 배치 텐서를 새로 만들지 않음
+    """
+    if len(grays) != len(sexes):
+        raise ValueError(f"Length mismatch: {len(grays)} images, {len(sexes)} sexes")
+    preds, folds_used = [np.zeros(0, dtype=np.float64)], [np.zeros(0, dtype=np.int64)]
+    step = max(1, int(batch_size or len(grays)))
+    buf = get_input_buffer(min(step, max(1, len(grays))), img_size)
+    for i in range(0, len(grays), step):
+        chunk = grays[i:i+step]
+        for j, g in enumerate(chunk):
+            gray_to_input(g, buf[j], img_size)
+        pred, used = ensemble_predict_tensors(buf[:len(chunk)], sexes[i:i+step], models, weights, device, ensemble,
+                                              return_folds_used=True)
+        preds.append(pred)
+        folds_used.append(used)
+    if return_folds_used:
+        return np.concatenate(preds), np.concatenate(folds_used)
+    return np.concatenate(preds)
+
+
+@torch.no_grad()
+def ensemble_predict_tensors(xs, sexes, models, weights, device, ensemble=None, return_folds_used=False):
+    """
+    변환 완료된 입력 텐서 리스트 [(3, H, W), ...] 또는 배치 텐서 (N, 3, H, W)를 한 배치로 앙상블 예측 (N,)
+
+    return_folds_used=True이면 (예측, 샘플별 실행 fold 수 (N,)) 튜플 반환
+    """
+    x = (xs if torch.is_tensor(xs) else torch.stack(list(xs))).to(device)
+    s = torch.tensor([int(v) for v in sexes], dtype=torch.long, device=device)
+    if ensemble is not None:
+        with stage_timer("ensemble"):
+            pred, fold_preds = ensemble(x, s)
+        pred = pred.cpu().numpy().astype(np.float64)
+        used = folds_used_from_preds(fold_preds.cpu()).numpy()
+    else:
+        with stage_timer("ensemble"):
+            outs = predict_folds(x, s, models)
+        pred = np.average(outs, axis=0, weights=weights)
+        used = np.full(len(pred), len(models), dtype=np.int64)
+    return (pred, used) if return_folds_used else pred
+
+
+@torch.no_grad()
+def ensemble_predict_single(bgr_img, sex, models, weights, device, img_size=IMG_SIZE, ensemble=None, return_folds_used=False):
+    """앙상블 예측 수행 (return_folds_used=True이면 (뼈나이, 실행 fold 수) 반환)"""
+    pred, used = ensemble_predict_batch([bgr_img], [sex], models, weights, device, img_size,
+                                        ensemble=ensemble, return_folds_used=True)
+    return (float(pred[0]), int(used[0])) if return_folds_used else float(pred[0])
+
+
+# =============================================================================
+# 마이크로 배칭 스케줄러 (동시 요청 → fold당 배치 forward 1회)
+# =============================================================================
+class MicroBatchScheduler:
+    """
+    짧은 시간창 동안 도착한 요청을 모아 batch_fn 한 번으로 처리하는 스케줄러
+
+    첫 요청이 도착하면 최대 max_wait_ms 동안(또는 max_batch_size개가 찰 때까지)
+    이후 요청을 모은 뒤 batch_fn(items)를 호출하고, 결과를 각 호출자에게 돌려줌.
+    batch_fn은 입력 리스트와 같은 길이/순서의 결과 시퀀스를 반환해야 함
+    (길이가 다르거나 예외 발생 시 아직 완료되지 않은 요청은 모두 예외로 완료되고 워커는 계속 동작).
+    """
+    def __init__(self, batch_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MICROBATCH_WAIT_MS):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0, "errors": 0}
+
+    @property
+    def queue_depth(self):
+        """대기 중인 요청 수"""
+        return self._queue.qsize()
+
+    def stats_snapshot(self):
+        """통계 복사본 (메트릭 출력용)"""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="MicroBatchScheduler", daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        """요청 1건 등록 후 Future 반환"""
+        self._ensure_worker()
+        fut = Future()
+        self._queue.put((item, fut, time.perf_counter()))
+        return fut
+
+    def predict(self, item, timeout=None):
+        """요청 1건 등록 후 결과가 나올 때까지 대기"""
+        return self.submit(item).result(timeout=timeout)
+
+    def shutdown(self):
+        """워커 종료 (대기 중인 요청은 처리 후 종료)"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = []
+            try:
+                batch = self._collect(first)
+                self._process(batch)
+            except BaseException as e:
+                # 어떤 예외에도 워커 스레드가 종료되지 않도록, 남은 요청만 실패 처리
+                with self._stats_lock:
+                    self.stats["errors"] += 1
+                for entry in batch or [first]:
+                    fut = entry[1]
+                    if not fut.done():
+                        fut.set_exception(e if isinstance(e, Exception) else RuntimeError(f"Scheduler error: {e!r}"))
+                print(f"[WARN] 마이크로 배치 처리 실패: {e!r}")
+
+    def _process(self, batch):
+        if METRICS_ENABLED:
+            now = time.perf_counter()
+            for _, _, t_submit in batch:
+                stage_latency.observe(("microbatch_wait",), now - t_submit)
+        running = [(item, fut) for item, fut, _ in batch if fut.set_running_or_notify_cancel()]
+        if not running:
+            return
+        results = list(self.batch_fn([item for item, _ in running]))
+        if len(results) != len(running):
+            raise RuntimeError(f"batch_fn returned {len(results)} results for {len(running)} items")
+        for (_, fut), res in zip(running, results):
+            fut.set_result(res)
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["items"] += len(running)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(running))
+
+
+def create_ensemble_scheduler(max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MICROBATCH_WAIT_MS):
+    """
+    fold 앙상블 앞단의 마이크로 배칭 스케줄러 생성
+
+    요청 항목은 (입력 텐서 (3, H, W), 성별) 튜플이며 결과는 (가중 평균 뼈나이(개월), 실행 fold 수)
+    """
+    def batch_fn(items):
+        resources = load_resources()
+        preds, used = ensemble_predict_tensors(
+            [x for x, _ in items], [s for _, s in items],
+            resources["models"], resources["weights"], DEVICE, resources["ensemble"], return_folds_used=True
+        )
+        return [(float(p), int(u)) for p, u in zip(preds, used)]
+    return MicroBatchScheduler(batch_fn, max_batch_size, max_wait_ms)
+
+
+# =============================================================================
+# Backbone 특징 캐시 (콘텐츠 해시 → fold별 pooled 특징)
+#   sex FiLM은 pooled backbone 특징 이후에 적용되므로, 같은 이미지/전처리/모델이면
+#   특징을 재사용하고 FiLM + head만 다시 실행 (재분석 시 수 초 → 수 ms)
+# =============================================================================
+_SPILL_NAME_RE = re.compile(r"[0-9a-f]{40}\.npy")
+
+
+class FeatureCache:
+    """
+    fold별 pooled 특징 (F, nf) LRU 캐시 (스레드 안전)
+
+    spill_dir 지정 시 메모리에서 밀려난 항목을 <key>.npy로 저장하고, 메모리 miss 시 디스크에서 복원.
+    spill 파일은 최대 spill_max개까지 유지 (초과 시 수정 시각이 오래된 파일부터 삭제, 디스크 hit 시 갱신)하고
+    clear() 시 함께 삭제 (이미지 유래 특징이 디스크에 무기한 남지 않도록)
+    """
+    def __init__(self, max_items, spill_dir=None, spill_max=FEATURE_CACHE_SPILL_MAX):
+        self.max_items = max(1, int(max_items))
+        self.spill_dir = spill_dir or None
+        self.spill_max = max(1, int(spill_max))
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spill_count = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "spilled": 0, "spill_evicted": 0}
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, mode=0o700, exist_ok=True)
+            self._spill_count = len(self._spill_files())
+            self._prune_spill()
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.npy")
+
+    def _spill_files(self):
+        """spill 디렉터리의 캐시 파일 경로 (feature_cache_key 형식 이름만, 다른 파일은 건드리지 않음)"""
+        return [os.path.join(self.spill_dir, name) for name in os.listdir(self.spill_dir)
+                if _SPILL_NAME_RE.fullmatch(name)]
+
+    def _prune_spill(self):
+        """spill 파일이 spill_max개를 넘으면 수정 시각이 오래된 순으로 spill_max의 90%까지 삭제"""
+        with self._spill_lock:
+            if self._spill_count <= self.spill_max:
+                return
+            files = []
+            for path in self._spill_files():
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+            files.sort()
+            removed = 0
+            for _, path in files[:max(0, len(files) - int(self.spill_max * 0.9))]:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+            self._spill_count = len(files) - removed
+        with self._lock:
+            self.stats["spill_evicted"] += removed
+
+    def get(self, key):
+        """캐시 조회 (없으면 None)"""
+        with self._lock:
+            feats = self._items.get(key)
+            if feats is not None:
+                self._items.move_to_end(key)
+                self.stats["hits"] += 1
+                return feats
+        if self.spill_dir and os.path.exists(self._spill_path(key)):
+            try:
+                feats = np.load(self._spill_path(key))
+                os.utime(self._spill_path(key))  # 최근 사용 파일이 먼저 삭제되지 않도록
+            except Exception as e:
+                print(f"[WARN] 특징 캐시 파일 로드 실패: {e}")
+            else:
+                self.put(key, feats)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return feats
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, feats):
+        """캐시 저장 (초과 시 가장 오래된 항목 제거 또는 디스크 spill)"""
+        evicted = []
+        with self._lock:
+            self._items[key] = feats
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                evicted.append(self._items.popitem(last=False))
+        if not self.spill_dir:
+            return
+        for k, v in evicted:
+            path = self._spill_path(k)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                existed = os.path.exists(path)
+                with open(tmp, "wb") as f:
+                    np.save(f, v)
+                os.replace(tmp, path)
+            except Exception as e:
+                print(f"[WARN] 특징 캐시 spill 실패: {e}")
+                continue
+            with self._lock:
+                self.stats["spilled"] += 1
+            if not existed:
+                with self._spill_lock:
+                    self._spill_count += 1
+        self._prune_spill()
+
+    def clear(self):
+        """메모리 항목과 디스크 spill 파일 삭제 (리소스 재로드 시 호출)"""
+        with self._lock:
+            self._items.clear()
+        if self.spill_dir:
+            with self._spill_lock:
+                for path in self._spill_files():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                self._spill_count = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+_feature_cache = FeatureCache(FEATURE_CACHE_SIZE, FEATURE_CACHE_DIR) if FEATURE_CACHE_SIZE > 0 else None
+
+
+def _file_signature(path):
+    st = os.stat(path) if os.path.exists(path) else None
+    return f"{path}|{st.st_size if st else 0}|{st.st_mtime_ns if st else 0};"
+
+
+def model_fingerprint(model_paths=None):
+    """실제 로드되는 체크포인트(.safetensors 우선)의 경로/크기/수정시각과 양자화·컴파일 설정의 해시 (특징 캐시 키에 포함)"""
+    h = hashlib.blake2b(digest_size=8)
+    for p in (model_paths or MODEL_PATHS):
+        h.update(_file_signature(checkpoint_path_for(p)).encode())
+    h.update(f"{QUANTIZE_MODE}|{COMPILE_MODE}|{IMG_SIZE}".encode())
+    return h.hexdigest()
+
+
+def preprocess_fingerprint():
+    """
+    전처리 설정 중 preprocess_config 밖의 전역값 해시 (특징 캐시 키에 포함)
+
+    전처리 엔진, ROI 탐색 해상도/파라미터, 입력 정규화, 전처리 기준 JSON(크기/수정시각)
+    """
+    roi_params = (CROP_PCT, PREPROC_MODE, BILAT_D, BILAT_SIGMA_COLOR, BILAT_SIGMA_SPACE, MEDIAN_K, GAUSS_K,
+                  CLAHE_CLIP, CLAHE_TILE, THRESH_MODE, BLOCK_SIZE_RAW, C_SHIFTED, GLOBAL_T, INVERT,
+                  OPEN_KS, CLOSE_KS, ERODE_KS, DILATE_KS, MORPH_ITER, FILL_HOLES,
+                  MIN_AREA_PCT, MAX_AREA_PCT, CENTRAL_WINDOW_PCT,
+                  SELECTION_MODE, W_AREA, W_LENGTH, W_SOLIDITY, W_CENTER, CENTRAL_BIAS,
+                  APPLY_MASK_INSIDE_CROP, CROP_MARGIN)
+    h = hashlib.blake2b(digest_size=8)
+    h.update(f"{PREPROCESS_ENGINE}|{ROI_MAX_SIDE}|{STD_RESIZE_SHORT}|{DECODE_MIN_SHORT}|{IMG_SIZE}|"
+             f"{INPUT_MEAN}|{INPUT_STD}|{roi_params}|".encode())
+    h.update(_file_signature(CRITERIA_JSON_PATH).encode())
+    return h.hexdigest()
+
+
+def feature_cache_key(image_bytes, config, model_tag):
+    """인코딩된 이미지 바이트 + 전처리 설정 + 모델 태그(체크포인트 + 전처리 전역값)의 콘텐츠 해시"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(memoryview(image_bytes).cast("B"))
+    h.update(json.dumps(config, sort_keys=True).encode())
+    h.update(f"{PREPROCESS_ENGINE}|{ROI_MAX_SIDE}|{model_tag}".encode())
+    return h.hexdigest()
+
+
+def build_feature_engine(models, ensemble, weights):
+    """특징 캐시에 사용할 loop 엔진 (torch fold 모델이 없으면 None - onnx/sharded 백엔드)"""
+    base = ensemble.base if isinstance(ensemble, AdaptiveFoldEnsemble) else ensemble
+    if isinstance(base, FoldLoopEnsemble):
+        return base
+    if models:
+        # stacked 엔진의 fold 모델은 쌓인 파라미터의 view를 공유하므로 추가 메모리 없음
+        return FoldLoopEnsemble(models, weights).eval()
+    return None
+
+
+@torch.no_grad()
+def predict_with_feature_cache(key, make_input, sex, engine, cache):
+    """
+    특징 캐시를 거쳐 단일 이미지 앙상블 예측
+
+    Parameters:
+        make_input: 캐시 miss 시에만 호출되는 입력 텐서 (1, 3, H, W) 생성 함수 (전처리 포함)
+
+    Returns:
+        (가중 평균 뼈나이, 실행 fold 수, 캐시 hit 여부)
+    """
+    feats = cache.get(key)
+    hit = feats is not None
+    if not hit:
+        x = make_input().to(DEVICE)
+        with stage_timer("feature_backbone"):
+            feats = engine.forward_features(x)[:, 0].cpu().numpy()
+        cache.put(key, feats)
+    s = torch.tensor([int(sex)], dtype=torch.long, device=DEVICE)
+    with stage_timer("feature_heads"):
+        pred, fold_preds = engine.forward_heads(torch.from_numpy(feats).to(DEVICE)[:, None], s)
+    return float(pred[0]), int(fold_preds.shape[0]), hit
+
+
+def clamp_boneage(pred, age_current, max_dev=BONEAGE_MAX_DEVIATION):
+    """뼈나이 범위 제한"""
+    lo = age_current - max_dev
+    hi = age_current + max_dev
+    if pred < lo:
+        return lo, True, pred
+    if pred > hi:
+        return hi, True, pred
+    return pred, False, pred
+
+
+# =============================================================================
+# LMS 기반 PAH 계산
+# =============================================================================
+def normalize_sex_value(v):
+    """성별 값 정규화"""
+    if pd.isna(v):
+        return None
+    s = str(v).strip().lower()
+    if s in ["1", "m", "male", "남", "boy"]:
+        return "male"
+    if s in ["2", "f", "female", "여", "girl"]:
+        return "female"
+    return None
+
+
+_SCALAR_TYPES = (int, float, np.number)
+
+
+def z_from_x(x, L, M, S):
+    """키에서 Z-score 계산 (스칼라 또는 배열)"""
+    if isinstance(x, _SCALAR_TYPES) and isinstance(L, _SCALAR_TYPES):
+        if abs(L) < 1e-12:
+            return math.log(x/M) / S
+        return ((x/M)**L - 1.0) / (L*S)
+    x, L, M, S = (np.asarray(v, dtype=np.float64) for v in (x, L, M, S))
+    small = np.abs(L) < 1e-12
+    L_safe = np.where(small, 1.0, L)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(small, np.log(x/M) / S, ((x/M)**L_safe - 1.0) / (L_safe*S))
+    return float(z) if z.ndim == 0 else z
+
+
+def x_from_z(z, L, M, S):
+    """Z-score에서 키 계산 (스칼라 또는 배열)"""
+    if isinstance(z, _SCALAR_TYPES) and isinstance(L, _SCALAR_TYPES):
+        if abs(L) < 1e-12:
+            return M * math.exp(S*z)
+        return M * (1.0 + L*S*z)**(1.0/L)
+    z, L, M, S = (np.asarray(v, dtype=np.float64) for v in (z, L, M, S))
+    small = np.abs(L) < 1e-12
+    L_safe = np.where(small, 1.0, L)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(small, M * np.exp(S*z), M * (1.0 + L_safe*S*z)**(1.0/L_safe))
+    return float(x) if x.ndim == 0 else x
+
+
+def percentile_from_z(z):
+    """Z-score → 백분위 (%) (스칼라는 NormalDist().cdf, 배열은 벡터화된 표준정규 CDF ndtr)"""
+    if isinstance(z, _SCALAR_TYPES):
+        return NormalDist().cdf(float(z)) * 100.0
+    return ndtr(np.asarray(z, dtype=np.float64)) * 100.0
+
+
+def load_lms_data(csv_path):
+    """LMS 데이터 로드"""
+    df = pd.read_csv(csv_path)
+    df["sex_std"] = df["Sex"].apply(normalize_sex_value)
+    return df
+
+
+class LMSTable:
+    """
+    성별 LMS 기준표 (월 단위 dense grid NumPy 배열)
+
+    CSV를 한 번만 읽어 성별 (2, G) 배열로 보관하고 성인(ADULT_MONTHS) L/M/S는 미리 계산.
+    조회는 grid 인덱스 산술 + 선형 보간으로 수행하며 스칼라/배열 모두 지원 (pandas 미사용).
+    grid 간격은 원본 월 간격의 최솟값이므로 원본이 등간격이면 기존 np.interp 결과와 동일
+    """
+    def __init__(self, lms_df, adult_months=ADULT_MONTHS):
+        tables = {}
+        for sex_std in ("female", "male"):
+            df = lms_df[lms_df["sex_std"] == sex_std][["Month", "L", "M", "S"]].dropna().sort_values("Month")
+            if df.empty:
+                raise ValueError(f"No data for {sex_std}")
+            tables[sex_std] = df.to_numpy(dtype=np.float64)
+        steps = [np.diff(t[:, 0]) for t in tables.values()]
+        step = float(min(d[d > 0].min() for d in steps if np.any(d > 0)))
+        lo = min(t[0, 0] for t in tables.values())
+        hi = max(t[-1, 0] for t in tables.values())
+        self.months = np.arange(lo, hi + step / 2, step)
+        self.step = step
+        # [0]=여자, [1]=남자. 성별 범위 밖은 양 끝값 유지 (기존 clip과 동일)
+        self.L, self.M, self.S = (
+            np.stack([np.interp(self.months, tables[k][:, 0], tables[k][:, c]) for k in ("female", "male")])
+            for c in (1, 2, 3)
+        )
+        # 스칼라 조회용 파이썬 리스트 (요청 1건 경로에서 numpy 오버헤드 제거)
+        self._lo, self._hi = float(self.months[0]), float(self.months[-1])
+        self._rows = [tuple(v[r].tolist() for v in (self.L, self.M, self.S)) for r in (0, 1)]
+        self.adult_months = float(adult_months)
+        self.L_ad, self.M_ad, self.S_ad = self.lookup(np.full(2, self.adult_months), np.array([0, 1]))
+        self._adult_scalar = [tuple(float(v[r]) for v in (self.L_ad, self.M_ad, self.S_ad)) for r in (0, 1)]
+
+    @staticmethod
+    def sex_index(sex):
+        """성별 값(1=남자, 그 외=여자) → 배열 행 인덱스"""
+        return (np.asarray(sex) == 1).astype(np.intp)
+
+    def lookup(self, months, sex):
+        """개월 수/성별 (스칼라 또는 배열)에 대한 (L, M, S) 선형 보간"""
+        if isinstance(months, _SCALAR_TYPES) and isinstance(sex, _SCALAR_TYPES):
+            t = min(max(float(months), self._lo), self._hi)
+            i = min(int((t - self._lo) // self.step), len(self.months) - 2)
+            f = (t - self._lo) / self.step - i
+            row = self._rows[1 if sex == 1 else 0]
+            return tuple(v[i] * (1.0 - f) + v[i + 1] * f for v in row)
+        t = np.clip(np.asarray(months, dtype=np.float64), self.months[0], self.months[-1])
+        pos = (t - self.months[0]) / self.step
+        i = np.minimum(np.floor(pos).astype(np.intp), len(self.months) - 2)
+        f = pos - i
+        r = self.sex_index(sex)
+        out = tuple(v[r, i] * (1.0 - f) + v[r, i + 1] * f for v in (self.L, self.M, self.S))
+        if np.ndim(out[0]) == 0:
+            return tuple(float(v) for v in out)
+        return out
+
+    def adult(self, sex, adult_months=None):
+        """성인 L/M/S (기본 ADULT_MONTHS는 캐시 값 사용)"""
+        if adult_months is not None and float(adult_months) != self.adult_months:
+            return self.lookup(np.broadcast_to(float(adult_months), np.shape(sex)), sex)
+        if isinstance(sex, _SCALAR_TYPES):
+            return self._adult_scalar[1 if sex == 1 else 0]
+        r = self.sex_index(sex)
+        out = (self.L_ad[r], self.M_ad[r], self.S_ad[r])
+        if np.ndim(r) == 0:
+            return tuple(float(v) for v in out)
+        return out
+
+
+@functools.lru_cache(maxsize=None)
+def load_lms_table(csv_path=LMS_CSV_PATH):
+    """LMS.csv를 LMSTable로 1회 로드 (경로별 캐시)"""
+    return LMSTable(load_lms_data(csv_path))
+
+
+def as_lms_table(lms):
+    """LMSTable 또는 load_lms_data DataFrame을 LMSTable로 (기존 DataFrame 호출 호환)"""
+    return lms if isinstance(lms, LMSTable) else LMSTable(lms)
+
+
+def get_lms_interpolators(lms_df, sex):
+    """LMS 보간 함수 생성"""
+    table = as_lms_table(lms_df)
+    return (lambda t: table.lookup(t, sex)[0], lambda t: table.lookup(t, sex)[1], lambda t: table.lookup(t, sex)[2])
+
+
+def calculate_pah_lms(height, boneage_months, sex, lms_df, adult_months=216.0):
+    """LMS 기반 PAH 계산 (lms_df: LMSTable 또는 DataFrame, 배열 입력 지원)"""
+    table = as_lms_table(lms_df)
+    L_ba, M_ba, S_ba = table.lookup(boneage_months, sex)
+    Z_ba = z_from_x(height, L_ba, M_ba, S_ba)
+    percentile_ba = percentile_from_z(Z_ba)
+    L_ad, M_ad, S_ad = table.adult(sex, adult_months)
+    pah_lms = x_from_z(Z_ba, L_ad, M_ad, S_ad)
+    return {
+        "Z_score_boneage": Z_ba,
+        "percentile_boneage": percentile_ba,
+        "PAH_LMS": pah_lms,
+        "L_ba": L_ba, "M_ba": M_ba, "S_ba": S_ba,
+        "L_ad": L_ad, "M_ad": M_ad, "S_ad": S_ad
+    }
+
+
+def calculate_height_percentile(height, age_months, sex, lms_df):
+    """현재 키 백분위 계산"""
+    L_ca, M_ca, S_ca = as_lms_table(lms_df).lookup(age_months, sex)
+    Z_ca = z_from_x(height, L_ca, M_ca, S_ca)
+    return {
+        "Z_score_current": Z_ca,
+        "percentile_current": percentile_from_z(Z_ca)
+    }
+
+
+def adult_height_percentile(adult_height, sex, lms_df, adult_months=216.0):
+    """성인 키 기준 (Z-score, 백분위) - PAH_Final/MPH/PAH_LMS 백분위 공통"""
+    L_ad, M_ad, S_ad = as_lms_table(lms_df).adult(sex, adult_months)
+    z = z_from_x(adult_height, L_ad, M_ad, S_ad)
+    return z, percentile_from_z(z)
+
+
+def calculate_pah_final_percentile(pah_final, sex, lms_df, adult_months=216.0):
+    """최종 PAH 백분위 계산"""
+    Z_pah, percentile_pah = adult_height_percentile(pah_final, sex, lms_df, adult_months)
+    return {
+        "Z_score_pah_final": Z_pah,
+        "percentile_pah_final": percentile_pah
+    }
+
+
+def calculate_mph_percentile(mph, sex, lms_df, adult_months=216.0):
+    """MPH(유전 기반 예측 키) 백분위 계산"""
+    Z_mph, percentile_mph = adult_height_percentile(mph, sex, lms_df, adult_months)
+    return {
+        "Z_score_mph": Z_mph,
+        "percentile_mph": percentile_mph
+    }
+
+
+def calculate_pah_lms_percentile(pah_lms, sex, lms_df, adult_months=216.0):
+    """PAH_LMS(성장곡선 기반 예측 키) 백분위 계산"""
+    Z_pah_lms, percentile_pah_lms = adult_height_percentile(pah_lms, sex, lms_df, adult_months)
+    return {
+        "Z_score_pah_lms": Z_pah_lms,
+        "percentile_pah_lms": percentile_pah_lms
     }
 
 
@@ -686,22 +2467,261 @@ def calibrate_pah(height, pah_lms, father_height, mother_height, male, age_curre
     return result
 
 
+# =============================================================================
+# Isotonic Calibrator (병원별 레지스트리 + np.interp 컴파일)
+#   sklearn IsotonicRegression.predict는 호출마다 입력 검증/scipy interp1d를 거치므로
+#   학습된 구간 배열(X_thresholds_, y_thresholds_)만 꺼내 np.interp로 평가 (결과 동일)
+# =============================================================================
+_HOSPITAL_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_hospital_id(hospital_id):
+    """병원 ID 형식 검사 (영문/숫자/_/- 64자 이내, Calibrator 파일명으로 사용)"""
+    return bool(_HOSPITAL_ID_RE.match(str(hospital_id)))
+
+
+class CompiledIsotonic:
+    """학습된 IsotonicRegression의 구간 배열 + np.interp 평가 (predict 호환)"""
+    def __init__(self, x, y, out_of_bounds="clip", source=None):
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.out_of_bounds = out_of_bounds
+        self.source = source
+        # clip: 구간 밖은 양 끝 값 (np.interp 기본 동작), nan: NaN
+        self._edge = np.nan if out_of_bounds == "nan" else None
+
+    @classmethod
+    def from_isotonic(cls, model, source=None):
+        return cls(model.X_thresholds_, model.y_thresholds_, getattr(model, "out_of_bounds", "clip"), source)
+
+    def predict(self, values):
+        v = np.asarray(values, dtype=np.float64).reshape(-1)
+        if self.out_of_bounds == "raise" and v.size and (v.min() < self.x[0] or v.max() > self.x[-1]):
+            raise ValueError("Isotonic Calibrator 입력이 학습 범위를 벗어남")
+        return np.interp(v, self.x, self.y, left=self._edge, right=self._edge)
+
+    def __call__(self, value):
+        return float(self.predict([value])[0])
+
+
+def compile_calibrator(model, source=None):
+    """IsotonicRegression이면 CompiledIsotonic으로 변환 (그 외 predict 가능한 객체는 그대로 사용)"""
+    if isinstance(model, CompiledIsotonic) or not hasattr(model, "X_thresholds_"):
+        return model
+    return CompiledIsotonic.from_isotonic(model, source)
+
+
+def load_calibrator_file(path):
+    """joblib Calibrator 파일 로드 + 컴파일"""
+    from joblib import load as joblib_load
+    return compile_calibrator(joblib_load(path), os.path.basename(path))
+
+
+class CalibratorRegistry:
+    """
+    병원 ID별 Isotonic Calibrator 레지스트리 (스레드 안전)
+
+    - 최초 요청 시 <base_dir>/<병원 ID>.joblib 로드 (없으면 기본 Calibrator 사용), LRU로 max_items개 유지
+    - check_sec마다 파일 수정시각/크기를 확인하여 변경 시 재로드 (재시작 불필요), 삭제 시 기본값으로 복귀
+    - 재로드 실패(쓰는 중인 파일 등) 시 이전 Calibrator 유지
+    - 파일 확인/로드는 잠금 밖에서 키당 한 스레드만 수행하며, 그동안 다른 요청은 이전 Calibrator를 사용
+      (첫 로드 중인 병원의 요청만 완료를 기다림, 다른 병원 요청은 막히지 않음)
+    """
+    def __init__(self, base_dir, default_path, max_items=CALIBRATOR_CACHE_SIZE, check_sec=CALIBRATOR_CHECK_SEC):
+        self.base_dir = base_dir
+        self.default_path = default_path
+        self.max_items = max(1, int(max_items))
+        self.check_sec = float(check_sec)
+        self._default = None  # (calibrator, stat_key, checked_at)
+        self._items = OrderedDict()  # 병원 ID → (calibrator, stat_key, checked_at)
+        self._inflight = {}  # 확인/로드 중인 키 (기본값은 None) → threading.Event
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0, "errors": 0}
+
+    def path_for(self, hospital_id):
+        if not is_valid_hospital_id(hospital_id):
+            raise ValueError(f"잘못된 병원 ID: {hospital_id!r} (영문/숫자/_/- 64자 이내)")
+        return os.path.join(self.base_dir, f"{hospital_id}.joblib")
+
+    @staticmethod
+    def _stat_key(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self, entry, path, now):
+        """
+        파일 변경 여부 확인 후 필요 시 재로드 (잠금 없이 호출)
+
+        Returns:
+            (새 entry, 통계 이벤트 이름 또는 None)
+        """
+        key = self._stat_key(path)
+        if entry is not None and key == entry[1]:
+            return (entry[0], key, now), None
+        if key is None:
+            return (None, None, now), None
+        try:
+            cal = load_calibrator_file(path)
+        except Exception as e:
+            print(f"[WARN] Isotonic Calibrator 로드 실패 ({path}): {e}")
+            return (entry[0] if entry is not None else None, key, now), "errors"
+        if entry is not None and entry[0] is not None:
+            print(f"[INFO] Isotonic Calibrator 재로드됨: {os.path.basename(path)}")
+            return (cal, key, now), "reloads"
+        return (cal, key, now), "loads"
+
+    def _resolve(self, hospital_id, path):
+        """키(None이면 기본값)의 Calibrator 조회, 확인 주기가 지났으면 잠금 밖에서 갱신"""
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._default if hospital_id is None else self._items.get(hospital_id)
+                if entry is not None and hospital_id is not None:
+                    self._items.move_to_end(hospital_id)
+                if entry is not None and now - entry[2] < self.check_sec:
+                    self.stats["hits"] += 1
+                    return entry[0]
+                pending = self._inflight.get(hospital_id)
+                if pending is None:
+                    pending = self._inflight[hospital_id] = threading.Event()
+                    break
+            # 다른 스레드가 확인/로드 중: 이전 값이 있으면 그대로 사용, 첫 로드면 완료 후 다시 조회
+            if entry is not None:
+                return entry[0]
+            pending.wait()
+
+        new_entry, event = None, None
+        try:
+            new_entry, event = self._refresh(entry, path, now)
+        finally:
+            with self._lock:
+                if new_entry is not None:
+                    if hospital_id is None:
+                        self._default = new_entry
+                    else:
+                        self._items[hospital_id] = new_entry
+                        self._items.move_to_end(hospital_id)
+                        while len(self._items) > self.max_items:
+                            self._items.popitem(last=False)
+                            self.stats["evictions"] += 1
+                if event:
+                    self.stats[event] += 1
+                del self._inflight[hospital_id]
+            pending.set()
+        return new_entry[0]
+
+    def get_default(self):
+        """기본 Calibrator (파일이 없으면 None)"""
+        return self._resolve(None, self.default_path)
+
+    def get(self, hospital_id=None):
+        """
+        병원 ID의 Calibrator (병원 파일이 없으면 기본 Calibrator, 둘 다 없으면 None)
+
+        Raises:
+            ValueError: 병원 ID 형식이 잘못된 경우
+        """
+        if hospital_id in (None, ""):
+            return self.get_default()
+        cal = self._resolve(hospital_id, self.path_for(hospital_id))
+        return cal if cal is not None else self.get_default()
+
+    def clear(self):
+        with self._lock:
+            self._default = None
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+_calibrator_registry = CalibratorRegistry(HOSPITAL_CALIBRATOR_DIR, ISOTONIC_CALIBRATOR_PATH)
+
+
+def get_calibrator(hospital_id=None):
+    """병원 ID별 Isotonic Calibrator (predict_bone_age / predict_bone_age_batch 공통)"""
+    return _calibrator_registry.get(hospital_id)
+
+
 # =============================================================================
 # 모델 캐시 (싱글톤 패턴)
 # =============================================================================
 _model_cache = {
     "models": None,
     "weights": None,
+    "ensemble": None,
     "criteria": None,
-    "lms_df": None,
-    "calibrator": None
+    "lms": None,
+    "calibrator": None,
+    "feature_engine": None,
+    "feature_tag": None
+}
+
+# 로드/워밍업 상태 (readiness 확인용)
+#   state: not_loaded → loading → loaded → warming → ready (실패 시 failed)
+_load_lock = threading.RLock()
+_load_status = {
+    "state": "not_loaded",
+    "backend": None,
+    "error": None,
+    "load_started_at": None,
+    "load_finished_at": None,
+    "load_seconds": {},
+    "warmup_latency_ms": {},
 }
 
 
+def load_ensemble_weights(path):
+    """OOF 앙상블 가중치 로드 (리스트 형태와 딕셔너리 형태 모두 지원)"""
+    with open(path, "r") as f:
+        weights_data = json.load(f)
+    if isinstance(weights_data, list):
+        return weights_data
+    if isinstance(weights_data, dict):
+        return [weights_data[f"fold{i}"] for i in range(1, 6)]
+    raise ValueError(f"Unexpected weights format: {type(weights_data)}")
+
+
+def get_load_status():
+    """리소스 로드/워밍업 상태 조회 (복사본)"""
+    with _load_lock:
+        return copy.deepcopy(_load_status)
+
+
+def render_metrics():
+    """
+    모델 파이프라인 메트릭 (Prometheus 텍스트 형식 줄 리스트)
+
+    단계별/fold별 지연 시간 히스토그램, 모델 로드 단계별 시간, 워밍업 지연, 특징 캐시 통계
+    """
+    status = get_load_status()
+    lines = stage_latency.render() + fold_latency.render()
+    lines += render_samples("osteoage_model_ready", "1 if models are loaded and warmed up",
+                            [((), int(status["state"] == "ready"))])
+    lines += render_samples("osteoage_model_load_seconds", "Resource load time by step (last load)",
+                            [((k,), v) for k, v in sorted(status["load_seconds"].items())], ("step",))
+    lines += render_samples("osteoage_warmup_latency_seconds", "Warmup forward latency by batch size",
+                            [((bs,), ms / 1000.0) for bs, ms in sorted(status["warmup_latency_ms"].items())], ("batch_size",))
+    lines += render_samples("osteoage_calibrator_cached", "Hospital calibrators held in memory",
+                            [((), len(_calibrator_registry))])
+    lines += render_samples("osteoage_calibrator_events_total", "Calibrator registry lookups/loads by event",
+                            [((k,), v) for k, v in sorted(_calibrator_registry.stats.items())], ("event",), "counter")
+    if _feature_cache is not None:
+        lines += render_samples("osteoage_feature_cache_events_total", "Feature cache lookups by result",
+                                [((k,), v) for k, v in sorted(_feature_cache.stats.items())], ("event",), "counter")
+    return lines
+
+
 def load_resources(force_reload=False):
     """
     모델 및 데이터 리소스 로드 (캐싱)
     
+    여러 스레드에서 동시에 호출되어도 한 번만 로드되며, 단계별 소요 시간은
+    get_load_status()["load_seconds"]에 기록됨
+    
     Parameters:
         force_reload: True이면 캐시 무시하고 다시 로드
     
@@ -710,67 +2730,275 @@ def load_resources(force_reload=False):
     """
     global _model_cache
     
-    if not force_reload and _model_cache["models"] is not None:
+    if not force_reload and _model_cache["ensemble"] is not None:
         return _model_cache
     
+    with _load_lock:
+        if not force_reload and _model_cache["ensemble"] is not None:
+            return _model_cache
+        _load_status.update(state="loading", error=None, load_started_at=time.time(),
+                            load_finished_at=None, load_seconds={}, warmup_latency_ms={})
+        try:
+            _load_resources_locked(_load_status["load_seconds"])
+        except Exception as e:
+            _load_status.update(state="failed", error=str(e))
+            raise
+        _load_status.update(state="loaded", load_finished_at=time.time(), backend=_model_cache["ensemble"].name)
+        return _model_cache
+
+
+def _load_resources_locked(timings):
+    """load_resources 본체 (_load_lock 보유 상태에서 호출)"""
     print("[리소스 로드 중...]")
+    t_total = time.perf_counter()
     
-    # 모델 로드
-    _model_cache["models"] = load_fold_models(DEVICE, MODEL_PATHS)
+    _model_cache["ensemble"] = None
     
     # 앙상블 가중치 로드
-    with open(WEIGHT_PATH, "r") as f:
-        weights_data = json.load(f)
+    _model_cache["weights"] = load_ensemble_weights(WEIGHT_PATH)
     
-    # 리스트 형태와 딕셔너리 형태 모두 지원
-    if isinstance(weights_data, list):
-        _model_cache["weights"] = weights_data
-    elif isinstance(weights_data, dict):
-        _model_cache["weights"] = [weights_data[f"fold{i}"] for i in range(1, 6)]
-    else:
-        raise ValueError(f"Unexpected weights format: {type(weights_data)}")
+    # 추론 백엔드 구성 (INFERENCE_BACKEND: 모델 로드/양자화/엔진)
+    models, ensemble = build_backend(_model_cache["weights"], timings=timings)
+    ensemble = make_adaptive_ensemble(ensemble)
     
     # 전처리 기준 로드
     _model_cache["criteria"] = load_criteria(CRITERIA_JSON_PATH)
     
     # LMS 데이터 로드
-    _model_cache["lms_df"] = load_lms_data(LMS_CSV_PATH)
+    t = time.perf_counter()
+    load_lms_table.cache_clear()
+    _model_cache["lms"] = load_lms_table(LMS_CSV_PATH)
+    timings["lms"] = round(time.perf_counter() - t, 3)
     
-    # Isotonic Calibrator 로드 (있는 경우)
-    if os.path.exists(ISOTONIC_CALIBRATOR_PATH):
-        try:
-            from joblib import load as joblib_load
-            _model_cache["calibrator"] = joblib_load(ISOTONIC_CALIBRATOR_PATH)
-            print(f"[INFO] Isotonic Calibrator 로드됨")
-        except Exception as e:
-            print(f"[WARN] Isotonic Calibrator 로드 실패: {e}")
-            _model_cache["calibrator"] = None
+    # 기본 Isotonic Calibrator 로드 (있는 경우, 병원별 Calibrator는 요청 시 로드)
+    t = time.perf_counter()
+    _calibrator_registry.clear()
+    _model_cache["calibrator"] = _calibrator_registry.get_default()
+    if _model_cache["calibrator"] is not None:
+        print(f"[INFO] Isotonic Calibrator 로드됨")
+    elif os.path.exists(ISOTONIC_CALIBRATOR_PATH):
+        print(f"[WARN] Isotonic Calibrator 로드 실패: {ISOTONIC_CALIBRATOR_PATH}")
     else:
         print(f"[INFO] Isotonic Calibrator 없음 (경로: {ISOTONIC_CALIBRATOR_PATH})")
-        _model_cache["calibrator"] = None
+    timings["calibrator"] = round(time.perf_counter() - t, 3)
+    
+    # 특징 캐시용 엔진/모델 태그 (torch 백엔드 전용, 재로드 시 메모리 캐시와 spill 파일 비움)
+    if _feature_cache is not None:
+        _feature_cache.clear()
+        _model_cache["feature_engine"] = build_feature_engine(models, ensemble, _model_cache["weights"])
+        _model_cache["feature_tag"] = f"{model_fingerprint(MODEL_PATHS)}|{preprocess_fingerprint()}"
+        if _model_cache["feature_engine"] is None:
+            print(f"[WARN] 특징 캐시는 torch 백엔드 전용 ({ensemble.name}) → 사용 안 함")
+    
+    # ensemble은 마지막에 설정 (load_resources의 잠금 없는 캐시 확인 기준)
+    _model_cache["models"] = models
+    _model_cache["ensemble"] = ensemble
+    timings["total"] = round(time.perf_counter() - t_total, 3)
+    print(f"[리소스 로드 완료] ({timings['total']:.1f}s)")
+
+
+@torch.no_grad()
+def warmup_resources(batch_sizes=(1,), img_size=IMG_SIZE):
+    """
+    리소스 로드 후 더미 입력으로 앙상블 forward를 실행하여 첫 요청 지연 제거
+
+    Parameters:
+        batch_sizes: 워밍업할 배치 크기 목록 (서빙할 배치 크기 포함 권장)
+        img_size: 더미 입력 크기 (모델 입력 크기와 동일해야 함)
+
+    Returns:
+        dict: get_load_status() 결과
+    """
+    resources = load_resources()
+    with _load_lock:
+        _load_status["state"] = "warming"
+    latency_ms = {}
+    # 엔진이 요구하는 워밍업 배치 크기 포함 (예: inductor 컴파일 그래프)
+    sizes = sorted({max(1, int(bs)) for bs in batch_sizes} | set(getattr(resources["ensemble"], "warmup_batch_sizes", ())))
+    try:
+        for bs in sizes:
+            x = torch.zeros(bs, 3, img_size, img_size, device=DEVICE)
+            s = torch.zeros(bs, dtype=torch.long, device=DEVICE)
+            t = time.perf_counter()
+            resources["ensemble"](x, s)
+            latency_ms[str(bs)] = round((time.perf_counter() - t) * 1000.0, 1)
+    except Exception as e:
+        with _load_lock:
+            _load_status.update(state="failed", error=f"warmup: {e}")
+        raise
+    with _load_lock:
+        _load_status.update(state="ready", warmup_latency_ms=latency_ms)
+    print(f"[워밍업 완료] latency(ms): {latency_ms}")
+    return get_load_status()
+
+
+# =============================================================================
+# 예측 단계별 공통 처리
+# =============================================================================
+def preprocess_bgr(img_cur, criteria, config):
+    """전처리 파이프라인 적용 (표준화 → ROI → 표준화 → ROI)"""
+    if config["do_standardize"] and config["use_std1"]:
+        img_cur = standardize_bgr(img_cur, criteria, config.get("std_resize_short", 0))
+    if config["do_roi"] and config["use_roi1"]:
+        roi_bgr, _ = extract_roi_from_image(img_cur)
+        if roi_bgr is not None:
+            img_cur = roi_bgr
+    if config["do_standardize"] and config["use_std2"]:
+        img_cur = standardize_bgr(img_cur, criteria, config.get("std_resize_short", 0))
+    if config["do_roi"] and config["use_roi2"]:
+        roi_bgr2, _ = extract_roi_from_image(img_cur)
+        if roi_bgr2 is not None:
+            img_cur = roi_bgr2
+    return img_cur
+
+
+def preprocess_gray(gray, criteria, config):
+    """preprocess_bgr의 단일 채널 버전 (BGR 변환 없이 같은 단계 적용)"""
+    if config["do_standardize"] and config["use_std1"]:
+        gray = standardize_gray_array(gray, criteria, config.get("std_resize_short", 0))
+    if config["do_roi"] and config["use_roi1"]:
+        roi, _ = extract_roi_from_gray(gray)
+        if roi is not None:
+            gray = roi
+    if config["do_standardize"] and config["use_std2"]:
+        gray = standardize_gray_array(gray, criteria, config.get("std_resize_short", 0))
+    if config["do_roi"] and config["use_roi2"]:
+        roi2, _ = extract_roi_from_gray(gray)
+        if roi2 is not None:
+            gray = roi2
+    return gray
+
+
+@torch.no_grad()
+def check_preprocess_parity(source, criteria, config=None, img_size=IMG_SIZE):
+    """
+    gray 전처리 엔진과 기존 BGR + torchvision transforms 경로의 입력 텐서 비교
+
+    Returns:
+        dict: max_abs_diff / mean_abs_diff (정규화 입력 단위), 입력 크기
+    """
+    config = {**DEFAULT_PREPROCESS_CONFIG, **(config or {})}
+    if not isinstance(source, (str, os.PathLike)) and hasattr(source, "read"):
+        source = source.read()
+    min_short = config.get("decode_min_short", 0)
+    ref = bgr_to_tensor(preprocess_bgr(load_image_color(source, min_short), criteria, config), img_size)
+    gray = preprocess_gray(load_image_gray(source, min_short), criteria, config)
+    cand = gray_to_tensor(gray, img_size)
+    diff = (ref - cand).abs()
+    return {
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "preprocessed_shape": list(gray.shape[:2]),
+    }
+
+
+def apply_isotonic_calibration(pred_boneage_clamped, calibrator, config, verbose=False):
+    """Isotonic Calibration 적용 (실패 또는 미사용 시 입력값 그대로 반환)"""
+    if not (config["use_isotonic_calibration"] and calibrator is not None):
+        if verbose:
+            print(f"   ★ PAH 계산용 BoneAge: {pred_boneage_clamped:.2f}M")
+        return pred_boneage_clamped
+    if verbose:
+        print("\n[Isotonic Calibration]")
+    try:
+        with stage_timer("calibration"):
+            if isinstance(calibrator, CompiledIsotonic):
+                calibrated = calibrator(pred_boneage_clamped)
+            else:
+                calibrated = float(calibrator.predict([pred_boneage_clamped])[0])
+    except Exception as e:
+        if verbose:
+            print(f"   ⚠ 실패: {e}")
+            print(f"   ★ PAH 계산용 BoneAge: {pred_boneage_clamped:.2f}M")
+        return pred_boneage_clamped
+    if verbose:
+        print(f"   ✓ 보정: {pred_boneage_clamped:.2f} → {calibrated:.2f} ({calibrated - pred_boneage_clamped:+.2f})")
+        print(f"   ★ PAH 계산용 BoneAge: {calibrated:.2f}M (Isotonic)")
+    return calibrated
+
+
+def build_pah_result(pred_boneage, sex, height, age_months, father_height, mother_height, lms, verbose=False):
+    """
+    최종 뼈나이로 PAH/백분위 계산 후 16개 필드 결과 생성
+
+    predict_bone_age, predict_bone_age_batch, recalculate_pah 공통 사용 (lms: LMSTable)
+    """
+    # LMS 기반 PAH
+    if verbose:
+        print("\n[STEP 2] LMS 기반 PAH 계산...")
+    pah_result = calculate_pah_lms(height, pred_boneage, sex, lms, ADULT_MONTHS)
+    percentile_result = calculate_height_percentile(height, age_months, sex, lms)
+    if verbose:
+        print(f"   ✓ PAH_LMS: {pah_result['PAH_LMS']:.2f}cm, 현재키 Percentile: {percentile_result['percentile_current']:.1f}th")
     
-    print("[리소스 로드 완료]")
-    return _model_cache
+    # PAH 보정
+    if verbose:
+        print("\n[STEP 3] PAH 보정...")
+    calib_result = calibrate_pah(height, pah_result['PAH_LMS'], father_height, mother_height, sex, age_months, pred_boneage)
+    if verbose:
+        if calib_result['genetic_available']:
+            print(f"   ✓ MPH: {calib_result['MPH']:.2f}cm")
+        print(f"   ✓ PAH_Final: {calib_result['PAH_Final']:.2f}cm")
+    
+    # 백분위 계산
+    pah_final_percentile_result = calculate_pah_final_percentile(calib_result['PAH_Final'], sex, lms, ADULT_MONTHS)
+    
+    mph_percentile_result = None
+    if calib_result['MPH'] is not None:
+        mph_percentile_result = calculate_mph_percentile(calib_result['MPH'], sex, lms, ADULT_MONTHS)
+    
+    pah_lms_percentile_result = calculate_pah_lms_percentile(pah_result['PAH_LMS'], sex, lms, ADULT_MONTHS)
+    
+    # PotentialScore
+    potential_result = calculate_potential_score(age_months, pred_boneage)
+    if verbose:
+        print(f"   ✓ PotentialScore: {potential_result['potential_score']:.1f}점 ({potential_result['interpretation']})")
+    
+    # =============================================================================
+    # 최종 JSON 결과 (16개 항목)
+    # =============================================================================
+    return {
+        "PAH_Final": round(calib_result['PAH_Final'], 2),
+        "Current_Age": months_to_year_month_str(age_months),
+        "BoneAge": months_to_year_month_str(pred_boneage),
+        "MPH": round(calib_result['MPH'], 2) if calib_result['MPH'] is not None else None,
+        "Height_Score": round(percentile_result['percentile_current'], 1),
+        "Potential_Score": round(potential_result['potential_score'], 1),
+        "Current_Height": height,
+        "Current_Height_Percentile": round(percentile_result['percentile_current'], 1),
+        "Genetic_Predicted_Height": round(calib_result['MPH'], 2) if calib_result['MPH'] is not None else None,
+        "MPH_Percentile": round(mph_percentile_result['percentile_mph'], 1) if mph_percentile_result is not None else None,
+        "Growth_Curve_Predicted_Height": round(pah_result['PAH_LMS'], 2),
+        "LMS_Percentile": round(pah_lms_percentile_result['percentile_pah_lms'], 1),
+        "Delta_Genetic": round(calib_result['ΔGenetic'], 2),
+        "Delta_Maturity": round(calib_result['ΔMaturity'], 2),
+        "Final_Predicted_Height": round(calib_result['PAH_Final'], 2),
+        "PAH_Final_Percentile": round(pah_final_percentile_result['percentile_pah_final'], 1),
+    }
 
 
 # =============================================================================
 # 메인 예측 함수 (외부 호출용 API)
 # =============================================================================
 def predict_bone_age(
-    image_path: str,
+    image_path,
     sex: int,
     height: float,
     age_months: int,
     father_height: float = None,
     mother_height: float = None,
     preprocess_config: dict = None,
-    verbose: bool = True
+    verbose: bool = True,
+    scheduler: "MicroBatchScheduler" = None,
+    include_months: bool = False,
+    hospital_id: str = None
 ) -> dict:
     """
     뼈나이 예측 및 성인 예상키(PAH) 계산
     
     Parameters:
-        image_path (str): 손 X-ray 이미지 파일 경로
+        image_path (str | bytes | file-like): 손 X-ray 이미지 파일 경로, 또는 인코딩된 이미지
+            bytes/버퍼/파일 객체 (임시 파일 없이 메모리에서 디코딩)
         sex (int): 성별 (1=남자, 0=여자)
         height (float): 현재 키 (cm)
         age_months (int): 현재 나이 (개월)
@@ -778,6 +3006,10 @@ def predict_bone_age(
         mother_height (float, optional): 어머니 키 (cm). None이면 유전 보정 미적용
         preprocess_config (dict, optional): 전처리 설정. None이면 기본값 사용
         verbose (bool): 상세 출력 여부
+        scheduler (MicroBatchScheduler, optional): 지정 시 앙상블 forward를
+            스케줄러에 맡겨 동시 요청과 함께 배치 처리 (create_ensemble_scheduler)
+        include_months (bool): True이면 뼈나이 개월 수(반올림 전)도 결과에 포함
+        hospital_id (str, optional): 병원 ID. 해당 병원 Calibrator가 있으면 사용, 없으면 기본 Calibrator
     
     Returns:
         dict: 예측 결과 (16개 필드)
@@ -797,6 +3029,9 @@ def predict_bone_age(
             - Delta_Maturity: 성숙도 기반 보정량 (cm)
             - Final_Predicted_Height: 최종 예측 키 (cm)
             - PAH_Final_Percentile: 최종 예측 키 백분위 (%)
+            - Folds_Used: 실제 실행한 fold 수 (적응형 앙상블 사용 시에만 포함)
+            - BoneAge_Months, BoneAge_Model_Months: 최종 뼈나이 / Clamp·보정 전 앙상블 출력 (개월,
+              include_months=True일 때만 포함, 엔진 parity 검사용)
     
     Example:
         >>> result = predict_bone_age(
@@ -825,118 +3060,179 @@ def predict_bone_age(
     models = resources["models"]
     weights = resources["weights"]
     criteria = resources["criteria"]
-    lms_df = resources["lms_df"]
-    calibrator = resources["calibrator"]
+    lms = resources["lms"]
+    calibrator = get_calibrator(hospital_id)
     
     # 이미지 로드 및 전처리
     if verbose:
         print("\n[STEP 1] 모델 로드 및 BoneAge 예측...")
     
-    img_cur = imread_unicode_color(image_path)
-    
-    if config["do_standardize"] and config["use_std1"]:
-        img_cur = standardize_bgr(img_cur, criteria)
-    if config["do_roi"] and config["use_roi1"]:
-        roi_bgr, _ = extract_roi_from_image(img_cur)
-        if roi_bgr is not None:
-            img_cur = roi_bgr
-    if config["do_standardize"] and config["use_std2"]:
-        img_cur = standardize_bgr(img_cur, criteria)
-    if config["do_roi"] and config["use_roi2"]:
-        roi_bgr2, _ = extract_roi_from_image(img_cur)
-        if roi_bgr2 is not None:
-            img_cur = roi_bgr2
+    def make_input(image):
+        if PREPROCESS_ENGINE == "gray":
+            # 단일 채널 전처리 → 스레드별 재사용 입력 버퍼 (1, 3, H, W)
+            x = get_input_buffer(1)
+            gray_to_input(preprocess_gray(load_image_gray(image, config["decode_min_short"]), criteria, config), x[0])
+            return x
+        return bgr_to_tensor(preprocess_bgr(load_image_color(image, config["decode_min_short"]), criteria, config)).unsqueeze(0)
     
     # BoneAge 예측 및 Clamp
-    pred_boneage_raw = ensemble_predict_single(img_cur, sex, models, weights, DEVICE)
+    feature_engine = resources["feature_engine"]
+    if _feature_cache is not None and feature_engine is not None:
+        # 같은 이미지 재요청이면 전처리/backbone 생략 (FiLM + head만 실행)
+        image_bytes = read_image_bytes(image_path)
+        key = feature_cache_key(image_bytes, config, resources["feature_tag"])
+        pred_boneage_raw, folds_used, hit = predict_with_feature_cache(
+            key, lambda: make_input(image_bytes), sex, feature_engine, _feature_cache)
+        if verbose:
+            print(f"   ✓ 특징 캐시 {'hit' if hit else 'miss'}")
+    elif scheduler is not None:
+        x = make_input(image_path)
+        # 스케줄러가 배치로 복사한 뒤 결과를 돌려줄 때까지 대기하므로 버퍼 재사용에 안전
+        pred_boneage_raw, folds_used = scheduler.predict((x[0], int(sex)))
+    else:
+        x = make_input(image_path)
+        preds, used = ensemble_predict_tensors(x, [sex], models, weights, DEVICE, ensemble=resources["ensemble"],
+                                               return_folds_used=True)
+        pred_boneage_raw, folds_used = float(preds[0]), int(used[0])
     pred_boneage_clamped, was_clamped, original_pred = clamp_boneage(pred_boneage_raw, age_months)
     
     if verbose:
         if was_clamped:
             print(f"   ⚠ BoneAge 범위 제한: {original_pred:.2f} → {pred_boneage_clamped:.2f}")
-        print(f"   ✓ BoneAge (모델): {pred_boneage_clamped:.2f}M ({pred_boneage_clamped/12:.2f}Y)")
+        print(f"   ✓ BoneAge (모델): {pred_boneage_clamped:.2f}M ({pred_boneage_clamped/12:.2f}Y), {folds_used} folds")
     
-    # Isotonic Calibration
-    boneage_isotonic_calibrated = None
-    isotonic_calibration_applied = False
+    # Isotonic Calibration 및 최종 BoneAge 결정
+    pred_boneage = apply_isotonic_calibration(pred_boneage_clamped, calibrator, config, verbose)
     
-    if config["use_isotonic_calibration"] and calibrator is not None:
-        if verbose:
-            print("\n[Isotonic Calibration]")
+    with stage_timer("pah"):
+        result = build_pah_result(pred_boneage, sex, height, age_months, father_height, mother_height, lms, verbose)
+    if isinstance(resources["ensemble"], AdaptiveFoldEnsemble):
+        result["Folds_Used"] = int(folds_used)
+    if include_months:
+        result["BoneAge_Months"] = float(pred_boneage)
+        result["BoneAge_Model_Months"] = float(pred_boneage_raw)
+    return result
+
+
+def prune_profile_traces(trace_dir=PROFILE_DIR, keep=PROFILE_KEEP):
+    """trace 디렉터리에서 최근 keep개를 제외한 오래된 trace 파일 삭제"""
+    files = [os.path.join(trace_dir, f) for f in os.listdir(trace_dir) if f.startswith("predict_") and f.endswith(".json")]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[max(0, int(keep)):]:
         try:
-            boneage_isotonic_calibrated = float(calibrator.predict([pred_boneage_clamped])[0])
-            boneage_isotonic_delta = boneage_isotonic_calibrated - pred_boneage_clamped
-            isotonic_calibration_applied = True
-            if verbose:
-                print(f"   ✓ 보정: {pred_boneage_clamped:.2f} → {boneage_isotonic_calibrated:.2f} ({boneage_isotonic_delta:+.2f})")
-        except Exception as e:
-            if verbose:
-                print(f"   ⚠ 실패: {e}")
-    
-    # 최종 BoneAge 결정
-    if isotonic_calibration_applied and boneage_isotonic_calibrated is not None:
-        pred_boneage = boneage_isotonic_calibrated
-        if verbose:
-            print(f"   ★ PAH 계산용 BoneAge: {pred_boneage:.2f}M (Isotonic)")
-    else:
-        pred_boneage = pred_boneage_clamped
-        if verbose:
-            print(f"   ★ PAH 계산용 BoneAge: {pred_boneage:.2f}M")
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def profile_predict_bone_age(trace_dir=PROFILE_DIR, top_ops=10, **kwargs):
+    """
+    predict_bone_age 1회를 torch profiler + 단계 tracer로 감싸 실행 (이상 요청 진단용)
+
+    모든 단계를 현재 스레드에서 실행하기 위해 마이크로 배칭 스케줄러는 사용하지 않음.
+    전체 trace(chrome trace JSON, 단계 구간은 record_function 이름으로 포함)는 trace_dir에 저장
+
+    Parameters:
+        kwargs: predict_bone_age 인자 (scheduler/verbose는 무시)
+
+    Returns:
+        (result, profile): profile은 total_ms, 단계/fold별 소요 시간, 자체 CPU 시간 상위 연산, trace 파일 경로
+    """
+    kwargs.update(scheduler=None, verbose=False)
+    load_resources()
+    trace_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    t = time.perf_counter()
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU]) as prof, StageTracer() as tracer:
+        result = predict_bone_age(**kwargs)
+    total_ms = (time.perf_counter() - t) * 1000.0
+
+    ops = sorted(prof.key_averages(), key=lambda e: e.self_cpu_time_total, reverse=True)
+    stage_names = {name for name, _, _ in tracer.events}
+    profile = {
+        "trace_id": trace_id,
+        "total_ms": round(total_ms, 3),
+        "stages": tracer.breakdown(),
+        "top_ops": [{"name": e.key, "count": int(e.count), "self_cpu_ms": round(e.self_cpu_time_total / 1000.0, 3)}
+                    for e in ops if e.key not in stage_names][:top_ops],
+        "trace_file": None,
+    }
+    try:
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"predict_{trace_id}.json")
+        prof.export_chrome_trace(path)
+        profile["trace_file"] = path
+        prune_profile_traces(trace_dir)
+    except Exception as e:
+        print(f"[WARN] 프로파일 trace 저장 실패: {e}")
+    return result, profile
+
+
+def predict_bone_age_batch(
+    items: list,
+    preprocess_config: dict = None,
+    batch_size: int = MAX_BATCH_SIZE,
+    verbose: bool = False,
+    hospital_id: str = None
+) -> list:
+    """
+    여러 장의 X-ray에 대한 뼈나이 및 PAH 일괄 예측
+
+    이미지들을 하나의 텐서로 쌓아 fold마다 배치 forward 1회로 처리하며,
+    이후 Clamp/Isotonic/PAH 계산은 이미지별로 predict_bone_age와 동일하게 수행
+
+    Parameters:
+        items (list[dict]): 이미지별 입력. 키는 predict_bone_age 인자와 동일
+            (image_path, sex, height, age_months, father_height, mother_height).
+            image_path에는 predict_bone_age와 같이 bytes/버퍼도 사용 가능
+        preprocess_config (dict, optional): 전처리 설정 (모든 이미지에 공통 적용)
+        batch_size (int): fold당 한 번에 forward 할 최대 이미지 수
+        verbose (bool): 진행 상황 출력 여부
+        hospital_id (str, optional): 병원 ID (항목에 hospital_id 키가 있으면 항목 값 우선)
+
+    Returns:
+        list[dict]: 입력 순서와 동일한 예측 결과 리스트 (각 16개 필드)
+    """
+    config = DEFAULT_PREPROCESS_CONFIG.copy()
+    if preprocess_config:
+        config.update(preprocess_config)
+    if not items:
+        return []
     
-    # LMS 기반 PAH
-    if verbose:
-        print("\n[STEP 2] LMS 기반 PAH 계산...")
-    pah_result = calculate_pah_lms(height, pred_boneage, sex, lms_df, ADULT_MONTHS)
-    percentile_result = calculate_height_percentile(height, age_months, sex, lms_df)
-    if verbose:
-        print(f"   ✓ PAH_LMS: {pah_result['PAH_LMS']:.2f}cm, 현재키 Percentile: {percentile_result['percentile_current']:.1f}th")
+    resources = load_resources()
+    criteria = resources["criteria"]
+    lms = resources["lms"]
+    calibrators = {h: get_calibrator(h) for h in {it.get("hospital_id", hospital_id) for it in items}}
     
-    # PAH 보정
     if verbose:
-        print("\n[STEP 3] PAH 보정...")
-    calib_result = calibrate_pah(height, pah_result['PAH_LMS'], father_height, mother_height, sex, age_months, pred_boneage)
-    if verbose:
-        if calib_result['genetic_available']:
-            print(f"   ✓ MPH: {calib_result['MPH']:.2f}cm")
-        print(f"   ✓ PAH_Final: {calib_result['PAH_Final']:.2f}cm")
-    
-    # 백분위 계산
-    pah_final_percentile_result = calculate_pah_final_percentile(calib_result['PAH_Final'], sex, lms_df, ADULT_MONTHS)
-    
-    mph_percentile_result = None
-    if calib_result['MPH'] is not None:
-        mph_percentile_result = calculate_mph_percentile(calib_result['MPH'], sex, lms_df, ADULT_MONTHS)
-    
-    pah_lms_percentile_result = calculate_pah_lms_percentile(pah_result['PAH_LMS'], sex, lms_df, ADULT_MONTHS)
+        print(f"[Batch] 전처리: {len(items)}장")
+    sexes = [int(it["sex"]) for it in items]
+    if PREPROCESS_ENGINE == "gray":
+        imgs = [preprocess_gray(load_image_gray(it["image_path"], config["decode_min_short"]), criteria, config) for it in items]
+        predict_fn = ensemble_predict_grays
+    else:
+        imgs = [preprocess_bgr(load_image_color(it["image_path"], config["decode_min_short"]), criteria, config) for it in items]
+        predict_fn = ensemble_predict_batch
     
-    # PotentialScore
-    potential_result = calculate_potential_score(age_months, pred_boneage)
     if verbose:
-        print(f"   ✓ PotentialScore: {potential_result['potential_score']:.1f}점 ({potential_result['interpretation']})")
+        print(f"[Batch] 앙상블 예측 (batch_size={batch_size})")
+    preds_raw, folds_used = predict_fn(imgs, sexes, resources["models"], resources["weights"], DEVICE,
+                                       batch_size=batch_size, ensemble=resources["ensemble"],
+                                       return_folds_used=True)
+    adaptive = isinstance(resources["ensemble"], AdaptiveFoldEnsemble)
     
-    # =============================================================================
-    # 최종 JSON 결과 (16개 항목)
-    # =============================================================================
-    result = {
-        "PAH_Final": round(calib_result['PAH_Final'], 2),
-        "Current_Age": months_to_year_month_str(age_months),
-        "BoneAge": months_to_year_month_str(pred_boneage),
-        "MPH": round(calib_result['MPH'], 2) if calib_result['MPH'] is not None else None,
-        "Height_Score": round(percentile_result['percentile_current'], 1),
-        "Potential_Score": round(potential_result['potential_score'], 1),
-        "Current_Height": height,
-        "Current_Height_Percentile": round(percentile_result['percentile_current'], 1),
-        "Genetic_Predicted_Height": round(calib_result['MPH'], 2) if calib_result['MPH'] is not None else None,
-        "MPH_Percentile": round(mph_percentile_result['percentile_mph'], 1) if mph_percentile_result is not None else None,
-        "Growth_Curve_Predicted_Height": round(pah_result['PAH_LMS'], 2),
-        "LMS_Percentile": round(pah_lms_percentile_result['percentile_pah_lms'], 1),
-        "Delta_Genetic": round(calib_result['ΔGenetic'], 2),
-        "Delta_Maturity": round(calib_result['ΔMaturity'], 2),
-        "Final_Predicted_Height": round(calib_result['PAH_Final'], 2),
-        "PAH_Final_Percentile": round(pah_final_percentile_result['percentile_pah_final'], 1),
-    }
-    
-    return result
+    results = []
+    for it, pred_raw, used in zip(items, preds_raw, folds_used):
+        pred_clamped, _, _ = clamp_boneage(float(pred_raw), it["age_months"])
+        pred_boneage = apply_isotonic_calibration(pred_clamped, calibrators[it.get("hospital_id", hospital_id)], config)
+        with stage_timer("pah"):
+            result = build_pah_result(
+                pred_boneage, int(it["sex"]), it["height"], it["age_months"],
+                it.get("father_height"), it.get("mother_height"), lms
+            )
+        if adaptive:
+            result["Folds_Used"] = int(used)
+        results.append(result)
+    return results
 
 
 # =============================================================================
@@ -947,42 +3243,129 @@ def recalculate_pah(bone_age_years, bone_age_months, sex, height, age_months,
     """의사가 수정한 뼈나이로 PAH 재계산 (이미지 추론 없음)"""
     pred_boneage = bone_age_years * 12 + bone_age_months
 
-    # LMS 데이터 로드
-    lms_df = load_lms_data(LMS_CSV_PATH)
+    # LMS 기준표 (최초 1회 로드 후 캐시, 모델 로드 불필요)
+    lms = load_lms_table(LMS_CSV_PATH)
 
-    # PAH 계산 (predict_bone_age의 886~936 라인과 동일)
-    pah_result = calculate_pah_lms(height, pred_boneage, sex, lms_df, ADULT_MONTHS)
-    percentile_result = calculate_height_percentile(height, age_months, sex, lms_df)
-    calib_result = calibrate_pah(height, pah_result['PAH_LMS'], father_height, mother_height, sex, age_months, pred_boneage)
-    pah_final_percentile_result = calculate_pah_final_percentile(calib_result['PAH_Final'], sex, lms_df, ADULT_MONTHS)
+    # PAH 계산 (predict_bone_age와 동일한 build_pah_result 사용)
+    return build_pah_result(pred_boneage, sex, height, age_months, father_height, mother_height, lms)
 
-    mph_percentile_result = None
-    if calib_result['MPH'] is not None:
-        mph_percentile_result = calculate_mph_percentile(calib_result['MPH'], sex, lms_df, ADULT_MONTHS)
 
-    pah_lms_percentile_result = calculate_pah_lms_percentile(pah_result['PAH_LMS'], sex, lms_df, ADULT_MONTHS)
-    potential_result = calculate_potential_score(age_months, pred_boneage)
+def calculate_pah_columns(boneage_months, sex, height, age_months, father_height=None, mother_height=None,
+                          lms=None, w_D=PAH_W_D, alpha=PAH_ALPHA):
+    """
+    PAH/백분위/PotentialScore를 NumPy 열 연산으로 일괄 계산 (build_pah_result의 벡터화 버전)
+
+    Parameters:
+        boneage_months, sex, height, age_months: 길이 N 배열 (sex: 1=남자, 0=여자)
+        father_height, mother_height: 길이 N 배열 또는 None (결측은 None/NaN, 둘 다 있어야 유전 보정)
+        lms: LMSTable (None이면 기본 LMS.csv)
+        w_D, alpha: calibrate_pah 보정 계수
 
+    Returns:
+        dict[str, np.ndarray]: 열 이름 → (N,) 배열 (MPH 관련 열은 유전 보정 불가 시 NaN)
+    """
+    lms = load_lms_table(LMS_CSV_PATH) if lms is None else as_lms_table(lms)
+    ba = np.asarray(boneage_months, dtype=np.float64)
+    n = ba.shape[0]
+    sex = np.asarray(sex).astype(np.int64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age_months, dtype=np.float64)
+    father = np.full(n, np.nan) if father_height is None else np.array(father_height, dtype=np.float64)
+    mother = np.full(n, np.nan) if mother_height is None else np.array(mother_height, dtype=np.float64)
+    if not all(v.shape == (n,) for v in (sex, height, age, father, mother)):
+        raise ValueError("All input columns must have the same length")
+    male = sex == 1
+    
+    # LMS 기반 PAH
+    pah = calculate_pah_lms(height, ba, sex, lms, ADULT_MONTHS)
+    pct_current = calculate_height_percentile(height, age, sex, lms)["percentile_current"]
+    
+    # PAH 보정 (calibrate_pah와 같은 식)
+    genetic = ~(np.isnan(father) | np.isnan(mother))
+    R_LMS = pah["PAH_LMS"] - height
+    gap_factor = 1.0 - alpha * (ba - age) / 12.0
+    MPH = np.where(genetic, (father + mother) / 2.0 + np.where(male, 6.5, -6.5), np.nan)
+    D_target = np.maximum(MPH - height, 0.0)
+    R_gen = (1.0 - w_D) * R_LMS + w_D * D_target
+    R_base = np.where(genetic, R_gen, R_LMS)
+    R_final = np.maximum(R_base * gap_factor, 0.0)
+    pah_final = height + R_final
+    
+    # 백분위 (MPH는 유효한 경우만)
+    _, pct_final = adult_height_percentile(pah_final, sex, lms, ADULT_MONTHS)
+    pct_mph = np.full(n, np.nan)
+    if genetic.any():
+        _, pct_mph[genetic] = adult_height_percentile(MPH[genetic], sex[genetic], lms, ADULT_MONTHS)
+    _, pct_pah_lms = adult_height_percentile(pah["PAH_LMS"], sex, lms, ADULT_MONTHS)
+    
+    # PotentialScore
+    potential = (np.clip(age - ba, -24.0, 24.0) + 24.0) / 48.0 * 100.0
+    
     return {
-        "PAH_Final": round(calib_result['PAH_Final'], 2),
-        "Current_Age": months_to_year_month_str(age_months),
-        "BoneAge": months_to_year_month_str(pred_boneage),
-        "MPH": round(calib_result['MPH'], 2) if calib_result['MPH'] is not None else None,
-        "Height_Score": round(percentile_result['percentile_current'], 1),
-        "Potential_Score": round(potential_result['potential_score'], 1),
-        "Current_Height": height,
-        "Current_Height_Percentile": round(percentile_result['percentile_current'], 1),
-        "Genetic_Predicted_Height": round(calib_result['MPH'], 2) if calib_result['MPH'] is not None else None,
-        "MPH_Percentile": round(mph_percentile_result['percentile_mph'], 1) if mph_percentile_result is not None else None,
-        "Growth_Curve_Predicted_Height": round(pah_result['PAH_LMS'], 2),
-        "LMS_Percentile": round(pah_lms_percentile_result['percentile_pah_lms'], 1),
-        "Delta_Genetic": round(calib_result['ΔGenetic'], 2),
-        "Delta_Maturity": round(calib_result['ΔMaturity'], 2),
-        "Final_Predicted_Height": round(calib_result['PAH_Final'], 2),
-        "PAH_Final_Percentile": round(pah_final_percentile_result['percentile_pah_final'], 1),
+        "boneage_months": ba,
+        "age_months": age,
+        "height": height,
+        "PAH_LMS": pah["PAH_LMS"],
+        "PAH_Final": pah_final,
+        "MPH": MPH,
+        "Delta_Genetic": np.where(genetic, R_gen - R_LMS, 0.0),
+        "Delta_Maturity": R_final - R_base,
+        "percentile_current": pct_current,
+        "percentile_pah_final": pct_final,
+        "percentile_mph": pct_mph,
+        "percentile_pah_lms": pct_pah_lms,
+        "potential_score": potential,
     }
 
 
+def pah_columns_to_results(cols, heights=None):
+    """calculate_pah_columns 결과를 build_pah_result와 같은 16개 필드 dict 리스트로 변환"""
+    results = []
+    heights = cols["height"].tolist() if heights is None else heights
+    rows = [dict(zip(cols, vals)) for vals in zip(*(v.tolist() for v in cols.values()))]
+    for c, h in zip(rows, heights):
+        mph = None if math.isnan(c["MPH"]) else round(c["MPH"], 2)
+        results.append({
+            "PAH_Final": round(c["PAH_Final"], 2),
+            "Current_Age": months_to_year_month_str(c["age_months"]),
+            "BoneAge": months_to_year_month_str(c["boneage_months"]),
+            "MPH": mph,
+            "Height_Score": round(c["percentile_current"], 1),
+            "Potential_Score": round(c["potential_score"], 1),
+            "Current_Height": h,
+            "Current_Height_Percentile": round(c["percentile_current"], 1),
+            "Genetic_Predicted_Height": mph,
+            "MPH_Percentile": None if mph is None else round(c["percentile_mph"], 1),
+            "Growth_Curve_Predicted_Height": round(c["PAH_LMS"], 2),
+            "LMS_Percentile": round(c["percentile_pah_lms"], 1),
+            "Delta_Genetic": round(c["Delta_Genetic"], 2),
+            "Delta_Maturity": round(c["Delta_Maturity"], 2),
+            "Final_Predicted_Height": round(c["PAH_Final"], 2),
+            "PAH_Final_Percentile": round(c["percentile_pah_final"], 1),
+        })
+    return results
+
+
+def recalculate_pah_batch(bone_age_years, bone_age_months, sex, height, age_months,
+                          father_height=None, mother_height=None, w_D=PAH_W_D, alpha=PAH_ALPHA):
+    """
+    의사 뼈나이 기준 PAH 일괄 재계산 (recalculate_pah의 벡터화 버전, 이미지 추론 없음)
+
+    Parameters:
+        각 인자는 recalculate_pah와 같은 의미의 길이 N 리스트/배열
+        (father_height, mother_height는 결측 None 허용, 생략 시 전부 결측)
+        w_D, alpha: PAH 보정 계수 (계수 변경 후 과거 분석 재채점용)
+
+    Returns:
+        list[dict]: 입력 순서와 같은 결과 리스트 (각 16개 필드, recalculate_pah와 동일)
+    """
+    boneage = np.asarray(bone_age_years, dtype=np.float64) * 12 + np.asarray(bone_age_months, dtype=np.float64)
+    to_col = lambda v: None if v is None else [np.nan if x is None else x for x in v]
+    cols = calculate_pah_columns(boneage, sex, height, age_months, to_col(father_height), to_col(mother_height),
+                                 w_D=w_D, alpha=alpha)
+    return pah_columns_to_results(cols, heights=list(height))
+
+
 # =============================================================================
 # 단독 실행 시 테스트
 # =============================================================================
@@ -0,0 +1,270 @@
+# =============================================================================
+# 추론 엔진 임상 출력 일치성(parity) 게이트 스크립트
+# =============================================================================
+#
+# 용도: 속도 최적화 경로(INT8 양자화, torch.compile, ONNX, 축소 디코딩, 축소 ROI 등)가
+#       기준 경로 대비 임상 출력(뼈나이, PAH_Final, 백분위)을 바꾸지 않는지 확인
+#       이미지 × 인구학 입력 케이스별로 기준/후보 predict_bone_age 결과를 비교하여
+#       허용 기준을 넘으면 실패(종료 코드 1)
+#
+# 사용법:
+#   1. 아래 IMAGE_PATHS(또는 IMAGE_DIR), DEMOGRAPHICS, CANDIDATES, 허용 기준 설정
+#   2. python Check_Engine_Parity.py
+#      python Check_Engine_Parity.py OSTEOAGE_BACKEND=onnx OSTEOAGE_DECODE_MIN_SHORT=1024
+#        (인자로 OSTEOAGE_*=값 을 주면 CANDIDATES 대신 해당 설정 하나를 후보로 검사)
+#   3. 결과가 콘솔에 출력되고 Data/engine_parity_report.json으로 저장됨
+#
+# * 엔진 설정은 모듈 로드 시 환경변수에서 읽으므로 기준/후보를 각각 별도 프로세스로 실행
+#   (후보 환경 = REFERENCE_ENV + 후보 설정, 나머지 OSTEOAGE_* 는 현재 환경 그대로)
+# * 뼈나이 비교는 Clamp/Isotonic 보정 후 최종 뼈나이(BoneAge_Months) 기준
+# * 지연시간은 케이스별 predict_bone_age 호출 시간의 중앙값 (워밍업 후)
+# =============================================================================
+
+import os
+import sys
+import json
+import time
+import datetime
+import tempfile
+import subprocess
+import numpy as np
+
+from CPU_BoneAge_PAH_Compact import PROJECT_ROOT, DATA_DIR
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 평가 이미지 (IMAGE_DIR가 있으면 폴더 내 이미지 전체 추가)
+IMAGE_PATHS = [os.path.join(PROJECT_ROOT, "Total raw image", "Test Image.jpg")]
+IMAGE_DIR = None
+
+# 이미지마다 평가할 인구학 입력 (predict_bone_age 인자)
+DEMOGRAPHICS = [
+    {"sex": 0, "height": 155.0, "age_months": 143, "father_height": 165.0, "mother_height": 156.0},
+    {"sex": 1, "height": 150.0, "age_months": 140, "father_height": 172.0, "mother_height": 160.0},
+    {"sex": 1, "height": 128.0, "age_months": 102, "father_height": None, "mother_height": None},
+    {"sex": 0, "height": 141.0, "age_months": 130, "father_height": None, "mother_height": None},
+]
+
+# 기준 경로 (최적화 미사용 원래 경로)
+REFERENCE_ENV = {
+    "OSTEOAGE_BACKEND": "torch",
+    "OSTEOAGE_ENSEMBLE_ENGINE": "loop",
+    "OSTEOAGE_QUANTIZE": "none",
+    "OSTEOAGE_COMPILE": "none",
+    "OSTEOAGE_ADAPTIVE_ENSEMBLE": "0",
+    "OSTEOAGE_PREPROCESS_ENGINE": "bgr",
+    "OSTEOAGE_DECODE_MIN_SHORT": "0",
+    "OSTEOAGE_STD_RESIZE_SHORT": "0",
+    "OSTEOAGE_ROI_MAX_SIDE": "0",
+    "OSTEOAGE_FEATURE_CACHE": "0",
+}
+
+# 검사할 후보 (이름: REFERENCE_ENV에 덮어쓸 설정)
+CANDIDATES = {
+    "gray_preprocess": {"OSTEOAGE_PREPROCESS_ENGINE": "gray"},
+    "int8": {"OSTEOAGE_PREPROCESS_ENGINE": "gray", "OSTEOAGE_QUANTIZE": "int8"},
+}
+
+# 허용 기준 (None이면 검사하지 않고 리포트만)
+MAX_BONEAGE_MAE_MONTHS = 0.25
+MAX_BONEAGE_DRIFT_MONTHS = 1.0
+MAX_PAH_DRIFT_CM = 0.5
+MAX_PERCENTILE_DRIFT = 1.0  # 백분위 점수 (PAH_Final_Percentile, LMS_Percentile)
+MAX_LATENCY_RATIO = None  # 후보 / 기준 지연시간 중앙값
+
+# 비교할 백분위 필드
+PERCENTILE_FIELDS = ("PAH_Final_Percentile", "LMS_Percentile")
+
+# 엔진 1개 실행 제한 시간 (모델 로드/컴파일 포함, 초)
+ENGINE_TIMEOUT_SEC = 3600
+
+# 리포트 저장 경로
+REPORT_PATH = os.path.join(DATA_DIR, "engine_parity_report.json")
+
+# =============================================================================
+# 엔진 실행 (별도 프로세스)
+# =============================================================================
+
+def run_cases(cases: list) -> dict:
+    """
+    현재 프로세스 설정(환경변수)으로 케이스별 predict_bone_age 실행 (--worker 모드)
+
+    Returns:
+        dict: {"backend", "load_seconds", "results": [...], "latency_ms": [...]}
+    """
+    from CPU_BoneAge_PAH_Compact import load_resources, warmup_resources, get_load_status, predict_bone_age
+
+    t = time.perf_counter()
+    load_resources()
+    warmup_resources([1])
+    load_sec = time.perf_counter() - t
+    results, latency = [], []
+    for case in cases:
+        t = time.perf_counter()
+        results.append(predict_bone_age(case["image_path"], **case["inputs"], verbose=False, include_months=True))
+        latency.append((time.perf_counter() - t) * 1000.0)
+    return {"backend": get_load_status().get("backend"), "load_seconds": load_sec,
+            "results": results, "latency_ms": latency}
+
+
+def run_engine(name: str, env_overrides: dict, cases: list, script=None) -> dict:
+    """
+    지정 환경변수로 이 스크립트를 --worker 모드 하위 프로세스로 실행하여 결과 수집
+
+    Raises:
+        RuntimeError: 하위 프로세스 실패 시
+    """
+    print(f"\n▶ {name}: {' '.join(f'{k}={v}' for k, v in sorted(env_overrides.items()))}")
+    env = {**os.environ, **REFERENCE_ENV, **env_overrides}
+    with tempfile.TemporaryDirectory(prefix="osteoage_parity_") as tmp:
+        cases_path = os.path.join(tmp, "cases.json")
+        out_path = os.path.join(tmp, "result.json")
+        with open(cases_path, "w", encoding="utf-8") as f:
+            json.dump(cases, f, ensure_ascii=False)
+        proc = subprocess.run([sys.executable, script or os.path.abspath(__file__), "--worker", cases_path, out_path],
+                              env=env, cwd=os.path.dirname(os.path.abspath(__file__)), timeout=ENGINE_TIMEOUT_SEC)
+        if proc.returncode != 0 or not os.path.exists(out_path):
+            raise RuntimeError(f"{name} 실행 실패 (종료 코드 {proc.returncode})")
+        with open(out_path, encoding="utf-8") as f:
+            out = json.load(f)
+    print(f"   ✓ backend={out['backend']}, 로드 {out['load_seconds']:.1f}s, "
+          f"지연시간 중앙값 {np.median(out['latency_ms']):.0f}ms")
+    return out
+
+# =============================================================================
+# 비교
+# =============================================================================
+
+def field_drift(ref_results, cand_results, field):
+    """케이스별 (후보 - 기준) 차이 (어느 한쪽이 None이면 제외)"""
+    return np.array([c[field] - r[field] for r, c in zip(ref_results, cand_results)
+                     if r.get(field) is not None and c.get(field) is not None], dtype=np.float64)
+
+
+def compare_engines(ref: dict, cand: dict, cases: list) -> dict:
+    """
+    기준/후보 결과 비교 및 허용 기준 판정
+
+    Returns:
+        dict: 요약 지표, 기준별 통과 여부(checks), 케이스별 차이
+    """
+    r_res, c_res = ref["results"], cand["results"]
+    boneage = field_drift(r_res, c_res, "BoneAge_Months")
+    pah = field_drift(r_res, c_res, "PAH_Final")
+    pct = {f: field_drift(r_res, c_res, f) for f in PERCENTILE_FIELDS}
+    pct_max = max((float(np.abs(d).max()) for d in pct.values() if d.size), default=0.0)
+    latency_ratio = float(np.median(cand["latency_ms"]) / np.median(ref["latency_ms"]))
+
+    metrics = {
+        "boneage_mae_months": float(np.abs(boneage).mean()),
+        "boneage_max_drift_months": float(np.abs(boneage).max()),
+        "boneage_mean_drift_months": float(boneage.mean()),
+        "boneage_model_max_drift_months": float(np.abs(field_drift(r_res, c_res, "BoneAge_Model_Months")).max()),
+        "pah_final_max_drift_cm": float(np.abs(pah).max()),
+        "pah_final_mae_cm": float(np.abs(pah).mean()),
+        "percentile_max_drift": pct_max,
+        "percentile_max_drift_by_field": {f: float(np.abs(d).max()) if d.size else 0.0 for f, d in pct.items()},
+        "boneage_string_mismatches": sum(r["BoneAge"] != c["BoneAge"] for r, c in zip(r_res, c_res)),
+        "latency_ms_reference": float(np.median(ref["latency_ms"])),
+        "latency_ms_candidate": float(np.median(cand["latency_ms"])),
+        "latency_ratio": latency_ratio,
+    }
+    limits = {
+        "boneage_mae_months": MAX_BONEAGE_MAE_MONTHS,
+        "boneage_max_drift_months": MAX_BONEAGE_DRIFT_MONTHS,
+        "pah_final_max_drift_cm": MAX_PAH_DRIFT_CM,
+        "percentile_max_drift": MAX_PERCENTILE_DRIFT,
+        "latency_ratio": MAX_LATENCY_RATIO,
+    }
+    checks = {k: {"value": metrics[k], "limit": lim, "passed": metrics[k] <= lim}
+              for k, lim in limits.items() if lim is not None}
+
+    rows = []
+    for case, r, c in zip(cases, r_res, c_res):
+        rows.append({
+            "image": os.path.basename(case["image_path"]), **case["inputs"],
+            "boneage_ref": r["BoneAge_Months"], "boneage_cand": c["BoneAge_Months"],
+            "pah_final_ref": r["PAH_Final"], "pah_final_cand": c["PAH_Final"],
+            **{f"{f}_drift": (c[f] - r[f]) if r.get(f) is not None and c.get(f) is not None else None
+               for f in PERCENTILE_FIELDS},
+        })
+    return {"metrics": metrics, "checks": checks, "passed": all(v["passed"] for v in checks.values()), "cases": rows}
+
+
+def build_cases(image_paths: list, demographics=None) -> list:
+    """이미지 × 인구학 입력 케이스 목록"""
+    return [{"image_path": os.path.abspath(p), "inputs": dict(d)}
+            for p in image_paths for d in (demographics or DEMOGRAPHICS)]
+
+
+def check_engine_parity(image_paths: list, candidates=CANDIDATES) -> dict:
+    """
+    기준 엔진 1회 + 후보별 실행 후 비교
+
+    Returns:
+        dict: 리포트 (passed: 모든 후보가 허용 기준 이내면 True)
+    """
+    print("=" * 70)
+    print("🔍 추론 엔진 임상 출력 parity 게이트 (기준 경로 대비)")
+    print("=" * 70)
+
+    cases = build_cases(image_paths)
+    print(f"   케이스 {len(cases)}개 (이미지 {len(image_paths)} × 인구학 입력 {len(DEMOGRAPHICS)})")
+    ref = run_engine("reference", {}, cases)
+
+    report = {"created_at": datetime.datetime.now().isoformat(), "n_cases": len(cases),
+              "reference_env": REFERENCE_ENV, "candidates": {}}
+    for name, overrides in candidates.items():
+        res = compare_engines(ref, run_engine(name, overrides, cases), cases)
+        report["candidates"][name] = {"env": overrides, **res}
+        m = res["metrics"]
+        print(f"   {'✓' if res['passed'] else '✗'} 뼈나이 MAE {m['boneage_mae_months']:.3f} / 최대 {m['boneage_max_drift_months']:.3f}개월, "
+              f"PAH_Final 최대 {m['pah_final_max_drift_cm']:.3f}cm, 백분위 최대 {m['percentile_max_drift']:.2f}, "
+              f"지연시간 x{m['latency_ratio']:.2f}")
+        for key, c in res["checks"].items():
+            if not c["passed"]:
+                print(f"     ✗ {key}: {c['value']:.4f} > {c['limit']}")
+    report["passed"] = all(c["passed"] for c in report["candidates"].values())
+
+    print("\n" + "=" * 70)
+    print(f"{'✅ 통과' if report['passed'] else '❌ 실패'}")
+    print("=" * 70)
+    return report
+
+
+def parse_env_args(args):
+    """명령행 OSTEOAGE_KEY=VALUE 인자 → 후보 설정 dict"""
+    overrides = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or not key.startswith("OSTEOAGE_"):
+            raise SystemExit(f"인자는 OSTEOAGE_KEY=VALUE 형식이어야 합니다: {arg}")
+        overrides[key] = value
+    return overrides
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        with open(sys.argv[2], encoding="utf-8") as f:
+            out = run_cases(json.load(f))
+        with open(sys.argv[3], "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False)
+        sys.exit(0)
+
+    paths = list(IMAGE_PATHS)
+    if IMAGE_DIR and os.path.isdir(IMAGE_DIR):
+        paths += [os.path.join(IMAGE_DIR, f) for f in sorted(os.listdir(IMAGE_DIR))
+                  if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))]
+
+    candidates = {"cli": parse_env_args(sys.argv[1:])} if len(sys.argv) > 1 else CANDIDATES
+    result = check_engine_parity(paths, candidates)
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 리포트 저장: {REPORT_PATH}")
+    sys.exit(0 if result["passed"] else 1)
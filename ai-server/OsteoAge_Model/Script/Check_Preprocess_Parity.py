@@ -0,0 +1,155 @@
+# =============================================================================
+# 전처리 엔진 일치성(parity) 검사 스크립트
+# =============================================================================
+#
+# 용도: gray 전처리 엔진(단일 채널 + 재사용 입력 버퍼)이 기존 경로
+#       (BGR 디코딩 → standardize_bgr → ROI → PIL/torchvision transforms)와
+#       같은 모델 입력 텐서를 만드는지 확인하고 전처리 시간을 비교
+#
+# 사용법:
+#   1. 아래 IMAGE_PATHS(또는 IMAGE_DIR)에 검사할 X-ray 지정
+#   2. python Check_Preprocess_Parity.py
+#   3. 최대 오차가 MAX_ABS_TOLERANCE를 넘으면 실패(종료 코드 1)
+#   4. 축소 해상도 옵션(OSTEOAGE_DECODE_MIN_SHORT, OSTEOAGE_STD_RESIZE_SHORT) 사용 시
+#      원본 해상도 대비 입력 차이와 디코딩 포함 전처리 시간도 함께 출력 (참고용)
+#
+# * 모델 체크포인트 없이 실행 가능 (전처리 기준 JSON만 필요)
+# * 컬러로 인코딩된 JPEG(색조가 있는 합성 이미지)도 함께 검사 (gray 엔진은 BGR 디코딩 후 변환해야 일치)
+# =============================================================================
+
+import os
+import sys
+import time
+import tempfile
+import cv2
+import numpy as np
+
+from CPU_BoneAge_PAH_Compact import (
+    PROJECT_ROOT, CRITERIA_JSON_PATH, DEFAULT_PREPROCESS_CONFIG,
+    load_criteria, load_image_color, load_image_gray, preprocess_bgr, preprocess_gray,
+    bgr_to_tensor, gray_to_input, get_input_buffer, check_preprocess_parity,
+)
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 검사 이미지 (IMAGE_DIR가 있으면 폴더 내 이미지 전체 추가)
+IMAGE_PATHS = [os.path.join(PROJECT_ROOT, "Total raw image", "Test Image.jpg")]
+IMAGE_DIR = None
+
+# 첫 이미지에 색조를 입혀 컬러(YCbCr 3채널) JPEG으로 저장한 검사 케이스 추가
+COLOR_JPEG_CASE = True
+
+# 검사할 전처리 설정 (기본 설정 + 모든 단계 사용)
+CONFIGS = {
+    "default": DEFAULT_PREPROCESS_CONFIG,
+    "all_steps": {**DEFAULT_PREPROCESS_CONFIG, "use_roi1": True, "use_std2": True, "use_roi2": True},
+}
+
+# 허용 오차 (정규화된 입력 단위, 1계조 ≈ 0.0175)
+MAX_ABS_TOLERANCE = 1e-4
+
+# 원본 해상도 대비 차이를 확인할 축소 해상도 옵션 (짧은 변 px, 빈 리스트면 생략)
+REDUCED_VARIANTS = [
+    ("JPEG 축소 디코딩", "decode_min_short", 1024),
+    ("JPEG 축소 디코딩", "decode_min_short", 448),
+    ("표준화 전 축소", "std_resize_short", 1344),
+    ("표준화 전 축소", "std_resize_short", 896),
+]
+
+# 시간 측정 반복 횟수
+TIMING_REPEATS = 5
+
+# =============================================================================
+# 메인 로직
+# =============================================================================
+
+def time_path(fn, repeats):
+    """fn 평균 실행 시간 (ms)"""
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - t) * 1000.0 / repeats
+
+
+def report_reduced_resolution(path, criteria, repeats=TIMING_REPEATS):
+    """기본 설정에서 축소 해상도 옵션별 입력 텐서 차이와 디코딩 포함 전처리 시간 출력 (원본 해상도 기준)"""
+    buf = get_input_buffer(1)
+    base = {**DEFAULT_PREPROCESS_CONFIG, "decode_min_short": 0, "std_resize_short": 0}
+
+    def run(cfg):
+        gray = load_image_gray(path, cfg["decode_min_short"])
+        return gray_to_input(preprocess_gray(gray, criteria, cfg), buf[0])
+
+    ref = run(base).clone()
+    ms_ref = time_path(lambda: run(base), repeats)
+    for label, key, short in REDUCED_VARIANTS:
+        cfg = {**base, key: short}
+        ms = time_path(lambda: run(cfg), repeats)
+        diff = (run(cfg) - ref).abs()
+        print(f"     · {label} {short}px: max {float(diff.max()):.2e}, mean {float(diff.mean()):.2e} | "
+              f"{ms_ref:.0f} → {ms:.0f}ms")
+
+
+def make_color_jpeg(path):
+    """그레이 X-ray에 B/R 채널 색조를 입혀 컬러 JPEG 임시 파일로 저장 (chroma가 0이 아닌 입력)"""
+    gray = load_image_gray(path).astype(np.int16)
+    bgr = cv2.merge([np.clip(gray + d, 0, 255).astype(np.uint8) for d in (-10, 0, 15)])
+    out = os.path.join(tempfile.gettempdir(), "osteoage_parity_color.jpg")
+    ok, buf = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if not ok:
+        raise RuntimeError("컬러 JPEG 인코딩 실패")
+    buf.tofile(out)
+    return out
+
+
+def check_parity(image_paths: list, tol=MAX_ABS_TOLERANCE, repeats=TIMING_REPEATS) -> bool:
+    """
+    이미지 × 전처리 설정별 입력 텐서 비교 및 시간 측정
+
+    Returns:
+        bool: 모든 경우가 허용 오차 이내면 True
+    """
+    print("=" * 70)
+    print("🔍 전처리 엔진 parity 검사 (bgr + transforms vs gray + 입력 버퍼)")
+    print("=" * 70)
+
+    criteria = load_criteria(CRITERIA_JSON_PATH)
+    ok = True
+    for path in image_paths:
+        name = os.path.basename(path)
+        for cfg_name, cfg in CONFIGS.items():
+            res = check_preprocess_parity(path, criteria, cfg)
+            passed = res["max_abs_diff"] <= tol
+            ok &= passed
+
+            buf = get_input_buffer(1)
+            ms_bgr = time_path(lambda: bgr_to_tensor(preprocess_bgr(load_image_color(path), criteria, cfg)), repeats)
+            ms_gray = time_path(lambda: gray_to_input(preprocess_gray(load_image_gray(path), criteria, cfg), buf[0]), repeats)
+            print(f"   {'✓' if passed else '✗'} {name} [{cfg_name}] max {res['max_abs_diff']:.2e}, "
+                  f"mean {res['mean_abs_diff']:.2e} | {ms_bgr:.0f} → {ms_gray:.0f}ms")
+
+        if REDUCED_VARIANTS:
+            report_reduced_resolution(path, criteria, repeats)
+
+    print("\n" + "=" * 70)
+    print(f"{'✅ 통과' if ok else '❌ 실패'} (허용 오차 {tol:g})")
+    print("=" * 70)
+    return ok
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    paths = list(IMAGE_PATHS)
+    if IMAGE_DIR and os.path.isdir(IMAGE_DIR):
+        paths += [os.path.join(IMAGE_DIR, f) for f in sorted(os.listdir(IMAGE_DIR))
+                  if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))]
+    if COLOR_JPEG_CASE and paths:
+        paths.append(make_color_jpeg(paths[0]))
+
+    sys.exit(0 if check_parity(paths) else 1)
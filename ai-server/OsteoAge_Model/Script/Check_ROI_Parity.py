@@ -0,0 +1,123 @@
+# =============================================================================
+# 축소 해상도 ROI 추출 일치성(parity) 리포트 스크립트
+# =============================================================================
+#
+# 용도: 원본 해상도 ROI 탐색 대비 축소본 ROI 탐색(OSTEOAGE_ROI_MAX_SIDE)의
+#       bounding box / 마스크 IoU와 소요 시간을 비교하여 리포트(JSON) 저장
+#
+# 사용법:
+#   1. 아래 IMAGE_PATHS(또는 IMAGE_DIR)에 평가용 X-ray 지정
+#   2. python Check_ROI_Parity.py
+#   3. 결과가 콘솔에 출력되고 Data/roi_parity_report.json으로 저장됨
+#   4. 최소 마스크 IoU가 MIN_MASK_IOU, 최소 bbox IoU가 MIN_BBOX_IOU 이상인(passed) max_side를
+#      서버에서 OSTEOAGE_ROI_MAX_SIDE=<값> 으로 사용
+#
+# * 마스크는 모델 입력(마스크 밖 0)을 직접 바꾸므로 bbox보다 마스크 IoU 기준이 우선
+#
+# * ROI 입력은 파이프라인과 같이 표준화(standardize_gray_array) 후 이미지 기준
+# * 모델 체크포인트 없이 실행 가능
+# =============================================================================
+
+import os
+import json
+import datetime
+import numpy as np
+
+from CPU_BoneAge_PAH_Compact import (
+    PROJECT_ROOT, DATA_DIR, CRITERIA_JSON_PATH,
+    load_criteria, load_image_gray, standardize_gray_array, roi_parity,
+)
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 평가 이미지 (IMAGE_DIR가 있으면 폴더 내 이미지 전체 추가)
+IMAGE_PATHS = [os.path.join(PROJECT_ROOT, "Total raw image", "Test Image.jpg")]
+IMAGE_DIR = None
+
+# 비교할 축소 해상도 (긴 변 기준 px)
+MAX_SIDES = [1536, 1024, 768, 512]
+
+# 표준화 후 이미지에서 ROI 탐색 (False면 원본 그레이스케일)
+STANDARDIZE_FIRST = True
+
+# 권장 기준 (이미지 전체에서 최소 IoU, 둘 다 만족해야 passed)
+MIN_MASK_IOU = 0.95
+MIN_BBOX_IOU = 0.95
+
+# 리포트 저장 경로
+REPORT_PATH = os.path.join(DATA_DIR, "roi_parity_report.json")
+
+# =============================================================================
+# 메인 로직
+# =============================================================================
+
+def evaluate_roi_parity(image_paths: list, max_sides=MAX_SIDES) -> dict:
+    """
+    이미지 × max_side별 ROI IoU/시간 비교
+
+    Returns:
+        dict: max_side별 요약과 이미지별 결과
+    """
+    print("=" * 70)
+    print("🔍 축소 해상도 ROI parity 검사 (원본 해상도 대비)")
+    print("=" * 70)
+
+    criteria = load_criteria(CRITERIA_JSON_PATH)
+    rows = []
+    for path in image_paths:
+        gray = load_image_gray(path)
+        if STANDARDIZE_FIRST:
+            gray = standardize_gray_array(gray, criteria)
+        for max_side in max_sides:
+            res = roi_parity(gray, max_side)
+            rows.append({"image": os.path.basename(path), "max_side": max_side, **res})
+            print(f"   {os.path.basename(path)} [{max_side}px] bbox IoU {res['bbox_iou']:.3f}, "
+                  f"mask IoU {res['mask_iou']:.3f} | {res['ms_full']:.0f} → {res['ms_scaled']:.0f}ms")
+
+    summary = {}
+    for max_side in max_sides:
+        sel = [r for r in rows if r["max_side"] == max_side]
+        iou = np.array([r["bbox_iou"] for r in sel])
+        mask_iou = np.array([r["mask_iou"] for r in sel])
+        summary[str(max_side)] = {
+            "bbox_iou_mean": float(iou.mean()),
+            "bbox_iou_min": float(iou.min()),
+            "mask_iou_mean": float(mask_iou.mean()),
+            "mask_iou_min": float(mask_iou.min()),
+            "ms_full": float(np.mean([r["ms_full"] for r in sel])),
+            "ms_scaled": float(np.mean([r["ms_scaled"] for r in sel])),
+            "passed": bool(mask_iou.min() >= MIN_MASK_IOU and iou.min() >= MIN_BBOX_IOU),
+        }
+
+    print("\n" + "=" * 70)
+    for max_side, sm in summary.items():
+        print(f"{'✅' if sm['passed'] else '⚠️'} {max_side}px: 마스크 IoU 평균 {sm['mask_iou_mean']:.3f} / 최소 {sm['mask_iou_min']:.3f}, "
+              f"bbox IoU 최소 {sm['bbox_iou_min']:.3f}, {sm['ms_full']:.0f} → {sm['ms_scaled']:.0f}ms")
+    print("=" * 70)
+    return {
+        "created_at": datetime.datetime.now().isoformat(),
+        "standardize_first": STANDARDIZE_FIRST,
+        "min_mask_iou": MIN_MASK_IOU,
+        "min_bbox_iou": MIN_BBOX_IOU,
+        "n_images": len(image_paths),
+        "summary": summary,
+        "cases": rows,
+    }
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    paths = list(IMAGE_PATHS)
+    if IMAGE_DIR and os.path.isdir(IMAGE_DIR):
+        paths += [os.path.join(IMAGE_DIR, f) for f in sorted(os.listdir(IMAGE_DIR))
+                  if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))]
+
+    result = evaluate_roi_parity(paths)
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 리포트 저장: {REPORT_PATH}")
@@ -0,0 +1,114 @@
+# =============================================================================
+# PAH 재계산 엔드포인트 일치성(parity) 검사 스크립트
+# =============================================================================
+#
+# 용도: AI 서버의 POST /recalculate (1건)와 POST /recalculate_batch (열 형식 일괄)가
+#       같은 환자 입력에 대해 같은 16개 필드 결과를 돌려주는지 확인
+#       (부모키 결측 표현 null / "" / 0 처리 포함)
+#
+# 사용법:
+#   1. 필요 시 아래 CASES에 검사할 입력 추가
+#   2. python Check_Recalculate_Parity.py
+#   3. 필드 하나라도 다르면 실패(종료 코드 1)
+#
+# * 모델 체크포인트 없이 실행 가능 (Flask test client, LMS 데이터만 필요)
+# =============================================================================
+
+import os
+import sys
+import math
+
+# app 모듈 import 시 모델 백그라운드 로드 생략 (재계산은 LMS만 사용)
+os.environ.setdefault("OSTEOAGE_EAGER_LOAD", "0")
+
+from CPU_BoneAge_PAH_Compact import PROJECT_ROOT
+
+sys.path.insert(0, os.path.dirname(PROJECT_ROOT))
+from app import app  # noqa: E402
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 검사 입력 (/recalculate와 같은 키, 부모키는 값/null/""/0 조합)
+CASES = [
+    {"bone_age_years": 11, "bone_age_months": 0, "sex": 1, "height": 140.5, "age_months": 130,
+     "father_height": 175.0, "mother_height": 162.0},
+    {"bone_age_years": 9, "bone_age_months": 6, "sex": 0, "height": 132.0, "age_months": 118,
+     "father_height": 0, "mother_height": 160.0},
+    {"bone_age_years": 12, "bone_age_months": 3, "sex": 1, "height": 150.2, "age_months": 140,
+     "father_height": 0, "mother_height": 0},
+    {"bone_age_years": 7, "bone_age_months": 0, "sex": 0, "height": 118.0, "age_months": 90,
+     "father_height": None, "mother_height": 158.0},
+    {"bone_age_years": 13, "bone_age_months": 9, "sex": 0, "height": 155.0, "age_months": 160,
+     "father_height": "", "mother_height": ""},
+    {"bone_age_years": 10, "bone_age_months": 0, "sex": 1, "height": 136.0, "age_months": 125,
+     "father_height": 0.0, "mother_height": 165.5},
+]
+
+# 숫자 필드 허용 오차 (반올림된 결과 기준)
+FLOAT_TOLERANCE = 1e-9
+
+# =============================================================================
+# 메인 로직
+# =============================================================================
+
+def same_value(a, b, tol=FLOAT_TOLERANCE):
+    """결과 필드 비교 (숫자는 허용 오차, NaN/None은 같은 결측으로 취급)"""
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        if math.isnan(a) or math.isnan(b):
+            return math.isnan(a) and math.isnan(b)
+        return abs(a - b) <= tol
+    return a == b
+
+
+def check_recalculate_parity(cases=CASES) -> bool:
+    """
+    케이스별 /recalculate 결과와 /recalculate_batch 결과 비교
+
+    Returns:
+        bool: 모든 케이스의 모든 필드가 같으면 True
+    """
+    print("=" * 70)
+    print("🔍 /recalculate vs /recalculate_batch parity 검사")
+    print("=" * 70)
+
+    client = app.test_client()
+    singles = []
+    for case in cases:
+        resp = client.post("/recalculate", json=case)
+        body = resp.get_json()
+        if resp.status_code != 200 or not body.get("success"):
+            print(f"   ✗ /recalculate 실패: {body.get('message')}")
+            return False
+        singles.append(body["data"])
+
+    batch_body = {k: [case.get(k) for case in cases] for k in cases[0]}
+    resp = client.post("/recalculate_batch", json=batch_body)
+    body = resp.get_json()
+    if resp.status_code != 200 or not body.get("success"):
+        print(f"   ✗ /recalculate_batch 실패: {body.get('message')}")
+        return False
+
+    ok = True
+    for i, (single, batch) in enumerate(zip(singles, body["data"])):
+        diffs = [k for k in single if not same_value(single[k], batch.get(k))]
+        ok &= not diffs
+        parents = f"father={cases[i].get('father_height')!r}, mother={cases[i].get('mother_height')!r}"
+        if diffs:
+            print(f"   ✗ case {i + 1} ({parents}): " + ", ".join(f"{k} {single[k]} ≠ {batch.get(k)}" for k in diffs))
+        else:
+            print(f"   ✓ case {i + 1} ({parents}): PAH_Final {single['PAH_Final']}, MPH {single['MPH']}")
+
+    print("\n" + "=" * 70)
+    print(f"{'✅ 통과' if ok else '❌ 실패'} ({len(cases)}건)")
+    print("=" * 70)
+    return ok
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    sys.exit(0 if check_recalculate_parity() else 1)
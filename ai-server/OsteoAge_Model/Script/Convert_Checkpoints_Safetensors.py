@@ -0,0 +1,127 @@
+# =============================================================================
+# Fold 체크포인트 → safetensors 변환 스크립트
+# =============================================================================
+#
+# 용도: 5-Fold 모델 가중치(*.pth)를 memory-map 가능한 safetensors 형식으로 변환
+#
+# 효과:
+#   - torch.load는 약 2GB를 읽어 unpickle 후 프로세스 전용 메모리에 복사함
+#   - safetensors는 파일을 mmap 하여 파라미터가 파일 페이지를 직접 참조
+#     → 기동 시간이 수 초로 단축되고, 같은 호스트의 여러 워커 프로세스가
+#       OS page cache의 동일한 페이지를 공유 (워커마다 2GB 중복 없음)
+#
+# 사용법:
+#   1. python Convert_Checkpoints_Safetensors.py
+#   2. 각 *_fold{i}.pth 옆에 *_fold{i}.safetensors 파일이 생성됨
+#   3. CPU_BoneAge_PAH_Compact.py는 .safetensors가 있으면 자동으로 mmap 로드
+#      (끄려면 환경변수 OSTEOAGE_MMAP_CHECKPOINTS=0)
+#
+# * 변환 후 원본 .pth와 텐서 값이 완전히 같은지 검증함
+# =============================================================================
+
+import os
+import torch
+from safetensors.torch import save_file, load_file
+
+from CPU_BoneAge_PAH_Compact import MODEL_PATHS, safetensors_path_for
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 변환할 체크포인트 목록 (기본: 메인 스크립트의 5-Fold 경로)
+INPUT_MODEL_PATHS = MODEL_PATHS
+
+# 이미 변환된 파일이 있으면 덮어쓸지 여부
+OVERWRITE = False
+
+# =============================================================================
+# 메인 로직
+# =============================================================================
+
+def convert_checkpoint(pth_path: str, save_path: str) -> dict:
+    """
+    단일 .pth 체크포인트를 safetensors로 변환 및 검증
+    
+    Args:
+        pth_path: 입력 체크포인트 경로 (.pth, state_dict)
+        save_path: 출력 경로 (.safetensors)
+    
+    Returns:
+        dict: 결과 정보
+    """
+    sd = torch.load(pth_path, map_location="cpu")
+    if not isinstance(sd, dict) or not all(torch.is_tensor(v) for v in sd.values()):
+        return {"success": False, "error": "state_dict(텐서 dict) 형식이 아님"}
+    
+    # safetensors는 연속 메모리 + 텐서 간 메모리 공유 없음이 필요
+    tensors = {k: v.detach().contiguous().clone() for k, v in sd.items()}
+    save_file(tensors, save_path, metadata={"format": "pt", "source": os.path.basename(pth_path)})
+    
+    # 검증: 키/shape/dtype/값 일치
+    loaded = load_file(save_path, device="cpu")
+    if set(loaded) != set(tensors):
+        return {"success": False, "error": "키 불일치"}
+    for k, v in tensors.items():
+        if loaded[k].dtype != v.dtype or loaded[k].shape != v.shape or not torch.equal(loaded[k], v):
+            return {"success": False, "error": f"텐서 불일치: {k}"}
+    
+    return {
+        "success": True,
+        "n_tensors": len(tensors),
+        "size_mb": os.path.getsize(save_path) / 1e6,
+    }
+
+
+def convert_fold_checkpoints(model_paths: list, overwrite: bool = False) -> dict:
+    """
+    fold 체크포인트 전체 변환
+    
+    Args:
+        model_paths: 변환할 .pth 경로 목록
+        overwrite: 기존 .safetensors 덮어쓰기 여부
+    
+    Returns:
+        dict: 경로별 결과
+    """
+    print("=" * 70)
+    print("🔧 Fold 체크포인트 → safetensors 변환")
+    print("=" * 70)
+    
+    results = {}
+    for pth_path in model_paths:
+        save_path = safetensors_path_for(pth_path)
+        name = os.path.basename(pth_path)
+        print(f"\n📂 {name}")
+        
+        if not os.path.exists(pth_path):
+            print(f"   ❌ 파일이 존재하지 않습니다!")
+            results[pth_path] = {"success": False, "error": "파일 없음"}
+            continue
+        if os.path.exists(save_path) and not overwrite:
+            print(f"   ⚠ 이미 존재하여 건너뜀: {os.path.basename(save_path)}")
+            results[pth_path] = {"success": True, "skipped": True}
+            continue
+        
+        res = convert_checkpoint(pth_path, save_path)
+        if res["success"]:
+            print(f"   ✓ 저장: {os.path.basename(save_path)} ({res['n_tensors']}개 텐서, {res['size_mb']:.1f}MB)")
+        else:
+            print(f"   ❌ 실패: {res['error']}")
+            if os.path.exists(save_path):
+                os.remove(save_path)
+        results[pth_path] = res
+    
+    n_ok = sum(1 for r in results.values() if r["success"])
+    print("\n" + "=" * 70)
+    print(f"✅ 완료: {n_ok}/{len(results)}개")
+    print("=" * 70)
+    return results
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    convert_fold_checkpoints(INPUT_MODEL_PATHS, overwrite=OVERWRITE)
@@ -9,6 +9,7 @@
 #   2. 아래 설정값 수정
 #   3. 스크립트 실행
 #   4. 생성된 .joblib 파일을 CPU_단일~.py의 ISOTONIC_CALIBRATOR_PATH에 지정
+#      (병원별 Calibrator는 Calibration_Model/hospitals/<병원 ID>.joblib로 복사하면 재시작 없이 적용)
 # =============================================================================
 # Calibration 최소 샘플 수 기준 (1)
 
@@ -0,0 +1,154 @@
+# =============================================================================
+# INT8 양자화 fold 앙상블 정확도/속도 평가 스크립트
+# =============================================================================
+#
+# 용도: fp32 앙상블 대비 INT8 동적 양자화 앙상블의 뼈나이 drift(개월)와
+#       CPU 지연시간, 모델 크기를 비교하여 리포트(JSON) 저장
+#
+# 사용법:
+#   1. 아래 IMAGE_PATHS(또는 IMAGE_DIR)에 평가용 X-ray 지정
+#   2. python Evaluate_Quantization.py
+#   3. 결과가 콘솔에 출력되고 Model9_ROI/*_int8_drift_report.json으로 저장됨
+#   4. drift가 허용 범위 이내면 서버에서 OSTEOAGE_QUANTIZE=int8 로 사용
+#
+# * 전처리는 predict_bone_age와 동일 (DEFAULT_PREPROCESS_CONFIG)
+# * 뼈나이 drift는 Clamp/Isotonic 보정 전 앙상블 원출력 기준
+# =============================================================================
+
+import os
+import io
+import json
+import time
+import datetime
+import numpy as np
+import torch
+
+from CPU_BoneAge_PAH_Compact import (
+    PROJECT_ROOT, MODEL_DIR, MODEL_NAME, MODEL_PATHS, WEIGHT_PATH, CRITERIA_JSON_PATH,
+    DEVICE, DEFAULT_PREPROCESS_CONFIG,
+    load_fold_models, load_ensemble_weights, load_criteria, imread_unicode_color,
+    preprocess_bgr, bgr_to_tensor, quantize_fold_models, FoldLoopEnsemble,
+)
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 평가 이미지 (IMAGE_DIR가 있으면 폴더 내 이미지 전체 추가)
+IMAGE_PATHS = [os.path.join(PROJECT_ROOT, "Total raw image", "Test Image.jpg")]
+IMAGE_DIR = None
+
+# 이미지마다 평가할 성별 (1=남자, 0=여자)
+SEXES = (0, 1)
+
+# 지연시간 측정 반복 횟수 (첫 실행은 워밍업으로 제외)
+TIMING_REPEATS = 3
+
+# 리포트 저장 경로
+REPORT_PATH = os.path.join(MODEL_DIR, f"{MODEL_NAME}_int8_drift_report.json")
+
+# =============================================================================
+# 메인 로직
+# =============================================================================
+
+def state_dict_size_mb(model) -> float:
+    """직렬화된 state_dict 크기 (MB)"""
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / 1e6
+
+
+@torch.no_grad()
+def timed_predict(ensemble, x, s, repeats):
+    """앙상블 예측값과 평균 지연시간(ms) 반환"""
+    ensemble(x, s)
+    t = time.perf_counter()
+    for _ in range(repeats):
+        pred, _ = ensemble(x, s)
+    return float(pred[0]), (time.perf_counter() - t) * 1000.0 / repeats
+
+
+def evaluate_int8_drift(image_paths: list, sexes=SEXES, repeats=TIMING_REPEATS) -> dict:
+    """
+    fp32 vs INT8 앙상블 비교
+    
+    Args:
+        image_paths: 평가 이미지 경로 목록
+        sexes: 이미지마다 평가할 성별
+        repeats: 지연시간 측정 반복 횟수
+    
+    Returns:
+        dict: drift/지연시간/크기 리포트
+    """
+    print("=" * 70)
+    print("🔧 INT8 동적 양자화 평가 (fp32 앙상블 대비)")
+    print("=" * 70)
+    
+    # 1. 모델 로드 및 양자화
+    print(f"\n📂 [STEP 1] 모델 로드 및 양자화")
+    weights = load_ensemble_weights(WEIGHT_PATH)
+    fp32_models = load_fold_models(DEVICE, MODEL_PATHS)
+    int8_models = quantize_fold_models(fp32_models, "int8")
+    ref = FoldLoopEnsemble(fp32_models, weights).eval()
+    cand = FoldLoopEnsemble(int8_models, weights).eval()
+    size_fp32 = sum(state_dict_size_mb(m) for m in fp32_models)
+    size_int8 = sum(state_dict_size_mb(m) for m in int8_models)
+    print(f"   ✓ 모델 크기: fp32 {size_fp32:.0f}MB → int8 {size_int8:.0f}MB")
+    
+    # 2. 이미지별 비교
+    print(f"\n📊 [STEP 2] 이미지별 비교 ({len(image_paths)}장 × 성별 {len(sexes)})")
+    criteria = load_criteria(CRITERIA_JSON_PATH)
+    rows = []
+    for path in image_paths:
+        x = bgr_to_tensor(preprocess_bgr(imread_unicode_color(path), criteria, DEFAULT_PREPROCESS_CONFIG)).unsqueeze(0).to(DEVICE)
+        for sex in sexes:
+            s = torch.tensor([int(sex)], dtype=torch.long, device=DEVICE)
+            p32, ms32 = timed_predict(ref, x, s, repeats)
+            p8, ms8 = timed_predict(cand, x, s, repeats)
+            rows.append({"image": os.path.basename(path), "sex": int(sex),
+                         "fp32": p32, "int8": p8, "drift": p8 - p32,
+                         "latency_ms_fp32": ms32, "latency_ms_int8": ms8})
+            print(f"   {os.path.basename(path)} (sex={sex}): {p32:.2f} → {p8:.2f}M ({p8 - p32:+.2f}), "
+                  f"{ms32:.0f} → {ms8:.0f}ms")
+    
+    # 3. 요약
+    drift = np.array([r["drift"] for r in rows])
+    lat32 = np.array([r["latency_ms_fp32"] for r in rows])
+    lat8 = np.array([r["latency_ms_int8"] for r in rows])
+    report = {
+        "created_at": datetime.datetime.now().isoformat(),
+        "quantization": "dynamic_int8_linear",
+        "n_cases": len(rows),
+        "drift_mae_months": float(np.mean(np.abs(drift))),
+        "drift_max_months": float(np.max(np.abs(drift))),
+        "drift_mean_months": float(np.mean(drift)),
+        "latency_ms_fp32": float(lat32.mean()),
+        "latency_ms_int8": float(lat8.mean()),
+        "speedup": float(lat32.mean() / lat8.mean()),
+        "size_mb_fp32": size_fp32,
+        "size_mb_int8": size_int8,
+        "cases": rows,
+    }
+    
+    print("\n" + "=" * 70)
+    print(f"✅ 뼈나이 drift: MAE {report['drift_mae_months']:.3f}, 최대 {report['drift_max_months']:.3f}, "
+          f"평균 {report['drift_mean_months']:+.3f} 개월")
+    print(f"   지연시간: {report['latency_ms_fp32']:.0f} → {report['latency_ms_int8']:.0f}ms (x{report['speedup']:.2f})")
+    print("=" * 70)
+    return report
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    paths = list(IMAGE_PATHS)
+    if IMAGE_DIR and os.path.isdir(IMAGE_DIR):
+        paths += [os.path.join(IMAGE_DIR, f) for f in sorted(os.listdir(IMAGE_DIR))
+                  if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))]
+    
+    result = evaluate_int8_drift(paths)
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 리포트 저장: {REPORT_PATH}")
@@ -0,0 +1,121 @@
+# =============================================================================
+# Fold 모델 ONNX 변환 스크립트
+# =============================================================================
+#
+# 용도: 5-Fold 모델의 forward(img, sex)를 ONNX 그래프로 변환 (배치 축 동적)
+#
+# 효과:
+#   - ONNX Runtime의 그래프 최적화(연산 fusion)와 스레드 풀 제어로 CPU 지연 감소
+#   - 운영 서버에서 timm 없이 추론 가능
+#
+# 사용법:
+#   0. pip install -r requirements-onnx.txt (onnx, onnxruntime 선택 의존성)
+#   1. python Export_ONNX_Models.py
+#   2. 각 *_fold{i}.pth 옆에 *_fold{i}.onnx 파일이 생성됨
+#   3. 서버 실행 시 환경변수 OSTEOAGE_BACKEND=onnx 로 ONNX Runtime 백엔드 사용
+#      (세션 스레드 수: OSTEOAGE_ORT_THREADS)
+#
+# * 변환 후 ONNX Runtime 출력이 PyTorch 출력과 일치하는지 검증함
+# * INT8 양자화(OSTEOAGE_QUANTIZE)는 torch 백엔드 전용이며 여기서는 fp32 그래프를 생성
+# =============================================================================
+
+import os
+import numpy as np
+import torch
+
+from CPU_BoneAge_PAH_Compact import MODEL_PATHS, IMG_SIZE, load_single_model, onnx_path_for
+
+# =============================================================================
+# 사용자 설정 (여기만 수정)
+# =============================================================================
+
+# 변환할 체크포인트 목록 (기본: 메인 스크립트의 5-Fold 경로)
+INPUT_MODEL_PATHS = MODEL_PATHS
+
+# ONNX opset 버전 (LayerNormalization 연산 사용을 위해 17 이상)
+OPSET_VERSION = 17
+
+# 검증 허용 오차 (뼈나이, 개월)
+MAX_ABS_DIFF_MONTHS = 0.01
+
+# =============================================================================
+# 메인 로직
+# =============================================================================
+
+def export_fold_onnx(model, save_path: str, img_size: int = IMG_SIZE, opset: int = OPSET_VERSION):
+    """
+    fold 모델 1개를 ONNX로 저장
+    
+    입력: img (B, 3, img_size, img_size) float32, sex (B,) int64
+    출력: pred_reg (B,), logits (B, num_bins)
+    """
+    model = model.cpu().eval()
+    dummy_img = torch.zeros(2, 3, img_size, img_size, dtype=torch.float32)
+    dummy_sex = torch.tensor([0, 1], dtype=torch.long)
+    torch.onnx.export(
+        model, (dummy_img, dummy_sex), save_path,
+        input_names=["img", "sex"],
+        output_names=["pred_reg", "logits"],
+        dynamic_axes={"img": {0: "batch"}, "sex": {0: "batch"}, "pred_reg": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+
+
+@torch.no_grad()
+def verify_onnx(model, onnx_path: str, img_size: int = IMG_SIZE) -> float:
+    """PyTorch와 ONNX Runtime 출력 비교 (배치 3, 최대 절대 오차 반환)"""
+    import onnxruntime as ort
+    sess = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    torch.manual_seed(0)
+    img = torch.randn(3, 3, img_size, img_size)
+    sex = torch.tensor([0, 1, 0], dtype=torch.long)
+    ref, _ = model(img, sex)
+    out = sess.run(["pred_reg"], {"img": img.numpy(), "sex": sex.numpy()})[0]
+    return float(np.max(np.abs(out - ref.numpy())))
+
+
+def export_fold_models(model_paths: list) -> dict:
+    """
+    fold 체크포인트 전체 ONNX 변환 및 검증
+    
+    Args:
+        model_paths: 변환할 .pth 경로 목록
+    
+    Returns:
+        dict: 경로별 결과
+    """
+    print("=" * 70)
+    print("🔧 Fold 모델 → ONNX 변환")
+    print("=" * 70)
+    
+    results = {}
+    for pth_path in model_paths:
+        save_path = onnx_path_for(pth_path)
+        print(f"\n📂 {os.path.basename(pth_path)}")
+        try:
+            model = load_single_model(pth_path, torch.device("cpu"))
+            export_fold_onnx(model, save_path)
+            diff = verify_onnx(model, save_path)
+        except Exception as e:
+            print(f"   ❌ 실패: {e}")
+            results[pth_path] = {"success": False, "error": str(e)}
+            continue
+        ok = diff <= MAX_ABS_DIFF_MONTHS
+        print(f"   {'✓' if ok else '⚠'} 저장: {os.path.basename(save_path)} "
+              f"({os.path.getsize(save_path) / 1e6:.1f}MB, 최대 오차 {diff:.5f}개월)")
+        results[pth_path] = {"success": ok, "onnx_path": save_path, "max_abs_diff": diff}
+    
+    n_ok = sum(1 for r in results.values() if r["success"])
+    print("\n" + "=" * 70)
+    print(f"✅ 완료: {n_ok}/{len(results)}개")
+    print("=" * 70)
+    return results
+
+
+# =============================================================================
+# 실행
+# =============================================================================
+
+if __name__ == "__main__":
+    export_fold_models(INPUT_MODEL_PATHS)
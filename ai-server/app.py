@@ -1,75 +1,359 @@
+import io
 import os
 import sys
+import hmac
 import json
-import tempfile
-from flask import Flask, request, jsonify
+import math
+import time
+import socket
+import ipaddress
+import threading
+from urllib.parse import urlparse
+from flask import Flask, Request, Response, g, request, jsonify
 
 # Osteoage 모델 Script 경로 추가
 
 SCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "OsteoAge_Model", "Script")
 sys.path.insert(0, SCRIPT_DIR)
 
-from CPU_BoneAge_PAH_Compact import predict_bone_age, recalculate_pah
+from CPU_BoneAge_PAH_Compact import (
+    predict_bone_age, predict_bone_age_batch, profile_predict_bone_age, recalculate_pah, recalculate_pah_batch, create_ensemble_scheduler,
+    warmup_resources, get_load_status, render_metrics, render_samples, LatencyHistogram, CounterMetric,
+    is_valid_hospital_id
+)
+from job_queue import JobQueue, JobQueueFull
+
+
+class InMemoryRequest(Request):
+    """업로드 파일을 디스크 임시 파일 대신 메모리(BytesIO)에 받는 요청 클래스"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+# 업로드는 메모리에 저장되므로 요청 크기 제한 (MB)
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.environ.get("OSTEOAGE_MAX_UPLOAD_MB", "64")) * 1024 * 1024)
+
+# 마이크로 배칭 설정 (동시 /predict 요청을 모아 fold당 배치 forward 1회로 처리)
+MICROBATCH_ENABLED = os.environ.get("OSTEOAGE_MICROBATCH", "1") == "1"
+MICROBATCH_WAIT_MS = float(os.environ.get("OSTEOAGE_MICROBATCH_WAIT_MS", "10"))
+MICROBATCH_MAX_SIZE = int(os.environ.get("OSTEOAGE_MICROBATCH_MAX_SIZE", "8"))
+
+scheduler = create_ensemble_scheduler(MICROBATCH_MAX_SIZE, MICROBATCH_WAIT_MS) if MICROBATCH_ENABLED else None
+
+# 비동기 작업 큐 설정 (/jobs/predict: 제출 즉시 job id 반환, 큐가 가득 차면 429 + Retry-After)
+#   큐 길이/워커 수는 프로세스(serve.py 워커)별. 워커 수 기본값은 마이크로 배치 크기 (동시 작업이 한 배치로 묶이도록)
+JOB_QUEUE_SIZE = int(os.environ.get("OSTEOAGE_JOB_QUEUE_SIZE", "32"))
+JOB_WORKERS = int(os.environ.get("OSTEOAGE_JOB_WORKERS", str(MICROBATCH_MAX_SIZE if MICROBATCH_ENABLED else 1)))
+JOB_TTL_SEC = float(os.environ.get("OSTEOAGE_JOB_TTL_SEC", "600"))  # 완료 후 결과 보관 시간
+JOB_DIR = os.environ.get("OSTEOAGE_JOB_DIR", "")  # 작업 상태 공유 디렉터리 (멀티 워커에서 폴링 시 필요)
+JOB_CALLBACK_TIMEOUT_SEC = float(os.environ.get("OSTEOAGE_JOB_CALLBACK_TIMEOUT_SEC", "5"))
+# 콜백 허용 호스트 (콤마 구분, 비어 있으면 callback_url 사용 불가)
+JOB_CALLBACK_HOSTS = {h.strip().lower() for h in os.environ.get("OSTEOAGE_JOB_CALLBACK_HOSTS", "").split(",") if h.strip()}
+# 허용 호스트가 루프백/사설/링크로컬 주소로 해석되는 경우도 허용 (병원 내부망 콜백 서버용, 기본 거부)
+JOB_CALLBACK_ALLOW_PRIVATE = os.environ.get("OSTEOAGE_JOB_CALLBACK_ALLOW_PRIVATE", "0") == "1"
+
+# 요청 단위 프로파일링 (/predict에 X-OsteoAge-Profile 헤더 또는 profile 폼 값 지정 시 torch profiler + 단계 tracer로 실행)
+#   진단용 opt-in: OSTEOAGE_PROFILING=1 + OSTEOAGE_PROFILE_TOKEN 설정 시에만 활성화되며 헤더/폼 값이 토큰과 같아야 함
+#   프로세스당 PROFILE_MIN_INTERVAL_SEC에 1회로 제한
+PROFILE_TOKEN = os.environ.get("OSTEOAGE_PROFILE_TOKEN", "")
+PROFILING_ENABLED = os.environ.get("OSTEOAGE_PROFILING", "0") == "1"
+if PROFILING_ENABLED and not PROFILE_TOKEN:
+    print("[WARN] OSTEOAGE_PROFILE_TOKEN이 없어 요청 단위 프로파일링을 비활성화합니다.")
+    PROFILING_ENABLED = False
+PROFILE_MIN_INTERVAL_SEC = float(os.environ.get("OSTEOAGE_PROFILE_MIN_INTERVAL_SEC", "60"))
+PROFILE_HEADER = "X-OsteoAge-Profile"
+_profile_lock = threading.Lock()
+_last_profile_at = [float("-inf")]
+
+# 기동 시 모델 로드 + 워밍업 (첫 요청 지연 제거). 배치 크기는 콤마 구분 (예: "1,4,8")
+EAGER_LOAD = os.environ.get("OSTEOAGE_EAGER_LOAD", "1") == "1"
+WARMUP_BATCH_SIZES = [int(b) for b in os.environ.get("OSTEOAGE_WARMUP_BATCH_SIZES", "1").split(",") if b.strip()]
+
+
+def _warmup_in_background():
+    try:
+        warmup_resources(WARMUP_BATCH_SIZES)
+    except Exception as e:
+        print(f"[ERROR] 모델 로드/워밍업 실패: {e}")
+
+
+if EAGER_LOAD:
+    threading.Thread(target=_warmup_in_background, name="warmup", daemon=True).start()
+
+
+# 요청 수/지연 시간 메트릭 (endpoint는 라우트 규칙 문자열, 예: /jobs/<job_id>)
+http_requests = CounterMetric("osteoage_http_requests_total", "HTTP requests by endpoint, method and status",
+                              ("endpoint", "method", "status"))
+http_latency = LatencyHistogram("osteoage_http_request_seconds", "HTTP request latency", ("endpoint",))
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    http_requests.inc((endpoint, request.method, str(response.status_code)))
+    if "request_started" in g:
+        http_latency.observe((endpoint,), time.perf_counter() - g.request_started)
+    return response
+
 
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok"})
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    # 모델 로드 + 워밍업이 끝난 경우에만 200 (로드밸런서 readiness 체크용)
+    status = get_load_status()
+    code = 200 if status["state"] == "ready" else 503
+    return jsonify({"ready": code == 200, **status}), code
+
+
+
+
+def parse_parent_height(value):
+    """부모키 파싱 (None/빈 문자열/0은 결측 → None, 모든 엔드포인트 공통으로 유전 보정 여부가 같도록)"""
+    if value is None or value == "":
+        return None
+    return float(value) or None
+
+
+def parse_predict_form():
+    """
+    /predict 계열 요청의 이미지 + 파라미터 파싱
+
+    Returns:
+        (params, None): predict_bone_age 인자 (image_path는 업로드 버퍼)
+        (None, message): 필수 값 누락 시 400 메시지
+    """
+    # 1. 이미지 파일 찾기
+    if "image" not in request.files:
+        return None, "이미지 파일이 필요합니다."
+    image = request.files["image"]
+
+    # 2. 필수 파라미터
+    sex = request.form.get("sex")
+    height = request.form.get("height")
+    age_months = request.form.get("age_months")
+    if not all ([sex , height, age_months]):
+        return None, "sex, height, age_months는 필수입니다."
+
+    # 3. 선택 파라미터 (부모키, 병원 ID: 병원별 Isotonic Calibrator 선택)
+    father_height = request.form.get("father_height")
+    mother_height = request.form.get("mother_height")
+    hospital_id = request.form.get("hospital_id") or None
+    if hospital_id is not None and not is_valid_hospital_id(hospital_id):
+        return None, "hospital_id는 영문/숫자/_/- 64자 이내여야 합니다."
+
+    return {
+        "image_path": image.stream,
+        "sex": int(sex),
+        "height": float(height),
+        "age_months": int(age_months),
+        "father_height": parse_parent_height(father_height),
+        "mother_height": parse_parent_height(mother_height),
+        "hospital_id": hospital_id,
+    }, None
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Prometheus 텍스트 형식. serve.py 멀티 워커에서는 응답한 워커 프로세스의 값
+    lines = render_metrics() + http_requests.render() + http_latency.render()
+    if scheduler is not None:
+        lines += render_samples("osteoage_microbatch_queue_depth", "Requests waiting for the micro-batch scheduler",
+                                [((), scheduler.queue_depth)])
+        stats = scheduler.stats_snapshot()
+        lines += render_samples("osteoage_microbatch_total", "Micro-batch scheduler batches, items and failed batches",
+                                [(("batches",), stats["batches"]), (("items",), stats["items"]), (("errors",), stats["errors"])],
+                                ("kind",), "counter")
+    lines += render_samples("osteoage_job_queue_depth", "Async jobs waiting in the queue", [((), job_queue.queue_depth)])
+    lines += render_samples("osteoage_job_running", "Async jobs currently running", [((), job_queue.running)])
+    lines += render_samples("osteoage_job_queue_capacity", "Async job queue capacity", [((), job_queue.max_queue)])
+    lines += render_samples("osteoage_jobs_total", "Async jobs by outcome",
+                            [((k,), v) for k, v in sorted(job_queue.stats.items())], ("outcome",), "counter")
+    return Response("\n".join(lines) + "\n", content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def check_profile_request():
+    """
+    이 요청을 프로파일링할지 결정
+
+    Returns:
+        None: 프로파일링 요청 없음
+        {}: 프로파일링 실행
+        {"skipped": 사유, ...}: 요청했지만 실행하지 않음 (disabled / invalid_token / rate_limited)
+    """
+    flag = request.headers.get(PROFILE_HEADER) or request.form.get("profile")
+    if not flag or flag.lower() in ("0", "false", "no"):
+        return None
+    if not PROFILING_ENABLED:
+        return {"skipped": "disabled"}
+    if not hmac.compare_digest(flag.encode(), PROFILE_TOKEN.encode()):
+        return {"skipped": "invalid_token"}
+    with _profile_lock:
+        wait = _last_profile_at[0] + PROFILE_MIN_INTERVAL_SEC - time.monotonic()
+        if wait > 0:
+            return {"skipped": "rate_limited", "retry_after": int(math.ceil(wait))}
+        _last_profile_at[0] = time.monotonic()
+    return {}
 
 
 @app.route("/predict", methods=["POST"])
 def predict():
     try : 
-        # 1. 이미지 파일 찾기
-        if "image" not in request.files:
-            return jsonify({"success": False, "message": "이미지 파일이 필요합니다."}), 400
-        
-        image = request.files["image"]
-
-        # 2. 필수 파라미터
-        sex = request.form.get("sex")
-        height = request.form.get("height")
-        age_months = request.form.get("age_months")
-        if not all ([sex , height, age_months]):
-            return jsonify({"success": False, "message": "sex, height, age_months는 필수입니다."}), 400
+        params, error = parse_predict_form()
+        if error:
+            return jsonify({"success": False, "message": error}), 400
 
-        sex = int(sex)
-        height = float(height)
-        age_months = int(age_months)
-
-        # 3. 선택 파라미터 (부모키)
-        father_height = request.form.get("father_height")
-        mother_height = request.form.get("mother_height")
-        father_height = float(father_height) if father_height else None
-        mother_height = float(mother_height) if mother_height else None
-
-        # 4. 이미지 임시 저장
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            image.save(tmp.name)
-            tmp_path = tmp.name
-
-
-        # 5. 예측 실행
-        result = predict_bone_age(
-            image_path=tmp_path,
-            sex=sex,
-            height=height,
-            age_months=age_months,
-            father_height=father_height,
-            mother_height=mother_height,
-            verbose=False
-        )
+        # 프로파일링 요청 시 단계별 시간 요약을 profile 필드로 함께 반환 (전체 trace는 파일로 저장)
+        profile = check_profile_request()
+        if profile == {}:
+            result, profile = profile_predict_bone_age(**params)
+            return jsonify({"success": True, "data": result, "profile": profile})
 
-        # 6. 임시 파일 삭제
-        os.unlink(tmp_path)
+        # 예측 실행 (업로드 버퍼를 메모리에서 바로 디코딩)
+        result = predict_bone_age(**params, verbose=False, scheduler=scheduler)
 
+        if profile is not None:
+            return jsonify({"success": True, "data": result, "profile": profile})
         return jsonify({"success": True, "data": result})
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
+
+
+def run_predict_job(params):
+    """작업 큐 워커에서 실행되는 예측 (params["image_path"]는 업로드 바이트)"""
+    return predict_bone_age(**params, verbose=False, scheduler=scheduler)
+
+
+def is_internal_address(ip):
+    """루프백/사설/링크로컬 등 외부 콜백 대상으로 허용하지 않는 주소인지"""
+    addr = ipaddress.ip_address(ip)
+    if getattr(addr, "ipv4_mapped", None):
+        addr = addr.ipv4_mapped
+    return (addr.is_loopback or addr.is_private or addr.is_link_local or addr.is_reserved
+            or addr.is_multicast or addr.is_unspecified)
+
+
+def check_callback_url(url):
+    """
+    콜백 URL 검사, 문제 없으면 None
+
+    http(s) + OSTEOAGE_JOB_CALLBACK_HOSTS에 등록된 호스트만 허용하며, DNS 해석 결과에
+    루프백/사설/링크로컬 주소가 있으면 거부 (OSTEOAGE_JOB_CALLBACK_ALLOW_PRIVATE=1 제외).
+    제출 시와 콜백 전송 직전에 모두 검사
+    """
+    if not JOB_CALLBACK_HOSTS:
+        return "callback_url을 사용하려면 서버에 OSTEOAGE_JOB_CALLBACK_HOSTS가 설정되어야 합니다."
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url은 http(s) URL이어야 합니다."
+    host = parsed.hostname.lower()
+    if host not in JOB_CALLBACK_HOSTS:
+        return f"허용되지 않은 callback_url 호스트입니다: {host}"
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addrs = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, ValueError) as e:
+        return f"callback_url 호스트를 확인할 수 없습니다: {host} ({e})"
+    if not JOB_CALLBACK_ALLOW_PRIVATE and any(is_internal_address(a.split("%")[0]) for a in addrs):
+        return f"내부 주소로 해석되는 callback_url 호스트는 허용되지 않습니다: {host}"
+    return None
+
+
+job_queue = JobQueue(run_predict_job, JOB_QUEUE_SIZE, JOB_WORKERS, JOB_TTL_SEC, JOB_DIR, JOB_CALLBACK_TIMEOUT_SEC,
+                     callback_check=check_callback_url)
+
+
+@app.route("/jobs/predict", methods=["POST"])
+def submit_predict_job():
+    # /predict와 같은 폼 + 선택적 callback_url (완료 시 작업 상태를 JSON으로 POST)
+    try:
+        params, error = parse_predict_form()
+        callback_url = request.form.get("callback_url") or None
+        if not error and callback_url:
+            error = check_callback_url(callback_url)
+        if error:
+            return jsonify({"success": False, "message": error}), 400
+
+        # 요청이 끝나면 업로드 스트림이 닫히므로 바이트로 복사해 큐에 보관
+        params["image_path"] = params["image_path"].read()
+        try:
+            job = job_queue.submit(params, callback_url)
+        except JobQueueFull as e:
+            resp = jsonify({"success": False, "message": "작업 대기열이 가득 찼습니다. 잠시 후 다시 시도해 주세요.",
+                            "retry_after": e.retry_after})
+            resp.headers["Retry-After"] = str(e.retry_after)
+            return resp, 429
+
+        resp = jsonify({"success": True, **job, "queue_depth": job_queue.queue_depth})
+        resp.headers["Location"] = f"/jobs/{job['job_id']}"
+        return resp, 202
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    # status: queued | running | done (data 포함) | failed (message 포함)
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "작업을 찾을 수 없습니다 (만료되었거나 잘못된 job_id)."}), 404
+    return jsonify({"success": True, **job})
+
     
+@app.route("/predict_batch", methods=["POST"])
+def predict_batch():
+    try:
+        # 1. 이미지 파일 목록 (images 필드 여러 개)
+        images = request.files.getlist("images")
+        if not images:
+            return jsonify({"success": False, "message": "이미지 파일이 필요합니다."}), 400
+        n = len(images)
+
+        # 2. 이미지별 파라미터 (이미지와 같은 순서로 같은 개수만큼 전달)
+        sexes = request.form.getlist("sex")
+        heights = request.form.getlist("height")
+        ages = request.form.getlist("age_months")
+        if not (len(sexes) == len(heights) == len(ages) == n):
+            return jsonify({"success": False, "message": "sex, height, age_months는 이미지 수만큼 필요합니다."}), 400
+        if not all(sexes + heights + ages):
+            return jsonify({"success": False, "message": "sex, height, age_months는 필수입니다."}), 400
+
+        # 3. 선택 파라미터 (부모키, 없으면 빈 문자열로 자리 유지)
+        fathers = request.form.getlist("father_height") or [""] * n
+        mothers = request.form.getlist("mother_height") or [""] * n
+        if len(fathers) != n or len(mothers) != n:
+            return jsonify({"success": False, "message": "father_height, mother_height는 이미지 수만큼 필요합니다."}), 400
+        hospital_id = request.form.get("hospital_id") or None  # 요청 전체에 공통 적용
+        if hospital_id is not None and not is_valid_hospital_id(hospital_id):
+            return jsonify({"success": False, "message": "hospital_id는 영문/숫자/_/- 64자 이내여야 합니다."}), 400
+
+        # 4. 이미지는 업로드 버퍼 그대로 전달 (메모리에서 디코딩)
+        items = [{
+            "image_path": images[i].stream,
+            "sex": int(sexes[i]),
+            "height": float(heights[i]),
+            "age_months": int(ages[i]),
+            "father_height": parse_parent_height(fathers[i]),
+            "mother_height": parse_parent_height(mothers[i]),
+        } for i in range(n)]
+
+        # 5. 일괄 예측 실행
+        results = predict_bone_age_batch(items, verbose=False, hospital_id=hospital_id)
+        return jsonify({"success": True, "data": results})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @app.route("/recalculate", methods=["POST"])
 def recalculate():
     try:
@@ -92,13 +376,49 @@ def recalculate():
             sex=int(sex),
             height=float(height),
             age_months=int(age_months),
-            father_height=float(father_height) if father_height else None,
-            mother_height=float(mother_height) if mother_height else None
+            father_height=parse_parent_height(father_height),
+            mother_height=parse_parent_height(mother_height)
         )
         return jsonify({"success": True, "data": result})
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
+
+@app.route("/recalculate_batch", methods=["POST"])
+def recalculate_batch():
+    try:
+        # 열(column) 형식: 키마다 같은 길이의 리스트 (/recalculate와 같은 키)
+        data = request.json or {}
+        required = ["bone_age_years", "bone_age_months", "sex", "height", "age_months"]
+        cols = {k: data.get(k) for k in required}
+        if any(not isinstance(v, list) for v in cols.values()):
+            return jsonify({"success": False, "message": "필수 파라미터 누락 (리스트 형식)"}), 400
+        n = len(cols["sex"])
+        if any(len(v) != n for v in cols.values()) or None in sum(cols.values(), []):
+            return jsonify({"success": False, "message": "필수 파라미터는 같은 길이여야 하며 누락값이 없어야 합니다."}), 400
+
+        # 선택 파라미터 (부모키: 결측은 null 또는 0 (/recalculate와 동일), PAH 보정 계수: 재채점용)
+        parents = {}
+        for k in ["father_height", "mother_height"]:
+            v = data.get(k)
+            if v is not None and (not isinstance(v, list) or len(v) != n):
+                return jsonify({"success": False, "message": f"{k}는 필수 파라미터와 같은 길이의 리스트여야 합니다."}), 400
+            parents[k] = [parse_parent_height(x) for x in v] if v is not None else None
+        coef = {k: float(data[k]) for k in ["w_D", "alpha"] if data.get(k) is not None}
+
+        results = recalculate_pah_batch(
+            bone_age_years=[int(x) for x in cols["bone_age_years"]],
+            bone_age_months=[int(x) for x in cols["bone_age_months"]],
+            sex=[int(x) for x in cols["sex"]],
+            height=[float(x) for x in cols["height"]],
+            age_months=[int(x) for x in cols["age_months"]],
+            **parents,
+            **coef
+        )
+        return jsonify({"success": True, "data": results})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
 if __name__ == "__main__":
     print("AI 서버 시작중... 모델 로딩 시간 걸림")
     app.run(host="0.0.0.0", port=9079, debug=False)
\ No newline at end of file
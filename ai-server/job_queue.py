@@ -0,0 +1,244 @@
+"""
+비동기 예측 작업 큐 (AI 서버 /jobs API용)
+
+제출 즉시 job id를 돌려주고, 워커 스레드가 큐 순서대로 예측을 실행.
+결과는 GET /jobs/<job_id> 폴링 또는 제출 시 지정한 callback_url로의 완료 POST로 수신.
+큐 길이를 제한하여 버스트 시 모든 요청이 함께 느려지는 대신 초과분은 즉시 거절 (429 + Retry-After).
+
+[상태]
+    queued → running → done | failed   (완료 후 ttl_sec 동안 조회 가능)
+
+* store_dir 지정 시 작업 상태를 JSON 파일로도 저장하여, 같은 디렉터리를 쓰는
+  다른 워커 프로세스(serve.py pre-fork)에서도 조회 가능.
+  환자 결과가 담기므로 디렉터리는 0o700(현재 사용자 소유), 파일은 0o600으로만 사용하고
+  완료 후 ttl_sec이 지나면 삭제
+"""
+import os
+import json
+import stat
+import math
+import time
+import uuid
+import queue
+import threading
+import urllib.request
+
+CALLBACK_RETRIES = 2  # 콜백 실패 시 재시도 횟수
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """콜백 응답의 리다이렉트를 따라가지 않음 (검사하지 않은 주소로의 요청 방지)"""
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+PRUNE_INTERVAL_SEC = 30.0  # 만료 작업 정리 주기
+
+
+class JobQueueFull(Exception):
+    """큐가 가득 차 작업을 받을 수 없음 (retry_after: 권장 재시도 대기 시간, 초)"""
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+def prepare_store_dir(path):
+    """
+    작업 상태 디렉터리 생성/검사 (없으면 0o700으로 생성)
+
+    Raises:
+        PermissionError: 심볼릭 링크이거나, 다른 사용자 소유이거나, 그룹/기타 사용자 권한이 있는 경우
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"작업 디렉터리가 디렉터리가 아님 (심볼릭 링크 불가): {path}")
+    if os.name != "nt":
+        if st.st_uid != os.getuid():
+            raise PermissionError(f"작업 디렉터리 소유자가 현재 사용자가 아님: {path}")
+        if st.st_mode & 0o077:
+            raise PermissionError(f"작업 디렉터리에 그룹/기타 사용자 권한이 있음 ({oct(st.st_mode & 0o777)}, 0o700 필요): {path}")
+    return path
+
+
+class JobQueue:
+    """
+    길이 제한 작업 큐 + 워커 스레드 풀
+
+    run_fn(payload)의 반환값(JSON 직렬화 가능)이 작업 결과(data)가 되고, 예외는 failed 상태로 기록.
+    callback_check(url)이 지정되면 콜백 전송 직전마다 다시 검사하여 오류 메시지를 반환하면 전송 중단
+    (제출 이후 DNS 변경 대응).
+    워커 스레드는 첫 제출 시 시작 (pre-fork 서버에서 fork 이후 각 워커 프로세스에서 생성되도록)
+    """
+    def __init__(self, run_fn, max_queue=32, num_workers=1, ttl_sec=600.0, store_dir="", callback_timeout=5.0,
+                 callback_check=None):
+        self.run_fn = run_fn
+        self.max_queue = max(1, int(max_queue))
+        self.num_workers = max(1, int(num_workers))
+        self.ttl_sec = float(ttl_sec)
+        self.store_dir = store_dir or None
+        self.callback_timeout = float(callback_timeout)
+        self.callback_check = callback_check
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._avg_sec = None  # 작업 처리 시간 지수 이동 평균 (Retry-After 추정용)
+        self._last_prune = 0.0
+        self.stats = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0}
+        if self.store_dir:
+            prepare_store_dir(self.store_dir)
+
+    @property
+    def queue_depth(self):
+        """대기 중인 작업 수"""
+        return self._queue.qsize()
+
+    @property
+    def running(self):
+        """실행 중인 작업 수"""
+        return self._running
+
+    def retry_after(self):
+        """현재 대기열이 비워질 때까지의 예상 시간 (초, 최소 1)"""
+        avg = self._avg_sec if self._avg_sec is not None else 1.0
+        return max(1, int(math.ceil((self.queue_depth + 1) * avg / self.num_workers)))
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.num_workers):
+                t = threading.Thread(target=self._run, name=f"JobQueue-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, payload, callback_url=None):
+        """
+        작업 1건 등록
+
+        Returns:
+            dict: 작업 상태 (job_id, status="queued", ...)
+
+        Raises:
+            JobQueueFull: 대기열이 가득 찬 경우
+        """
+        self._ensure_workers()
+        self._prune()
+        job = {"job_id": uuid.uuid4().hex, "status": "queued", "created_at": time.time()}
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+        try:
+            self._queue.put_nowait((job["job_id"], payload, callback_url))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job["job_id"], None)
+                self.stats["rejected"] += 1
+            raise JobQueueFull(self.retry_after())
+        with self._lock:
+            self.stats["submitted"] += 1
+        self._persist(job)
+        return dict(job)
+
+    def get(self, job_id):
+        """작업 상태 조회 (없거나 만료 시 None)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.store_dir and len(job_id) == 32 and all(c in "0123456789abcdef" for c in job_id):
+            try:
+                with open(os.path.join(self.store_dir, f"{job_id}.json"), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                return None
+            # 다른 워커가 저장한 작업은 정리 주기 전이라도 ttl_sec이 지나면 만료로 처리
+            if job.get("finished_at") is not None and time.time() - job["finished_at"] > self.ttl_sec:
+                return None
+            return job
+        return None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            snapshot = dict(job)
+        self._persist(snapshot)
+        return snapshot
+
+    def _persist(self, job):
+        if not self.store_dir:
+            return
+        path = os.path.join(self.store_dir, f"{job['job_id']}.json")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0), 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[WARN] 작업 상태 저장 실패 ({job['job_id']}): {e}")
+
+    def _prune(self):
+        """완료 후 ttl_sec이 지난 작업 정리 (메모리 + store_dir)"""
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL_SEC:
+            return
+        self._last_prune = now
+        with self._lock:
+            expired = [jid for jid, job in self._jobs.items()
+                       if job.get("finished_at") is not None and now - job["finished_at"] > self.ttl_sec]
+            for jid in expired:
+                del self._jobs[jid]
+        if self.store_dir:
+            for name in os.listdir(self.store_dir):
+                path = os.path.join(self.store_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > self.ttl_sec and name.split(".")[0] not in self._jobs:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _run(self):
+        while True:
+            try:
+                job_id, payload, callback_url = self._queue.get(timeout=PRUNE_INTERVAL_SEC)
+            except queue.Empty:
+                # 새 제출이 없어도 완료된 작업(환자 결과)이 ttl_sec 이후 남지 않도록 주기적으로 정리
+                self._prune()
+                continue
+            with self._lock:
+                self._running += 1
+            t = time.time()
+            self._update(job_id, status="running", started_at=t)
+            try:
+                job = self._update(job_id, status="done", data=self.run_fn(payload), finished_at=time.time())
+            except Exception as e:
+                job = self._update(job_id, status="failed", message=str(e), finished_at=time.time())
+            elapsed = job["finished_at"] - t
+            with self._lock:
+                self._running -= 1
+                self.stats[job["status"]] += 1
+                self._avg_sec = elapsed if self._avg_sec is None else 0.8 * self._avg_sec + 0.2 * elapsed
+            if callback_url:
+                threading.Thread(target=self._post_callback, args=(callback_url, job), name="JobCallback", daemon=True).start()
+
+    def _post_callback(self, url, job):
+        """완료된 작업 상태를 callback_url로 JSON POST (실패 시 재시도 후 경고만 출력)"""
+        body = json.dumps(job, ensure_ascii=False).encode("utf-8")
+        for attempt in range(CALLBACK_RETRIES + 1):
+            error = self.callback_check(url) if self.callback_check else None
+            if error:
+                print(f"[WARN] 작업 콜백 거부 ({job['job_id']} → {url}): {error}")
+                return
+            try:
+                req = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+                with _callback_opener.open(req, timeout=self.callback_timeout) as resp:
+                    resp.read()
+                return
+            except Exception as e:
+                if attempt == CALLBACK_RETRIES:
+                    print(f"[WARN] 작업 콜백 실패 ({job['job_id']} → {url}): {e}")
+                else:
+                    time.sleep(2 ** attempt)
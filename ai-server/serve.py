@@ -0,0 +1,132 @@
+"""
+AI 서버 프로덕션 실행 (pre-fork 멀티 워커)
+
+부모 프로세스에서 5-Fold 모델을 한 번만 로드한 뒤 워커 N개를 fork 하여
+가중치를 copy-on-write로 공유 (워커마다 약 2GB를 다시 로드하지 않음).
+모든 워커는 부모가 연 같은 listen 소켓에서 요청을 받으며, 워커별 torch 스레드 수를 지정 가능.
+
+[사용 방법]
+    OSTEOAGE_WORKERS=4 OSTEOAGE_WORKER_THREADS=4 python serve.py
+
+[환경변수]
+    OSTEOAGE_HOST / OSTEOAGE_PORT: 바인드 주소 (기본 0.0.0.0:9079)
+    OSTEOAGE_WORKERS: 워커 프로세스 수 (기본: CPU 코어 수 / 워커 스레드 수)
+    OSTEOAGE_WORKER_THREADS: 워커별 torch intra-op 스레드 수 (기본 4, 코어 수 이하)
+    OSTEOAGE_JOB_DIR: 비동기 작업(/jobs) 상태 공유 디렉터리 (기본: 실행마다 새로 만드는 0o700 임시 디렉터리,
+        지정 시 현재 사용자 소유의 0o700 디렉터리여야 함)
+
+* fork를 지원하지 않는 OS(Windows)에서는 단일 프로세스로 실행
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import atexit
+import shutil
+import socket
+import tempfile
+
+# 부모가 직접 로드하므로 app 모듈의 백그라운드 로드는 끔 (스레드가 도는 중에 fork 하지 않도록)
+os.environ["OSTEOAGE_EAGER_LOAD"] = "0"
+# 비동기 작업 상태를 워커 간 공유 (제출과 폴링이 다른 워커로 가도 조회되도록).
+#   미지정 시 예측 불가능한 이름의 전용 임시 디렉터리(0o700)를 만들어 워커에 환경변수로 전달하고 종료 시 삭제
+if not os.environ.get("OSTEOAGE_JOB_DIR"):
+    os.environ["OSTEOAGE_JOB_DIR"] = tempfile.mkdtemp(prefix=f"osteoage_jobs_{os.environ.get('OSTEOAGE_PORT', '9079')}_")
+    atexit.register(shutil.rmtree, os.environ["OSTEOAGE_JOB_DIR"], True)
+
+import torch
+from werkzeug.serving import make_server
+
+from app import app, WARMUP_BATCH_SIZES
+from CPU_BoneAge_PAH_Compact import load_resources, warmup_resources
+
+HOST = os.environ.get("OSTEOAGE_HOST", "0.0.0.0")
+PORT = int(os.environ.get("OSTEOAGE_PORT", "9079"))
+CPU_COUNT = os.cpu_count() or 1
+WORKER_THREADS = max(1, int(os.environ.get("OSTEOAGE_WORKER_THREADS", str(min(4, CPU_COUNT)))))
+NUM_WORKERS = max(1, int(os.environ.get("OSTEOAGE_WORKERS", str(max(1, CPU_COUNT // WORKER_THREADS)))))
+RESPAWN_DELAY_SEC = 1.0
+
+
+def run_worker(sock, idx):
+    """워커 프로세스 본체 (fork 이후 실행, 반환하지 않음)"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch.set_num_threads(WORKER_THREADS)
+    code = 0
+    try:
+        # 스레드 풀/커널 캐시는 프로세스별이므로 워밍업은 워커에서 수행 (가중치는 공유)
+        warmup_resources(WARMUP_BATCH_SIZES)
+        server = make_server(HOST, PORT, app, threaded=True, fd=sock.fileno())
+        print(f"[worker {idx}] pid={os.getpid()} threads={WORKER_THREADS} 요청 대기")
+        server.serve_forever()
+    except Exception as e:
+        print(f"[worker {idx}] 종료: {e}")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def spawn_worker(sock, idx):
+    """워커 1개 fork"""
+    pid = os.fork()
+    if pid == 0:
+        run_worker(sock, idx)
+    return pid
+
+
+def main():
+    if not hasattr(os, "fork"):
+        print("[WARN] fork 미지원 OS → 단일 프로세스로 실행")
+        torch.set_num_threads(WORKER_THREADS)
+        warmup_resources(WARMUP_BATCH_SIZES)
+        app.run(host=HOST, port=PORT, debug=False, threaded=True)
+        return
+
+    print(f"AI 서버 시작중... 모델 로드 후 워커 {NUM_WORKERS}개 fork (워커당 스레드 {WORKER_THREADS})")
+    load_resources()
+    # 이후 GC가 공유 객체 헤더를 건드려 페이지가 복사되지 않도록 현재 객체를 영구 세대로 이동
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.create_server((HOST, PORT), backlog=128)
+    sock.set_inheritable(True)
+
+    workers = {}
+    for idx in range(NUM_WORKERS):
+        workers[spawn_worker(sock, idx)] = idx
+
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    # 워커 감시: 비정상 종료 시 재생성
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        idx = workers.pop(pid, None)
+        if idx is None or stopping:
+            continue
+        print(f"[WARN] worker {idx} (pid={pid}) 종료 (status={status}) → 재시작")
+        time.sleep(RESPAWN_DELAY_SEC)
+        workers[spawn_worker(sock, idx)] = idx
+
+    sock.close()
+    print("AI 서버 종료")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""
+Fold 샤드 서버 (sharded 백엔드용 원격 노드)
+
+5-Fold 중 일부 fold만 로드하고, AI 서버(코디네이터)가 보낸 전처리 입력에 대해
+fold별 뼈나이 예측값을 돌려줌. 코디네이터는 OSTEOAGE_BACKEND=sharded,
+OSTEOAGE_SHARDS="1,2@host:9301;3,4,5@host:9302" 로 샤드를 지정.
+
+[사용 방법]
+    OSTEOAGE_SHARD_FOLDS=1,2 OSTEOAGE_SHARD_ADDRESS=0.0.0.0:9301 \\
+    OSTEOAGE_SHARD_AUTHKEY=<공유 비밀키> python shard_server.py
+
+[환경변수]
+    OSTEOAGE_SHARD_FOLDS: 담당 fold 번호 (1부터, 콤마 구분)
+    OSTEOAGE_SHARD_ADDRESS: 대기 주소 (host:port 또는 unix 소켓 경로)
+    OSTEOAGE_SHARD_AUTHKEY: 코디네이터와 공유하는 인증키 (필수)
+    OSTEOAGE_SHARD_THREADS: torch intra-op 스레드 수 (0이면 기본값)
+
+* 요청은 pickle로 전달되므로 인증키를 반드시 설정하고 내부망에서만 사용
+"""
+import os
+import sys
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "OsteoAge_Model", "Script")
+sys.path.insert(0, SCRIPT_DIR)
+
+from CPU_BoneAge_PAH_Compact import serve_fold_shard_from_env
+
+if __name__ == "__main__":
+    serve_fold_shard_from_env()